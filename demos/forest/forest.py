@@ -8,6 +8,9 @@ from pyglet.window import key
 
 from wasabisg.sphere import Sphere
 from wasabisg.plane import Plane
+from wasabisg.renderer import LightingAccumulationRenderer
+from wasabisg.tiledrenderer import TiledForwardRenderer
+from wasabisg.deferredrenderer import DeferredRenderer
 from wasabisg.scenegraph import Camera, Scene, v3, ModelNode
 from wasabisg.loaders.objloader import ObjFileLoader
 from wasabisg.model import Material
@@ -19,6 +22,14 @@ FPS = 60
 WIDTH = 800
 HEIGHT = 600
 
+# Renderers that can be selected with --renderer
+RENDERERS = {
+    'accumulation': LightingAccumulationRenderer,
+    'tiled': TiledForwardRenderer,
+    'deferred': DeferredRenderer,
+}
+renderer = LightingAccumulationRenderer
+
 
 scene = None
 tree_model = None
@@ -32,6 +43,7 @@ def load():
     # Scene
     scene = Scene(
         ambient=(0.05, 0.05, 0.05, 1.0),
+        renderer=renderer,
         #renderer=FallbackRenderer()
     )
 
@@ -119,7 +131,15 @@ if __name__ == '__main__':
         metavar='FILE',
         help='Write screenshot to FILE'
     )
+    parser.add_option(
+        '-r', '--renderer',
+        type='choice',
+        choices=sorted(RENDERERS),
+        default='accumulation',
+        help='Render with RENDERER (%s)' % ', '.join(sorted(RENDERERS))
+    )
     options, _ = parser.parse_args()
+    renderer = RENDERERS[options.renderer]
 
     window = pyglet.window.Window(
         width=WIDTH,
@@ -6,6 +6,9 @@ from euclid import Point3
 from wasabisg.loaders.objloader import ObjFileLoader
 from wasabisg.model import Model, Material
 from wasabisg.lighting import Light
+from wasabisg.renderer import LightingAccumulationRenderer
+from wasabisg.tiledrenderer import TiledForwardRenderer
+from wasabisg.deferredrenderer import DeferredRenderer
 from wasabisg.scenegraph import Scene, Camera, v3, ModelNode
 
 
@@ -13,6 +16,14 @@ FPS = 60
 WIDTH = 800
 HEIGHT = 600
 
+# Renderers that can be selected with --renderer
+RENDERERS = {
+    'accumulation': LightingAccumulationRenderer,
+    'tiled': TiledForwardRenderer,
+    'deferred': DeferredRenderer,
+}
+renderer = LightingAccumulationRenderer
+
 # Models
 robot_model = None
 
@@ -49,6 +60,7 @@ def init_scene():
     # Create a scene
     scene = Scene(
         ambient=(0.05, 0.05, 0.05, 1.0),
+        renderer=renderer,
     )
 
     light = Light(
@@ -108,7 +120,15 @@ if __name__ == '__main__':
         metavar='FILE',
         help='Write screenshot to FILE'
     )
+    parser.add_option(
+        '-r', '--renderer',
+        type='choice',
+        choices=sorted(RENDERERS),
+        default='accumulation',
+        help='Render with RENDERER (%s)' % ', '.join(sorted(RENDERERS))
+    )
     options, _ = parser.parse_args()
+    renderer = RENDERERS[options.renderer]
 
     window = pyglet.window.Window(
         width=WIDTH,
@@ -14,6 +14,7 @@ setup(
         'PyOpenGL==3.0.2',
         'pyglet>=1.2alpha1',
         'euclid>=0.1',
+        'numpy>=1.9',
     ],
     extras_require={
         'particles': [
@@ -0,0 +1,94 @@
+import time
+import random
+from wasabisg.model import AnimatedModel
+from wasabisg.animation import AnimationClock
+
+
+def make_model():
+    return AnimatedModel(
+        [None] * 10,
+        sequences={'walk': [0, 1, 2, 3], 'turn': [4, 5, 6], 'idle': [9]},
+        next={'turn': 'walk'},
+        framerate=10
+    )
+
+
+def state(inst):
+    return inst.playing, round(inst.t, 6), inst.currentframe
+
+
+def test_clock_matches_instances():
+    """The clock advances instances as they would advance themselves."""
+    model = make_model()
+    rng = random.Random(1)
+    own = [model.get_instance() for i in xrange(20)]
+    clocked = [model.get_instance() for i in xrange(20)]
+    clock = AnimationClock(capacity=4)
+    for a, b in zip(own, clocked):
+        name = rng.choice(['walk', 'turn', 'idle', 'all'])
+        a.play(name)
+        b.play(name)
+        clock.add(b)
+    assert len(clock) == 20
+    for i in xrange(50):
+        dt = rng.uniform(0, 0.15)
+        for a in own:
+            a.update(dt)
+        clock.tick(dt)
+        for a, b in zip(own, clocked):
+            b.update(dt)  # does nothing
+            if a.t:
+                assert state(a) == state(b)
+            else:
+                # A restarted instance shows its first frame straight away
+                assert (a.playing, a.t) == (b.playing, b.t)
+                assert b.currentframe == b.anim[0]
+
+
+def test_clock_next_sequence():
+    """Instances move on to the next sequence in bulk."""
+    model = make_model()
+    clock = AnimationClock()
+    insts = [model.get_instance() for i in xrange(3)]
+    for inst in insts:
+        clock.add(inst)
+        inst.play('turn')
+    clock.tick(0.35)
+    assert [i.playing for i in insts] == ['walk'] * 3
+    assert [i.currentframe for i in insts] == [0] * 3
+    clock.tick(0.15)
+    assert [i.currentframe for i in insts] == [1] * 3
+
+
+def test_clock_remove():
+    """Removed instances keep their state and advance themselves."""
+    model = make_model()
+    clock = AnimationClock()
+    inst = model.get_instance()
+    inst.play('walk')
+    clock.add(inst)
+    clock.tick(0.25)
+    clock.remove(inst)
+    assert inst.clock is None
+    assert state(inst) == ('walk', 2.5, 2)
+    inst.update(0.1)
+    assert inst.currentframe == 3
+    assert len(clock) == 0
+
+    # The slot is reused
+    other = model.get_instance()
+    clock.add(other)
+    assert other.slot == 0
+
+
+def test_clock_speed():
+    """Advancing thousands of instances takes well under a millisecond."""
+    model = make_model()
+    clock = AnimationClock()
+    for i in xrange(5000):
+        clock.add(model.get_instance())
+    clock.tick(0.01)
+    start = time.time()
+    for i in xrange(100):
+        clock.tick(0.01)
+    assert (time.time() - start) / 100 < 0.001
@@ -0,0 +1,111 @@
+import numpy as np
+from OpenGL.GL import GL_TRIANGLES
+from wasabisg.model import Model, Mesh, Material, TextureLoader
+from wasabisg.atlas import TextureAtlas
+
+
+class FakeImage(object):
+    """A solid-coloured image that can be read without OpenGL."""
+    def __init__(self, size, value):
+        self.width = self.height = size
+        self.value = value
+
+    def get_image_data(self):
+        return self
+
+    def get_data(self, format, pitch):
+        return chr(self.value) * (self.width * self.height * 4)
+
+
+class FakeTextureLoader(TextureLoader):
+    sizes = {'a.png': 16, 'b.png': 16, 'big.png': 512}
+
+    def load_image(self, name):
+        return FakeImage(self.sizes[name], ord(name[0]))
+
+
+def quad_mesh(material, uvs=(0, 0, 1, 0, 1, 1)):
+    return Mesh(
+        mode=GL_TRIANGLES,
+        vertices=[0, 0, 0, 1, 0, 0, 1, 1, 0],
+        normals=[0, 0, 1] * 3,
+        texcoords=list(uvs),
+        indices=[0, 1, 2],
+        material=material
+    )
+
+
+def make_atlas():
+    return TextureAtlas(
+        page_size=64, max_size=32, padding=2, loader=FakeTextureLoader()
+    )
+
+
+def test_small_textures_merged():
+    """Meshes with different small textures are merged into one mesh."""
+    a = Material(name='a', Kd=[1, 1, 1], map_Kd='a.png')
+    b = Material(name='b', Kd=[1, 1, 1], map_Kd='b.png')
+    model = Model(meshes=[quad_mesh(a), quad_mesh(b)])
+    atlas = make_atlas()
+    assert atlas.add_model(model)
+
+    assert len(model.meshes) == 1
+    mesh = model.meshes[0]
+    assert mesh.material['map_Kd'] == '<atlas 0>'
+    assert len(mesh.indices) == 6
+
+    # Each texture's UVs map into its own region of the page
+    uvs = np.array(mesh.texcoords).reshape(-1, 2) * 64
+    page = atlas.pages[0].pixels
+    for uv, value in zip((uvs[:3], uvs[3:]), (ord('a'), ord('b'))):
+        (x0, y0), (x1, y1) = uv.min(axis=0), uv.max(axis=0)
+        assert (x1 - x0, y1 - y0) == (16, 16)
+        assert (page[int(y0):int(y1), int(x0):int(x1)] == value).all()
+
+
+def test_unsuitable_textures_skipped():
+    """Large or repeating textures are left alone."""
+    big = Material(name='big', map_Kd='big.png')
+    tiled = Material(name='tiled', map_Kd='a.png')
+    meshes = [quad_mesh(big), quad_mesh(tiled, uvs=(0, 0, 2, 0, 2, 2))]
+    model = Model(meshes=list(meshes))
+    assert not make_atlas().add_model(model)
+    assert model.meshes == meshes
+    assert meshes[1].texcoords == [0, 0, 2, 0, 2, 2]
+
+
+def test_different_materials_not_merged():
+    """Materials that differ in more than their texture stay separate."""
+    a = Material(name='a', Kd=[1, 0, 0], map_Kd='a.png')
+    b = Material(name='b', Kd=[0, 1, 0], map_Kd='b.png')
+    model = Model(meshes=[quad_mesh(a), quad_mesh(b)])
+    make_atlas().add_model(model)
+    assert len(model.meshes) == 2
+    assert model.meshes[0].material is not model.meshes[1].material
+
+
+class FakeTexture(object):
+    """Records images blitted into it, in place of an OpenGL texture."""
+    def __init__(self):
+        self.blits = []
+
+    def blit_into(self, source, x, y, z):
+        self.blits.append((source, x, y, z))
+
+    def delete(self):
+        raise AssertionError("Page textures must not be deleted")
+
+
+def test_page_updated_in_place():
+    """Uploading a page again updates its texture rather than replacing it."""
+    atlas = make_atlas()
+    mtl = Material(name='a', map_Kd='a.png')
+    atlas.add_model(Model([quad_mesh(mtl)]))
+    page = atlas.pages[0]
+    tex = page.texture = FakeTexture()
+    page.dirty = True
+    atlas.upload()
+    assert page.texture is tex
+    assert len(tex.blits) == 1
+    assert page.materials[0]['tex_map_Kd'] is tex
+    assert not page.dirty
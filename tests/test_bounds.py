@@ -0,0 +1,110 @@
+import math
+from euclid import Matrix4, Vector3
+from wasabisg.bounds import BoundingBox, Frustum, union_bounds
+
+
+def box_eq(a, b):
+    """Return True if bounding boxes a and b are approximately equal."""
+    return all(
+        abs(x - y) < 1e-6
+        for x, y in zip(a.min + a.max, b.min + b.max)
+    )
+
+
+def test_from_vertices():
+    """We can compute the bounds of a flat vertex list."""
+    box = BoundingBox.from_vertices([0, 1, 2, -1, 5, 0, 3, 2, 1])
+    assert box == BoundingBox((-1, 1, 0), (3, 5, 2))
+
+
+def test_union():
+    """The union of boxes contains all of them."""
+    a = BoundingBox((0, 0, 0), (1, 1, 1))
+    b = BoundingBox((-1, 0.5, 0), (0.5, 2, 0.5))
+    assert union_bounds([a, b]) == BoundingBox((-1, 0, 0), (1, 2, 1))
+
+
+def test_union_unbounded():
+    """If any box is unbounded the union is unbounded."""
+    a = BoundingBox((0, 0, 0), (1, 1, 1))
+    assert union_bounds([a, None]) is None
+
+
+def test_transform_translate():
+    """We can translate a bounding box."""
+    box = BoundingBox((-1, -1, -1), (1, 1, 1))
+    m = Matrix4.new_translate(10, 0, -5)
+    assert box_eq(box.transformed(m), BoundingBox((9, -1, -6), (11, 1, -4)))
+
+
+def test_transform_rotate():
+    """Rotating a box by 45 degrees grows its axis-aligned bounds."""
+    box = BoundingBox((-1, 0, -1), (1, 1, 1))
+    m = Matrix4.new_rotate_axis(math.pi / 4, Vector3(0, 1, 0))
+    r = math.sqrt(2)
+    assert box_eq(box.transformed(m), BoundingBox((-r, 0, -r), (r, 1, r)))
+
+
+def camera_frustum():
+    """A camera at (0, 0, 10) looking towards the origin."""
+    return Frustum.perspective(
+        pos=(0, 0, 10),
+        look_at=(0, 0, 0),
+        fov=90,
+        aspect=1.0,
+        near=1.0,
+        far=100.0
+    )
+
+
+def test_frustum_in_front():
+    """A box in front of the camera is visible."""
+    box = BoundingBox((-1, -1, -1), (1, 1, 1))
+    assert camera_frustum().intersects_box(box)
+
+
+def test_frustum_behind():
+    """A box behind the camera is culled."""
+    box = BoundingBox((-1, -1, 15), (1, 1, 17))
+    assert not camera_frustum().intersects_box(box)
+
+
+def test_frustum_beside():
+    """A box outside the field of view is culled."""
+    box = BoundingBox((20, -1, -1), (22, 1, 1))
+    assert not camera_frustum().intersects_box(box)
+
+
+def test_frustum_beyond_far():
+    """A box beyond the far plane is culled."""
+    box = BoundingBox((-1, -1, -200), (1, 1, -195))
+    assert not camera_frustum().intersects_box(box)
+
+
+def test_frustum_straddling():
+    """A box partly inside the field of view is visible."""
+    box = BoundingBox((9, -1, -1), (12, 1, 1))
+    assert camera_frustum().intersects_box(box)
+
+
+def test_orthographic():
+    """An orthographic frustum is a box around the view axis."""
+    f = Frustum.orthographic(
+        (0, 0, 10), (0, 0, 0),
+        -5, 5, -5, 5, 1.0, 100.0
+    )
+    assert f.intersects_box(BoundingBox((4, 4, 0), (6, 6, 1)))
+    assert not f.intersects_box(BoundingBox((6, 0, 0), (7, 1, 1)))
+
+
+def test_frustum_from_matrix():
+    """Planes extracted from a view-projection matrix match the camera's."""
+    view = Matrix4.new_translate(0, 0, -10)
+    projection = Matrix4.new_perspective(math.radians(90), 1.0, 1.0, 100.0)
+    m = projection * view
+    f = Frustum.from_matrix(
+        [[m[4 * c + r] for c in range(4)] for r in range(4)]
+    )
+    expected = camera_frustum()
+    for a, b in zip(sorted(f.planes), sorted(expected.planes)):
+        assert all(abs(x - y) < 1e-6 for x, y in zip(a, b))
@@ -47,3 +47,33 @@ def test_airborne():
     )
     vec_eq(project(point, camera), v3(0, 0.5 * root2, 0.5 * root2 - 20))
 
+
+
+def test_matrices_cached():
+    """Matrices are reused until the camera changes."""
+    camera = Camera(pos=v3(0, 0, 20))
+    view = camera.get_view_matrix()
+    frustum = camera.get_frustum()
+    assert camera.get_view_matrix() is view
+    assert camera.get_frustum() is frustum
+    camera.pos = v3(20, 0, 0)
+    assert camera.get_frustum() is not frustum
+    vec_eq(project(point, camera), v3(0, 1, -18))
+
+
+def test_view_projection_array():
+    """The view-projection array maps the look-at point to the center."""
+    camera = Camera(pos=v3(3, 4, 5), look_at=v3(1, 1, 1))
+    x, y, z, w = camera.get_view_projection_array().dot([1, 1, 1, 1])
+    assert abs(x / w) < 1e-9 and abs(y / w) < 1e-9
+
+
+def test_set_aspect():
+    """Setting the aspect ratio widens the viewport and the projection."""
+    camera = Camera(width=800, height=600)
+    projection = camera.get_projection_array()
+    camera.aspect = 2.0
+    assert camera.viewport == (1200.0, 600)
+    assert camera.get_projection_array() is not projection
+    assert abs(camera.get_projection_array()[0, 0] * 2 -
+               projection[0, 0] * 4 / 3.0) < 1e-9
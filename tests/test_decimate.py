@@ -0,0 +1,69 @@
+import os
+import numpy as np
+from OpenGL.GL import GL_QUADS, GL_TRIANGLES
+from wasabisg.model import Model, Mesh, Material
+from wasabisg.decimate import decimate_mesh, decimate_model, triangles
+from wasabisg.loaders.objloader import ObjFileLoader
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def grid(n):
+    """A flat n x n grid of quads in the xz plane, of size 1."""
+    coords = np.linspace(0, 1, n + 1)
+    x, z = np.meshgrid(coords, coords)
+    vertices = np.column_stack([x.ravel(), np.zeros(x.size), z.ravel()])
+    i = np.arange((n + 1) * (n + 1)).reshape(n + 1, n + 1)
+    quads = np.column_stack([
+        i[:-1, :-1].ravel(), i[1:, :-1].ravel(),
+        i[1:, 1:].ravel(), i[:-1, 1:].ravel()
+    ])
+    return Mesh(
+        mode=GL_QUADS,
+        vertices=list(vertices.ravel()),
+        normals=[0, 1, 0] * len(vertices),
+        texcoords=list(np.column_stack([x.ravel(), z.ravel()]).ravel()),
+        indices=list(quads.ravel()),
+        material=Material(name='grid')
+    )
+
+
+def test_triangles():
+    """Quads are split into two triangles each."""
+    assert triangles(grid(2)).shape == (8, 3)
+
+
+def test_decimate_mesh():
+    """Clustering merges vertices but keeps the shape of the mesh."""
+    mesh = grid(16)
+    out = decimate_mesh(mesh, 0.25)
+    assert out.mode == GL_TRIANGLES
+    assert out.material is mesh.material
+    assert 0 < len(out.indices) // 3 < 16 * 16 * 2
+    assert len(out.data) < 17 * 17
+    assert out.indices.max() < len(out.data)
+    # No degenerate triangles remain
+    tris = out.indices.reshape(-1, 3)
+    assert (tris[:, 0] != tris[:, 1]).all()
+    assert np.allclose(out.data['normal'], [0, 1, 0])
+    b = out.get_bounds()
+    assert b.min[0] >= 0 and b.max[0] <= 1
+
+
+def test_decimate_model_ratio():
+    """decimate_model() keeps roughly the requested share of triangles."""
+    path = os.path.join(ROOT, 'demos', 'robots', 'robot.obj')
+    model = ObjFileLoader().load_obj(path)
+    before = sum(len(triangles(m)) for m in model.meshes)
+    low = decimate_model(model, 0.25)
+    after = sum(len(m.indices) // 3 for m in low.meshes)
+    assert 0 < after <= 0.35 * before
+    assert len(model.meshes[0].indices)
+
+
+def test_decimate_model_full_ratio():
+    """A ratio of 1 keeps every triangle."""
+    model = Model(meshes=[grid(4)])
+    out = decimate_model(model, 1.0)
+    assert len(out.meshes[0].indices) // 3 == 4 * 4 * 2
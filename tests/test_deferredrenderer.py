@@ -0,0 +1,23 @@
+import numpy as np
+from wasabisg.deferredrenderer import DeferredLightingPass
+
+
+class StubCamera(object):
+    """A camera with a fixed perspective projection."""
+    def get_projection_array(self):
+        n, f = 1.0, 100.0
+        return np.array([
+            [0.75, 0, 0, 0],
+            [0, 1, 0, 0],
+            [0, 0, (f + n) / (n - f), 2 * f * n / (n - f)],
+            [0, 0, -1, 0],
+        ])
+
+
+def test_inverse_projection():
+    """The inverse projection is uploaded in column-major order."""
+    camera = StubCamera()
+    values = DeferredLightingPass.inverse_projection(camera)
+    assert len(values) == 16
+    inv = np.array(values).reshape(4, 4).T
+    assert np.allclose(inv.dot(camera.get_projection_array()), np.identity(4))
@@ -24,6 +24,9 @@ except ImportError:
 # Root directory
 ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
+# Renderers whose output should match LightingAccumulationRenderer
+COMPARED_RENDERERS = ['tiled', 'deferred']
+
 
 def rmsdiff(im1, im2):
     "Calculate the root-mean-square difference between two images"
@@ -53,11 +56,18 @@ class RegressionTest(object):
     def tearDown(self):
         os.chdir(self.cwd)
 
-    def runTest(self):
+    def screenshot(self, filename, *args):
+        """Run the demo, writing a screenshot of its first frame to filename.
+
+        Any args are passed as extra command line arguments to the demo.
+
+        """
         script = '%s.py' % self.DEMO
         if not os.path.exists(script):
             self.fail('Script %s does not exist' % script)
-        proc = subprocess.Popen(['python', script, '-s', 'output.png'])
+        if os.path.exists(filename):
+            os.unlink(filename)
+        proc = subprocess.Popen(['python', script, '-s', filename] + list(args))
         for _ in xrange(40):
             if proc.poll():
                 break
@@ -67,8 +77,16 @@ class RegressionTest(object):
             self.fail('Failed to write screenshot after 2s')
         if proc.returncode:
             self.fail('Exited with code %d' % proc.returncode)
-        elif not os.path.exists('output.png'):
+        elif not os.path.exists(filename):
             self.fail('Failed to write screenshot')
+        return Image.open(filename)
+
+    def assertSimilar(self, im1, im2, msg):
+        rms = rmsdiff(im1, im2)
+        self.assertLess(rms, 10.0, msg=msg % rms)
+
+    def runTest(self):
+        output = self.screenshot('output.png')
 
         if not os.path.exists('reference.png'):
             raise unittest.SkipTest(
@@ -78,13 +96,29 @@ class RegressionTest(object):
                 )
             )
 
-        rms = rmsdiff(
-            Image.open('output.png'),
+        self.assertSimilar(
+            output,
             Image.open('reference.png'),
+            "Output differs from reference image (rms = %0.1f)"
         )
-        self.assertLess(
-            rms, 10.0,
-            msg="Output differs from reference image (rms = %0.1f)" % rms
+
+
+class RendererComparisonTest(RegressionTest):
+    """Check that a renderer draws a demo like LightingAccumulationRenderer."""
+    RENDERER = None
+
+    def runTest(self):
+        expected = self.screenshot(
+            'output-accumulation.png', '-r', 'accumulation'
+        )
+        output = self.screenshot(
+            'output-%s.png' % self.RENDERER, '-r', self.RENDERER
+        )
+        self.assertSimilar(
+            output,
+            expected,
+            "Output of %s renderer differs from accumulation renderer "
+            "(rms = %%0.1f)" % self.RENDERER
         )
 
 
@@ -96,5 +130,14 @@ def load():
         cls = type(clsname, bases, {'DEMO': d})
         globals()[clsname] = cls
 
+        for r in COMPARED_RENDERERS:
+            clsname = '%s_%s_RendererComparisonTest' % (d, r)
+            cls = type(
+                clsname,
+                (RendererComparisonTest, unittest.TestCase),
+                {'DEMO': d, 'RENDERER': r}
+            )
+            globals()[clsname] = cls
+
 
 load()
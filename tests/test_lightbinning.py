@@ -0,0 +1,76 @@
+import math
+import numpy as np
+from euclid import Matrix4
+from wasabisg.lightbinning import (
+    euclid_to_array, light_screen_rects, bin_lights
+)
+
+
+PROJECTION = euclid_to_array(
+    Matrix4.new_perspective(math.radians(60), 1.0, 1.0, 100.0)
+)
+
+
+def test_euclid_to_array():
+    """Converted matrices transform column vectors."""
+    m = euclid_to_array(Matrix4.new_translate(1, 2, 3))
+    assert np.allclose(m.dot([0, 0, 0, 1]), [1, 2, 3, 1])
+
+
+def test_rect_contains_sphere():
+    """A light's rectangle contains points on its sphere."""
+    pos = np.array([[3.0, -2.0, -20.0]])
+    rects, visible = light_screen_rects(pos, [4.0], PROJECTION, 1.0, 100.0)
+    assert visible.all()
+    xmin, ymin, xmax, ymax = rects[0]
+    for d in [(4, 0, 0), (-4, 0, 0), (0, 4, 0), (0, -4, 0), (0, 0, 4)]:
+        p = np.append(pos[0] + d, 1.0)
+        clip = PROJECTION.dot(p)
+        x, y = clip[:2] / clip[3]
+        assert xmin <= x <= xmax
+        assert ymin <= y <= ymax
+
+
+def test_invisible_lights():
+    """Lights behind the camera or off screen are not visible."""
+    pos = np.array([
+        [0.0, 0.0, 20.0],
+        [500.0, 0.0, -20.0],
+        [0.0, 0.0, -500.0],
+    ])
+    rects, visible = light_screen_rects(
+        pos, [5.0, 5.0, 5.0], PROJECTION, 1.0, 100.0
+    )
+    assert not visible.any()
+
+
+def test_near_and_infinite_lights_cover_screen():
+    """Lights around the camera, or that reach everywhere, cover the screen."""
+    pos = np.array([[0.0, 0.0, 0.0], [50.0, 0.0, -20.0]])
+    rects, visible = light_screen_rects(
+        pos, [5.0, float('inf')], PROJECTION, 1.0, 100.0
+    )
+    assert visible.all()
+    assert (rects == [-1, -1, 1, 1]).all()
+
+
+def test_bin_lights():
+    """Each tile lists the lights that overlap it."""
+    rects = np.array([
+        [-1.0, -1.0, 1.0, 1.0],
+        [-1.0, -1.0, -0.9, -0.9],
+        [0.5, 0.5, 1.0, 1.0],
+        [-1.0, -1.0, 1.0, 1.0],
+    ])
+    visible = np.array([True, True, True, False])
+    tiles, indices, grid = bin_lights(rects, visible, (64, 32), 16)
+    assert grid == (4, 2)
+
+    def lights(tx, ty):
+        offset, count = tiles[ty * grid[0] + tx]
+        return list(indices[offset:offset + count])
+
+    assert lights(0, 0) == [0, 1]
+    assert lights(1, 0) == [0]
+    assert lights(3, 1) == [0, 2]
+    assert tiles[:, 1].sum() == len(indices)
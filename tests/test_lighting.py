@@ -0,0 +1,52 @@
+import numpy as np
+from euclid import Matrix4, Vector3
+from wasabisg.lighting import Light, Sunlight, LightArray
+from wasabisg.lightbinning import euclid_to_array
+
+
+def test_light_array_tracks_changes():
+    """Assigning to a light's properties updates the array."""
+    l = Light(pos=(1, 2, 3), intensity=2, falloff=1)
+    array = LightArray([l])
+    idx = array.index([l])
+    assert list(array.positions[idx[0]]) == [1, 2, 3, 1]
+    l.pos = (4, 5, 6)
+    l.intensity = 3
+    array.update()
+    assert list(array.positions[idx[0]]) == [4, 5, 6, 1]
+    assert array.intensities[idx[0]] == 3
+    assert np.isclose(array.radii[idx[0]], l.get_radius())
+
+
+def test_light_array_remove():
+    """Removing a light keeps the other lights' rows correct."""
+    lights = [Light(pos=(i, 0, 0)) for i in range(5)]
+    array = LightArray(lights)
+    array.update()
+    array.remove(lights[1])
+    assert len(array) == 4
+    assert lights[1].watchers == []
+    idx = array.index([lights[4], lights[0]])
+    assert list(array.positions[idx, 0]) == [4, 0]
+
+
+def test_sunlight_is_directional():
+    """Sunlights have w = 0 and infinite radius."""
+    sun = Sunlight(direction=(0, 0, 2))
+    array = LightArray([sun])
+    array.update()
+    assert list(array.positions[0]) == [0, 0, 1, 0]
+    assert np.isinf(array.radii[0])
+
+
+def test_view_positions_match_euclid():
+    """Lights are transformed to view space as euclid would."""
+    view = Matrix4.new_translate(1, 2, 3) * Matrix4.new_rotate_axis(
+        0.5, Vector3(0, 1, 0)
+    )
+    l = Light(pos=(3, 4, 5))
+    sun = Sunlight(direction=(1, 1, 0))
+    array = LightArray([l, sun])
+    pos = array.view_positions(euclid_to_array(view))
+    assert np.allclose(pos[0, :3], tuple(view * l.pos))
+    assert np.allclose(pos[1, :3], tuple(view * sun.direction))
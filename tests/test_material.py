@@ -0,0 +1,127 @@
+from wasabisg.model import Material, TextureLoader
+
+
+def test_packed_cache_cleared_on_set():
+    """Changing a material discards values packed from it."""
+    m = Material(Kd=(1, 0, 0))
+    m.packed['shader'] = 'packed values'
+    assert m.packed == {'shader': 'packed values'}
+    m['Kd'] = (0, 1, 0)
+    assert m.packed == {}
+
+
+def test_packed_cache_cleared_on_change():
+    """Every way of modifying a material discards values packed from it."""
+    changes = [
+        lambda m: m.update(Ns=10),
+        lambda m: m.__delitem__('Kd'),
+        lambda m: m.pop('Kd'),
+        lambda m: m.popitem(),
+        lambda m: m.setdefault('Ns', 10),
+        lambda m: m.clear(),
+    ]
+    for change in changes:
+        m = Material(Kd=(1, 0, 0))
+        m.packed['shader'] = 'packed values'
+        change(m)
+        assert m.packed == {}
+
+
+def test_copy_has_own_cache():
+    """Copies of a material do not share packed values."""
+    m = Material(Kd=(1, 0, 0))
+    m.packed['shader'] = 'packed values'
+    assert m.copy().packed == {}
+
+
+class FakeTexture(object):
+    deleted = False
+
+    def __init__(self, size):
+        self.width = self.height = size
+
+    def delete(self):
+        self.deleted = True
+
+
+class FakeImage(object):
+    def __init__(self, size):
+        self.size = size
+
+    def get_mipmapped_texture(self):
+        return FakeTexture(self.size)
+
+
+class FakeTextureLoader(TextureLoader):
+    """A TextureLoader that loads fake 16x16 images without OpenGL."""
+    def load_image(self, name):
+        return FakeImage(16)
+
+
+TEX_BYTES = 16 * 16 * 4 * 4 // 3
+
+
+def test_textures_shared():
+    """Materials using the same image share a texture."""
+    loader = FakeTextureLoader()
+    a = Material(map_Kd='a.png')
+    b = Material(map_Kd='a.png')
+    a.loader = b.loader = loader
+    assert a.get_texture('map_Kd') is b.get_texture('map_Kd')
+    assert (loader.hits, loader.misses) == (1, 1)
+    assert loader.vram == TEX_BYTES
+
+
+def test_textures_evicted():
+    """The least recently used textures are evicted to fit the budget."""
+    loader = FakeTextureLoader(budget=2 * TEX_BYTES)
+    mats = [Material(map_Kd='%d.png' % i) for i in range(3)]
+    for m in mats:
+        m.loader = loader
+    texa = mats[0].get_texture('map_Kd')
+    mats[1].get_texture('map_Kd')
+    mats[0].get_texture('map_Kd')
+    mats[0].packed['shader'] = 'packed values'
+    mats[2].get_texture('map_Kd')
+
+    # The texture for 1.png was least recently requested
+    assert loader.evictions == 1
+    assert loader.vram == 2 * TEX_BYTES
+    assert 'tex_map_Kd' not in mats[1]
+    assert mats[0]['tex_map_Kd'] is texa
+
+    loader.budget = TEX_BYTES
+    loader.evict()
+    assert texa.deleted
+    assert 'tex_map_Kd' not in mats[0]
+    assert mats[0].packed == {}
+    assert mats[0].get_texture('map_Kd') is not texa
+
+
+def test_copies_forget_evicted_textures():
+    """Copies of a material drop its textures when they are evicted."""
+    loader = FakeTextureLoader()
+    m = Material(map_Kd='a.png')
+    m.loader = loader
+    tex = m.get_texture('map_Kd')
+    copy = m.copy()
+    copy.packed['shader'] = 'packed values'
+    assert copy['tex_map_Kd'] is tex
+    loader.clear()
+    assert 'tex_map_Kd' not in copy
+    assert copy.packed == {}
+
+
+def test_touch_textures():
+    """Drawing with a material keeps its textures from being evicted."""
+    loader = FakeTextureLoader(budget=2 * TEX_BYTES)
+    a, b = mats = [Material(map_Kd='%d.png' % i) for i in range(2)]
+    for m in mats:
+        m.loader = loader
+        m.get_texture('map_Kd')
+    a.touch_textures()
+    c = Material(map_Kd='c.png')
+    c.loader = loader
+    c.get_texture('map_Kd')
+    assert 'tex_map_Kd' in a
+    assert 'tex_map_Kd' not in b
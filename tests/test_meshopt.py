@@ -0,0 +1,60 @@
+import os
+import numpy as np
+from OpenGL.GL import GL_TRIANGLES
+from wasabisg.plane import Plane
+from wasabisg.decimate import triangles
+from wasabisg.meshopt import (
+    acmr, optimise_mesh, optimise_meshes, reorder_vertices
+)
+from wasabisg.loaders.objloader import ObjFileLoader
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def test_acmr():
+    """ACMR counts cache misses per triangle."""
+    assert acmr([0, 1, 2, 0, 1, 2]) == 1.5
+    assert acmr([0, 1, 2, 3, 4, 5]) == 3.0
+    assert acmr([0, 1, 2, 2, 1, 0], cache_size=2) == 2.0
+
+
+def test_plane_acmr():
+    """Plane cells are drawn in a cache-friendly order."""
+    assert acmr(Plane(divisions=64).indices) < 0.6
+
+
+def test_reorder_vertices():
+    """Vertices are sorted by first use, and unused ones dropped."""
+    data = np.arange(5, dtype=np.float32)
+    out, indices = reorder_vertices(data, np.array([3, 1, 3, 0]))
+    assert list(out) == [3, 1, 0]
+    assert list(indices) == [0, 1, 0, 2]
+
+
+def test_optimise_mesh():
+    """Optimising keeps the same triangles with the same vertices."""
+    path = os.path.join(ROOT, 'demos', 'robots', 'robot.obj')
+    model = ObjFileLoader().load_obj(path)
+    mesh = model.meshes[0]
+    out = optimise_mesh(mesh)
+    assert out.mode == GL_TRIANGLES
+    positions = np.asarray(mesh.vertices, dtype=np.float32).reshape(-1, 3)
+    before = set(
+        tuple(map(tuple, positions[t])) for t in triangles(mesh)
+    )
+    p = out.data['position']
+    after = set(
+        tuple(map(tuple, p[t])) for t in out.indices.reshape(-1, 3)
+    )
+    assert len(after) == len(before)
+
+
+def test_optimise_meshes():
+    """Optimisation reduces the ACMR of a loaded model."""
+    path = os.path.join(ROOT, 'demos', 'robots', 'robot.obj')
+    model = ObjFileLoader().load_obj(path)
+    ntris = sum(len(triangles(m)) for m in model.meshes)
+    before, after = optimise_meshes(model)
+    assert after < before
+    assert sum(len(m.indices) // 3 for m in model.meshes) == ntris
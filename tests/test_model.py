@@ -0,0 +1,192 @@
+import os
+import math
+import numpy as np
+from euclid import Matrix4, Point3, Vector3
+from OpenGL.GL import GL_TRIANGLES
+from wasabisg.model import (
+    ArrayMesh, Mesh, Material, index_dtype, merge_array_meshes
+)
+from wasabisg.loaders.objloader import ObjFileLoader
+from wasabisg.loaders.modelcache import ModelCache
+from wasabisg.lightbinning import euclid_to_array
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def triangle():
+    return Mesh(
+        mode=GL_TRIANGLES,
+        vertices=[0, 0, 0, 1, 0, 0, 0, 2, 0],
+        normals=[0, 0, 1] * 3,
+        texcoords=[0, 0, 1, 0, 0, 1],
+        indices=[0, 1, 2],
+        material=Material(name='m')
+    )
+
+
+def test_index_dtype():
+    """Indices are 16 bit where possible."""
+    assert index_dtype(65536) == np.uint16
+    assert index_dtype(65537) == np.uint32
+
+
+def test_array_mesh_matches_mesh():
+    """An ArrayMesh holds the same geometry as the Mesh it came from."""
+    mesh = triangle()
+    am = ArrayMesh.from_mesh(mesh)
+    assert am.data.dtype.itemsize == 32
+    assert am.indices.dtype == np.uint16
+    assert list(am.vertices) == mesh.vertices
+    assert list(am.normals) == mesh.normals
+    assert list(am.texcoords) == mesh.texcoords
+    assert am.get_bounds() == mesh.get_bounds()
+
+
+def test_array_mesh_inside_out():
+    """Turning an ArrayMesh inside out matches turning a Mesh inside out."""
+    mesh = triangle()
+    inv = ArrayMesh.from_mesh(mesh).inside_out()
+    expected = mesh.inside_out()
+    assert list(inv.indices) == expected.indices
+    assert list(inv.normals) == expected.normals
+
+
+def test_load_compact():
+    """The OBJ loader can produce ArrayMeshes."""
+    path = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+    model = ObjFileLoader().load_obj(path)
+    compact = ObjFileLoader(compact=True).load_obj(path)
+    assert len(model.meshes) == len(compact.meshes)
+    for m, c in zip(model.meshes, compact.meshes):
+        assert isinstance(c, ArrayMesh)
+        assert list(c.indices) == list(m.indices)
+        assert np.allclose(c.vertices, m.vertices)
+
+
+def mesh_data(mesh):
+    return (
+        mesh.name, mesh.mode, mesh.material, list(mesh.vertices),
+        list(mesh.normals), list(mesh.texcoords), list(mesh.indices)
+    )
+
+
+def test_fast_obj_parser_matches():
+    """The vectorised OBJ parser produces the same meshes as the slow one."""
+    path = os.path.join(ROOT, 'demos', 'robots', 'robot.obj')
+    data = open(path).read()
+    loader = ObjFileLoader()
+    fast = loader._parse_obj_fast(data, path, swapyz=True)
+    slow = loader._parse_obj(data.splitlines(), path, swapyz=True)
+    assert fast is not None
+    assert map(mesh_data, fast) == map(mesh_data, slow)
+
+
+def test_fast_obj_parser_falls_back():
+    """Files with irregular faces are left to the slow parser."""
+    data = '\n'.join([
+        'v 0 0 0', 'v 1 0 0', 'v 1 1 0', 'v 0 1 0',
+        'f 1 2 3', 'f 1 2 3 4',
+    ])
+    assert ObjFileLoader()._parse_obj_fast(data, 'test.obj') is None
+
+
+def test_model_cache(tmpdir):
+    """Models loaded from the cache match those parsed from the source."""
+    path = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+    cache = ModelCache(str(tmpdir))
+    ObjFileLoader(cache=cache).load_obj(path)
+    assert os.path.exists(cache.path_for(path))
+
+    for compact in (False, True):
+        expected = ObjFileLoader(compact=compact).load_obj(path)
+        loader = ObjFileLoader(compact=compact, cache=cache)
+        loader._parse_obj = loader._parse_obj_fast = None
+        model = loader.load_obj(path)
+        assert map(mesh_data, model.meshes) == map(mesh_data, expected.meshes)
+        assert isinstance(model.meshes[0], ArrayMesh) == compact
+
+
+def test_model_cache_invalidated(tmpdir):
+    """The cache is not used if the source has changed."""
+    path = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+    cache = ModelCache(str(tmpdir))
+    ObjFileLoader(cache=cache).load_obj(path)
+    header, _ = cache.read_header(cache.path_for(path))
+    assert cache.is_current(header, path, False)
+    assert not cache.is_current(header, path, True)
+    header['source']['size'] += 1
+    assert not cache.is_current(header, path, False)
+
+
+def test_corrupt_cache_ignored(tmpdir):
+    """A truncated compiled model is treated as missing."""
+    path = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+    cache = ModelCache(str(tmpdir))
+    loader = ObjFileLoader(cache=cache)
+    expected = loader.load_obj(path)
+    compiled = cache.path_for(path)
+    with open(compiled, 'r+b') as f:
+        f.truncate(os.path.getsize(compiled) // 2)
+    assert cache.load(path, loader) is None
+    model = ObjFileLoader(cache=cache).load_obj(path)
+    assert map(mesh_data, model.meshes) == map(mesh_data, expected.meshes)
+
+
+class ReadOnlyCache(ModelCache):
+    def save(self, filename, model, loader, swapyz=False):
+        raise IOError("Read-only file system")
+
+
+def test_unwritable_cache(tmpdir):
+    """Models still load if they cannot be saved to the cache."""
+    path = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+    model = ObjFileLoader(cache=ReadOnlyCache(str(tmpdir))).load_obj(path)
+    assert model.meshes
+
+
+def test_load_objs_in_parallel():
+    """Models loaded in worker processes match those loaded directly."""
+    paths = [
+        os.path.join(ROOT, 'demos', 'forest', 'tree.obj'),
+        os.path.join(ROOT, 'demos', 'robots', 'robot.obj'),
+    ]
+    for compact in (False, True):
+        loader = ObjFileLoader(compact=compact, processes=2)
+        models = loader.load_objs(paths)
+        for path, model in zip(paths, models):
+            expected = ObjFileLoader(compact=compact).load_obj(path)
+            assert model.name == path
+            assert (map(mesh_data, model.meshes) ==
+                    map(mesh_data, expected.meshes))
+        # Materials are shared between the models as for sequential loads
+        assert models[0].meshes[0].material is loader.mtl_loader.materials[
+            models[0].meshes[0].material['name']
+        ]
+
+
+def test_array_mesh_transformed():
+    """Transforming a mesh moves its vertices and rotates its normals."""
+    m = Matrix4.new_translate(1, 2, 3) * Matrix4.new_rotate_axis(
+        math.pi / 2, Vector3(1, 0, 0)
+    )
+    mesh = ArrayMesh.from_mesh(triangle())
+    t = mesh.transformed(euclid_to_array(m))
+    for v, tv in zip(mesh.data['position'], t.data['position']):
+        assert np.allclose(tv, tuple(m * Point3(*v)))
+    assert np.allclose(t.data['normal'], [(0, -1, 0)] * 3)
+    assert list(t.indices) == [0, 1, 2]
+
+    # Reflections reverse the winding order
+    mirrored = mesh.transformed(np.diag([-1, 1, 1, 1]))
+    assert list(mirrored.indices) == [2, 1, 0]
+
+
+def test_merge_array_meshes():
+    """Merged meshes index into the combined vertex data."""
+    a = ArrayMesh.from_mesh(triangle())
+    b = a.transformed(np.diag([1, 1, 2, 1]))
+    merged = merge_array_meshes([a, b])
+    assert len(merged.data) == 6
+    assert list(merged.indices) == [0, 1, 2, 3, 4, 5]
+    assert merged.indices.dtype == np.uint16
@@ -0,0 +1,89 @@
+import os
+import math
+import numpy as np
+from euclid import Matrix4
+from wasabisg.model import Model, AnimatedModel, ArrayMesh, compact_model
+from wasabisg.morph import MorphModel, MorphMesh
+from wasabisg.loaders.objloader import ObjFileLoader
+from wasabisg.lightbinning import euclid_to_array
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def robot_animation(num_frames=6):
+    """Make an animation by rotating the robot model a little each frame."""
+    path = os.path.join(ROOT, 'demos', 'robots', 'robot.obj')
+    model = compact_model(ObjFileLoader().load_obj(path))
+    frames = []
+    for i in xrange(num_frames):
+        m = euclid_to_array(Matrix4.new_rotatey(i * 0.1))
+        frames.append(
+            Model(meshes=[mesh.transformed(m) for mesh in model.meshes])
+        )
+    return AnimatedModel(frames, sequences={'spin': range(num_frames)})
+
+
+def test_morph_model_is_compact():
+    """Frames share indices and texcoords, and are quantised."""
+    anim = robot_animation()
+    morph = MorphModel.from_animated_model(anim)
+    assert morph.num_frames == 6
+    frame_bytes = sum(
+        m.data.nbytes + m.indices.nbytes
+        for f in anim.frames for m in f.meshes
+    )
+    assert morph.nbytes < 0.5 * frame_bytes
+
+
+def test_morph_frames_match():
+    """Decoded frames match the original frames closely."""
+    anim = robot_animation()
+    morph = MorphModel.from_animated_model(anim)
+    for i, frame in enumerate(anim.frames):
+        for mm, mesh in zip(morph.meshes, frame.meshes):
+            data = mm.frame(i)
+            assert np.allclose(data['position'], mesh.data['position'],
+                               atol=1e-3)
+            assert np.allclose(data['normal'], mesh.data['normal'],
+                               atol=0.02)
+
+
+def test_morph_blend():
+    """Blending interpolates between adjacent frames."""
+    anim = robot_animation()
+    for quantise in (False, True):
+        mesh = MorphModel.from_animated_model(anim, quantise).meshes[0]
+        mid = mesh.blend(1, 2, 0.5)['position']
+        expected = 0.5 * (
+            anim.frames[1].meshes[0].data['position'] +
+            anim.frames[2].meshes[0].data['position']
+        )
+        assert np.allclose(mid, expected, atol=1e-3)
+
+
+def test_morph_instance_frames():
+    """Instances blend between the frames either side of the time."""
+    morph = MorphModel.from_animated_model(robot_animation(), quantise=False)
+    inst = morph.get_instance()
+    inst.play('spin')
+    inst.update(2.5 / morph.framerate)
+    assert inst.frame_pair() == (2, 3, 0.5)
+    inst.update(3.0 / morph.framerate)
+    a, b, t = inst.frame_pair()
+    assert (a, b) == (5, 0)
+
+
+def test_morph_rejects_different_topology():
+    """Frames must have the same topology."""
+    anim = robot_animation(2)
+    mesh = anim.frames[1].meshes[0]
+    anim.frames[1].meshes[0] = ArrayMesh(
+        mesh.mode, mesh.data, mesh.indices[::-1].copy(), mesh.material
+    )
+    try:
+        MorphModel.from_animated_model(anim)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError")
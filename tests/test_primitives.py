@@ -0,0 +1,52 @@
+import numpy as np
+from euclid import Vector3
+from wasabisg.model import Material
+from wasabisg.sphere import Sphere
+from wasabisg.plane import Plane
+
+
+def test_sphere_shares_geometry():
+    """Spheres with the same parameters share arrays but not materials."""
+    a = Sphere(radius=2, material=Material(name='a'))
+    b = Sphere(radius=2, material=Material(name='b'))
+    assert a.data is b.data
+    assert a.indices is b.indices
+    assert a.material['name'] != b.material['name']
+    assert Sphere(radius=3).data is not a.data
+    assert Sphere(radius=2, inside=True).data is not a.data
+
+
+def test_sphere_geometry():
+    """Sphere vertices lie on the sphere, with outward normals."""
+    s = Sphere(radius=2, latitude_divisions=6, longitude_divisions=8)
+    assert len(s.data) == 7 * 9
+    assert len(s.indices) == 6 * 8 * 6
+    r = np.sqrt((s.data['position'] ** 2).sum(axis=1))
+    assert np.allclose(r, 2)
+    assert np.allclose(s.data['position'], s.data['normal'] * 2, atol=1e-6)
+
+
+def test_sphere_inside():
+    """Inside-out spheres have reversed normals and winding."""
+    out = Sphere(latitude_divisions=4, longitude_divisions=4)
+    inside = Sphere(inside=True, latitude_divisions=4, longitude_divisions=4)
+    assert np.allclose(inside.data['normal'], -out.data['normal'])
+    assert list(inside.indices[:3]) == list(out.indices[:3])[::-1]
+
+
+def test_shared_geometry_read_only():
+    """Shared arrays cannot be modified in place."""
+    p = Plane(divisions=2)
+    assert not p.data.flags.writeable
+    assert not p.indices.flags.writeable
+
+
+def test_plane_geometry():
+    """A Plane is a grid of squares perpendicular to its normal."""
+    p = Plane(normal=Vector3(1, 0, 0), size=4.0, divisions=4)
+    assert len(p.data) == 25
+    assert len(p.indices) == 6 * 16
+    assert np.allclose(p.data['position'][:, 0], 0)
+    assert np.allclose(abs(p.data['position'][:, 1:]).max(), 2)
+    assert np.allclose(p.data['normal'], [1, 0, 0])
+    assert p.data is Plane(normal=(1, 0, 0), size=4, divisions=4).data
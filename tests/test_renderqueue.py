@@ -0,0 +1,61 @@
+from euclid import Matrix4
+from wasabisg.renderqueue import RenderQueue
+
+
+class FakeMaterialGroup(object):
+    def __init__(self, texture):
+        self.material = {'tex_map_Kd': texture}
+
+
+class FakeMesh(object):
+    def __init__(self, group, name):
+        self.group = group
+        self.list = name
+        self.mode = None
+
+
+class FakeNode(object):
+    def __init__(self, meshes):
+        self.meshes = meshes
+
+    def enqueue(self, queue, matrix=None, group=None):
+        for m in self.meshes:
+            queue.add_mesh(m, Matrix4(), group)
+
+
+def drawn(queue):
+    queue.sort()
+    return [item[4] for item in queue.items]
+
+
+def test_sorted_by_texture_then_material():
+    """Meshes are grouped by texture, then by material."""
+    tex1, tex2 = object(), object()
+    mat1 = FakeMaterialGroup(tex1)
+    mat2 = FakeMaterialGroup(tex2)
+    mat3 = FakeMaterialGroup(tex1)
+    queue = RenderQueue([
+        FakeNode([FakeMesh(mat1, 'a1'), FakeMesh(mat2, 'a2')]),
+        FakeNode([FakeMesh(mat3, 'b1'), FakeMesh(mat2, 'b2')]),
+        FakeNode([FakeMesh(mat1, 'c1')]),
+    ])
+    assert drawn(queue) == ['a1', 'c1', 'b1', 'a2', 'b2']
+
+
+def test_sorted_by_group_first():
+    """Meshes in the same pyglet group are drawn together."""
+    mat = FakeMaterialGroup(None)
+    group = object()
+    queue = RenderQueue()
+    queue.add_mesh(FakeMesh(mat, 'a'), Matrix4(), group)
+    queue.add_mesh(FakeMesh(mat, 'b'), Matrix4())
+    queue.add_mesh(FakeMesh(mat, 'c'), Matrix4(), group)
+    assert drawn(queue) == ['b', 'a', 'c']
+
+
+def test_nodes_without_enqueue():
+    """Objects that cannot enqueue meshes are queued whole."""
+    node = object()
+    queue = RenderQueue([node])
+    assert len(queue) == 1
+    assert queue.items[0][-1] is node
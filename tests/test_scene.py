@@ -0,0 +1,93 @@
+from OpenGL.GL import GL_TRIANGLES
+from wasabisg.model import AnimatedModel, Model, Mesh, Material
+from wasabisg.scenegraph import Scene, ModelNode, Camera
+from wasabisg.spatial import LooseOctree
+from wasabisg.streaming import PendingModel
+
+
+class FakeRenderer(object):
+    """A renderer that prepares models without OpenGL."""
+    def prepare_model(self, model):
+        return model
+
+
+def make_model():
+    return AnimatedModel(
+        [None] * 4,
+        sequences={'walk': [0, 1, 2, 3]},
+        framerate=10
+    )
+
+
+class CountingNode(ModelNode):
+    """A node that does more than advance its model when updated."""
+    updates = 0
+
+    def update(self, dt):
+        super(CountingNode, self).update(dt)
+        self.updates += 1
+
+
+def test_animations_clocked():
+    """Plain ModelNodes are advanced by the scene's clock."""
+    scene = Scene(renderer=FakeRenderer())
+    node = ModelNode(make_model())
+    scene.add(node)
+    assert node.model_instance.clock is scene.clock
+    assert node not in scene.updated
+
+
+def test_overridden_update_called():
+    """Nodes that override update() are still updated individually."""
+    scene = Scene(renderer=FakeRenderer())
+    node = CountingNode(make_model())
+    node.model_instance.play('walk')
+    scene.add(node)
+    scene.update(0.15)
+    assert node.updates == 1
+    assert node.model_instance.currentframe == 1
+
+
+def test_remove_swapped_instance():
+    """Removing a node unclocks the instance it added, even if replaced."""
+    scene = Scene(renderer=FakeRenderer())
+    node = ModelNode(make_model())
+    scene.add(node)
+    instance = node.model_instance
+    node.model_instance = make_model().get_instance()
+    scene.remove(node)
+    assert instance.clock is None
+    assert len(scene.clock) == 0
+
+
+def test_loaded_nodes_indexed():
+    """Nodes added before their model has loaded are indexed once it has."""
+    scene = Scene(renderer=FakeRenderer(), index=LooseOctree)
+    pending = PendingModel('triangle')
+    node = ModelNode(pending)
+    scene.add(node)
+    assert node in scene.unindexed
+
+    pending.complete(Model([Mesh(
+        mode=GL_TRIANGLES,
+        vertices=[0, 0, 0, 1, 0, 0, 1, 1, 0],
+        normals=[0, 0, 1] * 3,
+        texcoords=[0, 0, 1, 0, 1, 1],
+        indices=[0, 1, 2],
+        material=Material(name='triangle')
+    )]))
+    assert scene.visible_objects(Camera()) == [node]
+    assert node in scene.index
+    assert node not in scene.unindexed
+    assert scene not in node.watchers
+
+
+def test_objects_snapshot():
+    """Modifying the objects list does not change the scene."""
+    scene = Scene(renderer=FakeRenderer(), culling=False)
+    node = ModelNode(make_model())
+    scene.add(node)
+    scene.objects.remove(node)
+    assert scene.objects == [node]
+    assert scene.visible_objects(Camera()) == [node]
+    assert scene.stats.drawn == 1
@@ -0,0 +1,137 @@
+import math
+import numpy as np
+from OpenGL.GL import GL_TRIANGLES
+from wasabisg.model import ArrayMesh, Material, VERTEX_DTYPE
+from wasabisg.skeletal import (
+    Skeleton, Clip, SkinnedMesh, SkinnedModel, quaternion_matrices,
+    pose_instances, joint_rows
+)
+
+
+def rotz(angle):
+    """A quaternion rotating by angle about the z axis."""
+    return [0, 0, math.sin(angle / 2), math.cos(angle / 2)]
+
+
+def arm():
+    """A two-joint arm along the x axis, bending at x = 1."""
+    inverse_bind = np.tile(np.identity(4), (2, 1, 1))
+    inverse_bind[1, 0, 3] = -1
+    skeleton = Skeleton([-1, 0], inverse_bind)
+    bend = Clip(
+        'bend',
+        times=[0, 1],
+        rotations=[[rotz(0), rotz(0)], [rotz(0), rotz(math.pi / 2)]],
+        translations=[[[0, 0, 0], [1, 0, 0]]] * 2,
+        loop=False
+    )
+    data = np.zeros(3, dtype=VERTEX_DTYPE)
+    data['position'] = [[0, 0, 0], [1, 0, 0], [2, 0, 0]]
+    data['normal'] = [0, 1, 0]
+    mesh = ArrayMesh(
+        mode=GL_TRIANGLES,
+        data=data,
+        indices=np.array([0, 1, 2], dtype=np.uint16),
+        material=Material(name='arm')
+    )
+    skinned = SkinnedMesh(
+        mesh,
+        joints=[[0, 0, 0, 0], [0, 1, 0, 0], [1, 0, 0, 0]],
+        weights=[[1, 0, 0, 0], [1, 1, 0, 0], [1, 0, 0, 0]]
+    )
+    return SkinnedModel(skeleton, [skinned], clips={'bend': bend})
+
+
+def test_quaternion_matrices():
+    """Quaternions convert to rotation matrices."""
+    m = quaternion_matrices([rotz(math.pi / 2)])[0]
+    assert np.allclose(np.dot(m, [1, 0, 0, 1]), [0, 1, 0, 1])
+
+
+def test_skeleton_requires_parents_first():
+    """Joints must come after their parents."""
+    try:
+        Skeleton([1, -1])
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Expected ValueError")
+
+
+def test_pose_accumulates_down_hierarchy():
+    """Each joint is transformed by its ancestors."""
+    skeleton = Skeleton([-1, 0, 1])
+    local = np.tile(np.identity(4), (1, 3, 1, 1))
+    local[0, :, 0, 3] = 1
+    world = skeleton.pose(local)
+    assert np.allclose(world[0, :, 0, 3], [1, 2, 3])
+
+
+def test_bind_pose_palette_is_identity():
+    """Posed as in the bind pose, the palette does not move vertices."""
+    model = arm()
+    inst = model.get_instance()
+    inst.play('bend')
+    assert np.allclose(inst.palette(), np.identity(4))
+    skinned = model.meshes[0].skin_vertices(inst.palette())
+    assert np.allclose(skinned['position'], model.meshes[0].mesh.data['position'])
+
+
+def test_clip_interpolates():
+    """Rotations are interpolated between keyframes."""
+    model = arm()
+    local = model.clips['bend'].sample([0.5])
+    expected = quaternion_matrices([rotz(math.pi / 4)])[0]
+    assert np.allclose(local[0, 1, :3, :3], expected[:3, :3], atol=1e-6)
+    assert np.allclose(local[0, 1, :3, 3], [1, 0, 0])
+
+
+def test_skinning_bends_arm():
+    """Vertices follow their joints, blended by weight."""
+    model = arm()
+    inst = model.get_instance()
+    inst.play('bend')
+    inst.update(1.0)
+    data = model.meshes[0].skin_vertices(inst.palette())
+    assert np.allclose(data['position'][2], [1, 1, 0], atol=1e-6)
+    assert np.allclose(data['position'][1], [1, 0, 0], atol=1e-6)
+    assert np.allclose(data['normal'][2], [-1, 0, 0], atol=1e-6)
+
+
+def test_clip_stops_at_end():
+    """Clips that do not loop hold their last pose."""
+    inst = arm().get_instance()
+    inst.play('bend')
+    inst.update(5.0)
+    assert inst.t == 1.0
+
+
+def test_batched_poses_match():
+    """Posing instances together gives the same palettes as separately."""
+    model = arm()
+    instances = []
+    for i in xrange(5):
+        inst = model.get_instance()
+        inst.play('bend')
+        inst.update(i * 0.2)
+        instances.append(inst)
+    pose_instances(instances)
+    for inst in instances:
+        batched = inst.palette()
+        inst._palette = None
+        assert np.allclose(batched, inst.palette())
+
+
+def test_clips_are_compact():
+    """A clip stores only joint keyframes, not vertices."""
+    model = arm()
+    assert model.nbytes == (2 * 8 + 2 * 2 * 4 * 4 + 2 * 2 * 3 * 4)
+
+
+def test_joint_rows():
+    """Joint matrices are packed as their top three rows."""
+    palette = np.arange(2 * 16, dtype=np.float64).reshape(2, 4, 4)
+    rows = joint_rows(palette)
+    assert rows.dtype == np.float32
+    assert rows.shape == (6, 4)
+    assert list(rows[4]) == list(palette[1, 1])
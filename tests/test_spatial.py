@@ -0,0 +1,117 @@
+import random
+from wasabisg.bounds import BoundingBox, Frustum
+from wasabisg.spatial import LooseOctree
+
+
+class Ball(object):
+    """A minimal node that can be stored in an index."""
+    def __init__(self, pos, radius=1.0):
+        self.watchers = []
+        self.radius = radius
+        self.pos = pos
+
+    def watch(self, w):
+        self.watchers.append(w)
+
+    def unwatch(self, w):
+        self.watchers.remove(w)
+
+    def move(self, pos):
+        self.pos = pos
+        for w in self.watchers:
+            w.node_moved(self)
+
+    def get_bounds(self):
+        return BoundingBox(self.pos, self.pos).expanded(self.radius)
+
+
+def scatter(n, seed=0):
+    rng = random.Random(seed)
+    return [
+        Ball(tuple(rng.uniform(-500, 500) for _ in range(3)),
+             rng.uniform(0.1, 20))
+        for _ in range(n)
+    ]
+
+
+def brute_sphere(nodes, center, radius):
+    out = set()
+    for n in nodes:
+        b = n.get_bounds()
+        d = sum(
+            max(lo - c, 0, c - hi) ** 2
+            for c, lo, hi in zip(center, b.min, b.max)
+        )
+        if d <= radius * radius:
+            out.add(n)
+    return out
+
+
+def test_add_remove():
+    """We can add and remove nodes."""
+    index = LooseOctree()
+    a, b = Ball((0, 0, 0)), Ball((100, 0, 0))
+    index.add(a)
+    index.add(b)
+    assert len(index) == 2
+    index.remove(a)
+    assert a not in index
+    assert index.query_sphere((0, 0, 0), 5) == []
+    assert index.query_sphere((100, 0, 0), 5) == [b]
+
+
+def test_sphere_query_matches_brute_force():
+    """A sphere query finds the same nodes as testing every node."""
+    nodes = scatter(500)
+    index = LooseOctree()
+    for n in nodes:
+        index.add(n)
+    for center, radius in [((0, 0, 0), 100), ((400, -300, 50), 60)]:
+        expected = brute_sphere(nodes, center, radius)
+        assert set(index.query_sphere(center, radius)) == expected
+
+
+def test_frustum_query_matches_brute_force():
+    """A frustum query finds the same nodes as testing every node."""
+    nodes = scatter(500, seed=1)
+    index = LooseOctree()
+    for n in nodes:
+        index.add(n)
+    frustum = Frustum.perspective(
+        (0, 0, 600), (0, 0, 0), 60, 1.333, 1.0, 2000.0
+    )
+    expected = set(n for n in nodes if frustum.intersects_box(n.get_bounds()))
+    assert set(index.query_frustum(frustum)) == expected
+
+
+def test_moved_node_is_refitted():
+    """A node that moves is found at its new position."""
+    index = LooseOctree()
+    n = Ball((0, 0, 0))
+    index.add(n)
+    n.move((300, 300, 300))
+    assert index.query_sphere((0, 0, 0), 5) == []
+    assert index.query_sphere((300, 300, 300), 5) == [n]
+
+
+def test_outside_region():
+    """Nodes outside the subdivided region can still be found."""
+    index = LooseOctree(size=100)
+    n = Ball((5000, 0, 0))
+    index.add(n)
+    assert index.query_sphere((5000, 0, 0), 1) == [n]
+
+
+def test_ray_query():
+    """A ray query returns hits sorted by distance."""
+    index = LooseOctree()
+    near, far = Ball((0, 0, -10)), Ball((0, 0, -50))
+    index.add(far)
+    index.add(near)
+    index.add(Ball((20, 0, -10)))
+    hits = index.query_ray((0, 0, 0), (0, 0, -1))
+    assert [n for t, n in hits] == [near, far]
+    assert abs(hits[0][0] - 9) < 1e-6
+    assert index.query_ray((0, 0, 0), (0, 0, -1), max_distance=20) == [
+        hits[0]
+    ]
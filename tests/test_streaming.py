@@ -0,0 +1,76 @@
+import os
+from wasabisg.model import Model
+from wasabisg.streaming import StreamingLoader, PendingModel
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+TREE = os.path.join(ROOT, 'demos', 'forest', 'tree.obj')
+
+
+class FakeScene(object):
+    """A scene that records the models it prepares."""
+    def __init__(self):
+        self.prepared = []
+
+    def prepare_model(self, model):
+        self.prepared.append(model)
+        return model
+
+
+class Watcher(object):
+    loaded = None
+
+    def model_loaded(self, model):
+        self.loaded = model
+
+
+def test_pending_model_draws_nothing():
+    """A pending model without a placeholder has no meshes or bounds."""
+    pending = PendingModel('foo')
+    assert not pending.loaded
+    assert pending.meshes is None
+    assert pending.get_bounds() is None
+    pending.draw()
+
+
+def test_streaming_load():
+    """Models are loaded in the background and prepared by update()."""
+    scene = FakeScene()
+    placeholder = Model(meshes=[])
+    streamer = StreamingLoader(scene, budget=0)
+    pending = streamer.load_obj(TREE, placeholder=placeholder)
+    watcher = Watcher()
+    pending.watch(watcher)
+    assert pending.current is placeholder
+
+    streamer.requests.join()
+    assert not pending.loaded
+    assert streamer.update() == 1
+    assert pending.loaded
+    assert watcher.loaded is pending
+    assert pending.meshes == pending.model.meshes
+    assert scene.prepared == [placeholder, pending.model]
+
+
+def test_streaming_budget():
+    """update() prepares at least one model per call."""
+    scene = FakeScene()
+    streamer = StreamingLoader(scene, budget=0)
+    pendings = [streamer.load_obj(TREE) for i in range(3)]
+    streamer.requests.join()
+    assert [streamer.update() for i in range(4)] == [1, 1, 1, 0]
+    assert all(p.loaded for p in pendings)
+
+
+def test_streaming_error():
+    """Watchers are notified of models that fail to load."""
+    scene = FakeScene()
+    streamer = StreamingLoader(scene, budget=0)
+    pending = streamer.load_obj(os.path.join(ROOT, 'missing.obj'))
+    watcher = Watcher()
+    pending.watch(watcher)
+    streamer.requests.join()
+    assert streamer.update() == 0
+    assert watcher.loaded is pending
+    assert not pending.loaded
+    assert isinstance(pending.error, (IOError, OSError))
@@ -0,0 +1,51 @@
+import numpy as np
+from wasabisg.lighting import Light
+from wasabisg.tiledrenderer import TiledLightingPass
+
+
+class StubCamera(object):
+    """A camera at the origin looking down -z, with fixed matrices."""
+    near = 1.0
+    far = 100.0
+
+    def get_view_array(self):
+        return np.identity(4)
+
+    def get_projection_array(self):
+        n, f = self.near, self.far
+        return np.array([
+            [1, 0, 0, 0],
+            [0, 1, 0, 0],
+            [0, 0, (f + n) / (n - f), 2 * f * n / (n - f)],
+            [0, 0, -1, 0],
+        ])
+
+
+class StubTexture(object):
+    """Record the data uploaded instead of creating a GL texture."""
+    id = 0
+
+    def upload(self, data):
+        self.data = np.asarray(data)
+
+
+def test_upload_lights():
+    """Lights are binned into tiles and their data uploaded."""
+    p = TiledLightingPass.__new__(TiledLightingPass)
+    p.light_array = None
+    p.tile_size = 16
+    p.light_texture = StubTexture()
+    p.light_tiles = StubTexture()
+    p.light_indices = StubTexture()
+    lights = [
+        Light(pos=(0, 0, -10), intensity=2, falloff=1),
+        Light(pos=(5, 0, -10), intensity=1, falloff=1),
+    ]
+    camera = StubCamera()
+    p.prepare_lights(camera, lights)
+    grid = p.upload_lights(camera, lights, (64, 64))
+    assert tuple(grid) == (4, 4)
+    data = p.light_texture.data.reshape(-1, 2, 4)
+    assert len(data) == 2
+    assert list(data[0, 0]) == [0, 0, -10, 1]
+    assert len(p.light_indices.data) > 0
@@ -0,0 +1,65 @@
+import numpy as np
+from euclid import Matrix4
+from wasabisg.transforms import TransformArray
+
+
+class FakeNode(object):
+    """A node with a world matrix, that counts how often it is computed."""
+    transforms = None
+    slot = None
+
+    def __init__(self, x):
+        self.x = x
+        self.computed = 0
+
+    def move(self, x):
+        self.x = x
+        if self.transforms is not None:
+            self.transforms.node_moved(self)
+
+    def get_world_matrix(self):
+        self.computed += 1
+        return Matrix4.new_translate(self.x, 0, 0)
+
+
+def test_rows_hold_world_matrices():
+    """Each row is a column-major matrix, ready for upload."""
+    nodes = [FakeNode(i) for i in xrange(3)]
+    array = TransformArray(nodes)
+    data = array.get(nodes)
+    assert data.dtype == np.float32
+    assert data.shape == (3, 16)
+    assert list(data[:, 12]) == [0, 1, 2]
+
+
+def test_only_moved_nodes_recomputed():
+    """Nodes that have not moved are not recomputed."""
+    a, b = FakeNode(1), FakeNode(2)
+    array = TransformArray([a, b])
+    array.update()
+    b.move(5)
+    array.update()
+    array.update()
+    assert a.computed == 1
+    assert b.computed == 2
+    assert array.get([b])[0, 12] == 5
+
+
+def test_remove_reuses_slot():
+    """Removed nodes free their row for the next node added."""
+    a, b, c = FakeNode(1), FakeNode(2), FakeNode(3)
+    array = TransformArray([a, b])
+    slot = a.slot
+    array.remove(a)
+    assert a.transforms is None
+    assert len(array) == 1
+    array.add(c)
+    assert c.slot == slot
+    assert array.get([c])[0, 12] == 3
+
+
+def test_grows():
+    """The array grows to fit more nodes than its initial capacity."""
+    nodes = [FakeNode(i) for i in xrange(10)]
+    array = TransformArray(nodes, capacity=4)
+    assert list(array.get(nodes)[:, 12]) == range(10)
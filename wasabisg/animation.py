@@ -0,0 +1,181 @@
+"""Advance the playback of many animated model instances at once.
+
+Each :py:class:`~wasabisg.model.AnimatedModelInstance` normally advances its
+own animation in Python when it is updated, which becomes expensive for
+crowds of thousands of animated models. An :py:class:`AnimationClock` instead
+keeps the playback state of every instance added to it in NumPy arrays, and
+advances them all, including moving on to the next sequence, in a few
+vectorised operations per tick.
+
+A :py:class:`~wasabisg.scenegraph.Scene` adds the animated models of the
+nodes added to it to its own clock, so this happens automatically; the
+instances' t, currentframe and playing attributes, and their play() method,
+work as before.
+
+"""
+import numpy as np
+
+from .model import sequence_frames
+
+
+class AnimationClock(object):
+    """The playback state of a collection of animated model instances.
+
+    Each sequence of each model that is played is assigned an id, and the
+    frames of all sequences are stored end to end in a single table.
+
+    :param capacity: The number of instances to allocate space for
+                     initially; the arrays grow as needed.
+
+    """
+    def __init__(self, capacity=64):
+        # Per-instance state, indexed by slot
+        self.seq = np.zeros(capacity, dtype=np.int32)
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.frame = np.zeros(capacity, dtype=np.int32)
+        self.rate = np.zeros(capacity, dtype=np.float64)
+        self.instances = []
+        self.free = []
+
+        # Sequence tables, indexed by sequence id
+        self.sequence_ids = {}
+        self.names = []
+        self.frames = []
+        self.next_ids = []
+        self.starts = []
+        self._tables = None
+
+    def __len__(self):
+        return len(self.instances) - len(self.free)
+
+    def sequence_id(self, model, name):
+        """Get the id of a sequence of a model, registering it if needed."""
+        key = (model, name)
+        try:
+            return self.sequence_ids[key]
+        except KeyError:
+            pass
+        sid = self.sequence_ids[key] = len(self.names)
+        frames = list(sequence_frames(model, name))
+        self.names.append(name)
+        self.frames.append(frames)
+        self.starts.append(sum(len(f) for f in self.frames[:-1]))
+        # A sequence with no next sequence restarts
+        self.next_ids.append(sid)
+        next = model.next.get(name)
+        if next is not None:
+            self.next_ids[sid] = self.sequence_id(model, next)
+        self._tables = None
+        return sid
+
+    def tables(self):
+        """Get the sequence tables as arrays.
+
+        Return arrays of the start of each sequence in the frame table, the
+        length of each sequence and the id of the next sequence, and the
+        frame table itself.
+
+        """
+        if self._tables is None:
+            self._tables = (
+                np.array(self.starts, dtype=np.int32),
+                np.array([len(f) for f in self.frames], dtype=np.float64),
+                np.array(self.next_ids, dtype=np.int32),
+                np.array(
+                    [f for frames in self.frames for f in frames],
+                    dtype=np.int32
+                ),
+            )
+        return self._tables
+
+    def _grow(self):
+        """Double the size of the per-instance arrays."""
+        for name in ('seq', 't', 'frame', 'rate'):
+            a = getattr(self, name)
+            grown = np.zeros(2 * len(a), dtype=a.dtype)
+            grown[:len(a)] = a
+            setattr(self, name, grown)
+
+    def add(self, instance):
+        """Take over advancing an AnimatedModelInstance.
+
+        The instance continues from its current position.
+
+        """
+        if instance.clock is self:
+            return
+        if instance.clock is not None:
+            instance.clock.remove(instance)
+        if self.free:
+            slot = self.free.pop()
+            self.instances[slot] = instance
+        else:
+            slot = len(self.instances)
+            if slot == len(self.seq):
+                self._grow()
+            self.instances.append(instance)
+        model = instance.model
+        self.seq[slot] = self.sequence_id(model, instance.playing)
+        self.t[slot] = instance.t
+        self.frame[slot] = instance.currentframe
+        self.rate[slot] = model.framerate
+        instance.clock = self
+        instance.slot = slot
+
+    def remove(self, instance):
+        """Stop advancing an instance, which then advances itself again."""
+        if instance.clock is not self:
+            return
+        slot = instance.slot
+        state = (
+            self.sequence_name(slot), self.t[slot], self.frame[slot]
+        )
+        instance.clock = instance.slot = None
+        instance.play(state[0])
+        instance.t = float(state[1])
+        instance.currentframe = int(state[2])
+        self.instances[slot] = None
+        self.rate[slot] = 0
+        self.free.append(slot)
+
+    def clear(self):
+        """Remove all instances."""
+        for instance in self.instances:
+            if instance is not None:
+                self.remove(instance)
+        del self.instances[:]
+        del self.free[:]
+
+    def sequence_name(self, slot):
+        """Get the name of the sequence playing in a slot."""
+        return self.names[self.seq[slot]]
+
+    def sequence_frames(self, slot):
+        """Get the frames of the sequence playing in a slot."""
+        return self.frames[self.seq[slot]]
+
+    def play(self, instance, name):
+        """Start playing the named sequence for an instance."""
+        slot = instance.slot
+        sid = self.sequence_id(instance.model, name)
+        self.seq[slot] = sid
+        self.t[slot] = 0.0
+        self.frame[slot] = self.frames[sid][0]
+
+    def tick(self, dt):
+        """Advance all instances by dt seconds."""
+        n = len(self.instances)
+        if not n:
+            return
+        starts, lengths, next_ids, table = self.tables()
+        seq = self.seq[:n]
+        t = self.t[:n]
+        t += dt * self.rate[:n]
+
+        # Instances that have reached the end of their sequence move on to
+        # the next sequence, or restart
+        over = t >= lengths[seq]
+        if over.any():
+            seq[over] = next_ids[seq[over]]
+            t[over] = 0.0
+        self.frame[:n] = table[starts[seq] + t.astype(np.int32)]
@@ -0,0 +1,250 @@
+"""Pack small textures into shared atlas pages.
+
+Each distinct texture a scene uses costs a texture bind whenever a mesh using
+it is drawn, and meshes with different textures cannot be merged into one
+draw call. A :py:class:`TextureAtlas` copies small diffuse textures into
+larger atlas pages and rewrites the texture coordinates of the meshes that
+use them, so that meshes whose materials differ only in their diffuse texture
+can share a material, and be merged by
+:py:func:`~wasabisg.loaders.objloader.optimise_model`.
+
+Only meshes whose texture coordinates lie within the texture (ie. that do not
+rely on the texture repeating) can use the atlas. Each texture is surrounded
+by a border of repeated edge pixels to reduce bleeding between neighbouring
+textures when filtering and mipmapping.
+
+"""
+from array import array
+
+import numpy as np
+import pyglet.image
+from pyglet.image.atlas import Allocator, AllocatorException
+
+from .model import ArrayMesh, Material
+
+
+# Material properties that do not prevent materials being merged once their
+# diffuse texture is in the atlas
+IGNORED_PROPERTIES = ('name', 'relpath', 'map_Kd')
+
+# Tolerance when checking that texture coordinates are within a texture
+UV_EPSILON = 1e-4
+
+
+def _signature(material):
+    """Get the properties of a material that must match for merging."""
+    sig = []
+    for k, v in sorted(material.items()):
+        if k in IGNORED_PROPERTIES or k.startswith('tex_'):
+            continue
+        if isinstance(v, list):
+            v = tuple(v)
+        sig.append((k, v))
+    return tuple(sig)
+
+
+def _texcoords(mesh):
+    """Get the texture coordinates of a mesh as an (n, 2) array."""
+    if isinstance(mesh, ArrayMesh):
+        return mesh.data['texcoord']
+    return np.asarray(mesh.texcoords, dtype=np.float32).reshape(-1, 2)
+
+
+class AtlasPage(object):
+    """A single texture that other textures are packed into."""
+    def __init__(self, size, name):
+        self.name = name
+        self.size = size
+        self.allocator = Allocator(size, size)
+        self.pixels = np.zeros((size, size, 4), dtype=np.uint8)
+        self.texture = None
+        self.dirty = False
+        # The merged materials that use this page
+        self.materials = []
+
+    def add(self, pixels):
+        """Copy an (h, w, 4) array of pixels into the page.
+
+        Return the position it was copied to, or None if the page is full.
+
+        """
+        h, w = pixels.shape[:2]
+        try:
+            x, y = self.allocator.alloc(w, h)
+        except AllocatorException:
+            return None
+        self.pixels[y:y + h, x:x + w] = pixels
+        self.dirty = True
+        return x, y
+
+    def upload(self):
+        """Upload the page to its texture, creating it if necessary.
+
+        An existing texture is updated in place, because groups prepared
+        from our materials keep references to it.
+
+        """
+        image = pyglet.image.ImageData(
+            self.size, self.size, 'RGBA', self.pixels.tostring()
+        )
+        if self.texture is None:
+            # This sets GL_GENERATE_MIPMAP, so the mipmaps are regenerated
+            # whenever the texture is updated
+            self.texture = image.get_mipmapped_texture()
+        else:
+            self.texture.blit_into(image, 0, 0, 0)
+        for mtl in self.materials:
+            if mtl.get('tex_map_Kd') is not self.texture:
+                mtl['tex_map_Kd'] = self.texture
+        self.dirty = False
+
+
+class TextureAtlas(object):
+    """Pack the small diffuse textures of models into atlas pages.
+
+    :param page_size: The width and height of each atlas page, in pixels.
+    :param max_size: Textures larger than this in either dimension are not
+                     packed.
+    :param padding: The width of the border of repeated edge pixels around
+                    each texture.
+    :param loader: The TextureLoader to load images with. By default this is
+                   Material.loader.
+
+    """
+    def __init__(self, page_size=1024, max_size=128, padding=4, loader=None):
+        self.page_size = page_size
+        self.max_size = max_size
+        self.padding = padding
+        self.loader = loader or Material.loader
+        self.pages = []
+        # Resolved image path -> (page, x, y, width, height) of the packed
+        # texture
+        self.placements = {}
+        # (page, material signature) -> merged material
+        self.materials = {}
+
+    def image_pixels(self, name):
+        """Load an image as an (h, w, 4) array, or None if it is too big."""
+        image = self.loader.load_image(name)
+        w, h = image.width, image.height
+        if w > self.max_size or h > self.max_size:
+            return None
+        data = image.get_image_data().get_data('RGBA', w * 4)
+        return np.frombuffer(data, dtype=np.uint8).reshape(h, w, 4)
+
+    def place(self, name):
+        """Pack the named image into a page, if it is not packed already.
+
+        Return its placement, or None if it cannot be packed.
+
+        """
+        key = self.loader.resolve(name)
+        try:
+            return self.placements[key]
+        except KeyError:
+            pass
+        pixels = self.image_pixels(name)
+        p = self.padding
+        if pixels is None or max(pixels.shape[:2]) + 2 * p > self.page_size:
+            self.placements[key] = None
+            return None
+        h, w = pixels.shape[:2]
+        padded = np.pad(pixels, ((p, p), (p, p), (0, 0)), mode='edge')
+        for page in self.pages:
+            pos = page.add(padded)
+            if pos is not None:
+                break
+        else:
+            page = AtlasPage(self.page_size, '<atlas %d>' % len(self.pages))
+            self.pages.append(page)
+            pos = page.add(padded)
+        x, y = pos
+        placement = self.placements[key] = (page, x + p, y + p, w, h)
+        return placement
+
+    def merged_material(self, page, material):
+        """Get the shared material for textures on page like material."""
+        key = (page, _signature(material))
+        try:
+            return self.materials[key]
+        except KeyError:
+            mtl = Material(
+                (k, v) for k, v in material.items()
+                if not k.startswith('tex_')
+            )
+            mtl['name'] = '%s %d' % (page.name, len(page.materials))
+            dict.__setitem__(mtl, 'map_Kd', page.name)
+            page.materials.append(mtl)
+            self.materials[key] = mtl
+            return mtl
+
+    def candidates(self, model):
+        """Find the meshes of a model that can use the atlas.
+
+        Return a dict mapping the id of each suitable material to the
+        material and a list of meshes that use it.
+
+        """
+        by_material = {}
+        for mesh in model.meshes:
+            mtl = mesh.material
+            by_material.setdefault(id(mtl), (mtl, []))[1].append(mesh)
+
+        out = {}
+        for k, (mtl, meshes) in by_material.items():
+            maps = [m for m in mtl if m.startswith('map_')]
+            if maps != ['map_Kd']:
+                continue
+            if any(hasattr(mesh, 'list') for mesh in meshes):
+                # Already uploaded
+                continue
+            uvs = [_texcoords(mesh) for mesh in meshes]
+            if any(len(uv) == 0 for uv in uvs):
+                continue
+            lo = min(uv.min() for uv in uvs)
+            hi = max(uv.max() for uv in uvs)
+            if lo < -UV_EPSILON or hi > 1 + UV_EPSILON:
+                continue
+            out[k] = (mtl, meshes)
+        return out
+
+    def add_model(self, model):
+        """Move a model's small textures into the atlas.
+
+        The meshes' texture coordinates are rewritten in place, and they are
+        given merged materials, before the meshes are merged with
+        optimise_model(). This must be done before the model is prepared;
+        call upload() afterwards to update the atlas textures.
+
+        """
+        from .loaders.objloader import optimise_model
+        changed = False
+        for mtl, meshes in self.candidates(model).values():
+            placement = self.place(mtl['map_Kd'])
+            if placement is None:
+                continue
+            page, x, y, w, h = placement
+            size = float(self.page_size)
+            scale = np.array([w / size, h / size], dtype=np.float32)
+            offset = np.array([x / size, y / size], dtype=np.float32)
+            merged = self.merged_material(page, mtl)
+            for mesh in meshes:
+                uv = np.clip(_texcoords(mesh), 0, 1) * scale + offset
+                if isinstance(mesh, ArrayMesh):
+                    # The data may be a read-only memory map
+                    mesh.data = mesh.data.copy()
+                    mesh.data['texcoord'] = uv
+                else:
+                    uv = uv.astype(np.float32)
+                    mesh.texcoords = array('f', uv.tostring())
+                mesh.material = merged
+            changed = True
+        if changed:
+            optimise_model(model)
+        return changed
+
+    def upload(self):
+        """Upload any atlas pages that have changed."""
+        for page in self.pages:
+            if page.dirty:
+                page.upload()
@@ -0,0 +1,284 @@
+"""Bounding volumes and view frustums, for deciding what needs to be drawn.
+
+Bounding boxes are axis-aligned and held as plain tuples of floats rather than
+euclid objects, because culling tests are run for every node, every frame.
+
+"""
+import math
+
+import numpy as np
+
+
+class BoundingBox(object):
+    """An axis-aligned bounding box.
+
+    :param min: The (x, y, z) corner with the smallest coordinates.
+    :param max: The (x, y, z) corner with the largest coordinates.
+
+    """
+    __slots__ = ('min', 'max')
+
+    def __init__(self, min, max):
+        self.min = tuple(float(c) for c in min[:3])
+        self.max = tuple(float(c) for c in max[:3])
+
+    @classmethod
+    def from_points(cls, points):
+        """Construct the bounding box of a sequence of (x, y, z) points."""
+        points = iter(points)
+        try:
+            x, y, z = next(points)
+        except StopIteration:
+            raise ValueError("Cannot compute the bounds of no points")
+        minx = maxx = x
+        miny = maxy = y
+        minz = maxz = z
+        for x, y, z in points:
+            if x < minx:
+                minx = x
+            elif x > maxx:
+                maxx = x
+            if y < miny:
+                miny = y
+            elif y > maxy:
+                maxy = y
+            if z < minz:
+                minz = z
+            elif z > maxz:
+                maxz = z
+        return cls((minx, miny, minz), (maxx, maxy, maxz))
+
+    @classmethod
+    def from_vertices(cls, vertices):
+        """Construct the bounding box of a flat list of vertex coordinates."""
+        return cls(
+            (min(vertices[0::3]), min(vertices[1::3]), min(vertices[2::3])),
+            (max(vertices[0::3]), max(vertices[1::3]), max(vertices[2::3])),
+        )
+
+    @property
+    def center(self):
+        """The point at the center of the box."""
+        (x1, y1, z1), (x2, y2, z2) = self.min, self.max
+        return (0.5 * (x1 + x2), 0.5 * (y1 + y2), 0.5 * (z1 + z2))
+
+    @property
+    def extents(self):
+        """The half-size of the box along each axis."""
+        (x1, y1, z1), (x2, y2, z2) = self.min, self.max
+        return (0.5 * (x2 - x1), 0.5 * (y2 - y1), 0.5 * (z2 - z1))
+
+    @property
+    def radius(self):
+        """The radius of a sphere centered on the box that contains it."""
+        ex, ey, ez = self.extents
+        return math.sqrt(ex * ex + ey * ey + ez * ez)
+
+    def union(self, other):
+        """Return the smallest box containing this box and other."""
+        return BoundingBox(
+            map(min, self.min, other.min),
+            map(max, self.max, other.max)
+        )
+
+    def expanded(self, amount):
+        """Return a copy of this box grown by amount in every direction."""
+        return BoundingBox(
+            [c - amount for c in self.min],
+            [c + amount for c in self.max]
+        )
+
+    def transformed(self, matrix):
+        """Return the bounding box of this box transformed by matrix.
+
+        matrix is a euclid.Matrix4. The result is the axis-aligned box that
+        contains the transformed box, so it may be larger than strictly
+        necessary if the matrix includes a rotation.
+
+        """
+        m = matrix
+        cx, cy, cz = self.center
+        ex, ey, ez = self.extents
+        nx = m.a * cx + m.b * cy + m.c * cz + m.d
+        ny = m.e * cx + m.f * cy + m.g * cz + m.h
+        nz = m.i * cx + m.j * cy + m.k * cz + m.l
+        rx = abs(m.a) * ex + abs(m.b) * ey + abs(m.c) * ez
+        ry = abs(m.e) * ex + abs(m.f) * ey + abs(m.g) * ez
+        rz = abs(m.i) * ex + abs(m.j) * ey + abs(m.k) * ez
+        return BoundingBox(
+            (nx - rx, ny - ry, nz - rz),
+            (nx + rx, ny + ry, nz + rz)
+        )
+
+    def __eq__(self, other):
+        if not isinstance(other, BoundingBox):
+            return NotImplemented
+        return self.min == other.min and self.max == other.max
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'BoundingBox(%r, %r)' % (self.min, self.max)
+
+
+def union_bounds(boxes):
+    """Return the union of an iterable of bounding boxes.
+
+    If any of the boxes is None (unbounded), or there are no boxes, return
+    None.
+
+    """
+    result = None
+    for b in boxes:
+        if b is None:
+            return None
+        result = b if result is None else result.union(b)
+    return result
+
+
+def _normalize(v):
+    x, y, z = v
+    l = math.sqrt(x * x + y * y + z * z)
+    return (x / l, y / l, z / l)
+
+
+def _cross(a, b):
+    return (
+        a[1] * b[2] - a[2] * b[1],
+        a[2] * b[0] - a[0] * b[2],
+        a[0] * b[1] - a[1] * b[0],
+    )
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def camera_basis(pos, look_at, up=(0, 1, 0)):
+    """Return the forward, side and up unit vectors for a camera."""
+    f = _normalize([b - a for a, b in zip(pos, look_at)])
+    s = _normalize(_cross(f, up))
+    u = _cross(s, f)
+    return f, s, u
+
+
+class Frustum(object):
+    """A convex volume bounded by planes, facing inwards.
+
+    Each plane is a tuple (nx, ny, nz, d); a point p is on the inside of the
+    plane if n . p + d >= 0.
+
+    """
+    __slots__ = ('planes',)
+
+    def __init__(self, planes):
+        self.planes = [tuple(float(c) for c in p) for p in planes]
+
+    @classmethod
+    def _from_normals(cls, normals_and_points):
+        planes = []
+        for n, p in normals_and_points:
+            n = _normalize(n)
+            planes.append(n + (-_dot(n, p),))
+        return cls(planes)
+
+    @classmethod
+    def from_matrix(cls, m):
+        """Extract the frustum from a view-projection matrix.
+
+        m is a 4x4 NumPy array that transforms column vectors from world
+        space into clip space. Each plane is a sum or difference of rows of
+        the matrix (the method of Gribb and Hartmann).
+
+        """
+        m = np.asarray(m, dtype=np.float64)
+        w = m[3]
+        planes = np.array([
+            w + m[2], w - m[2],
+            w + m[0], w - m[0],
+            w + m[1], w - m[1],
+        ])
+        planes /= np.sqrt((planes[:, :3] ** 2).sum(axis=1))[:, np.newaxis]
+        return cls(planes.tolist())
+
+    @classmethod
+    def perspective(cls, pos, look_at, fov, aspect, near, far, up=(0, 1, 0)):
+        """Construct the frustum for a perspective camera.
+
+        fov is the field of view in the y direction, in degrees.
+
+        """
+        f, s, u = camera_basis(pos, look_at, up)
+        tan_y = math.tan(math.radians(fov) * 0.5)
+        tan_x = tan_y * aspect
+        pos = tuple(pos)
+
+        def add(a, b, k=1.0):
+            return tuple(x + y * k for x, y in zip(a, b))
+
+        return cls._from_normals([
+            (f, add(pos, f, near)),
+            (tuple(-c for c in f), add(pos, f, far)),
+            (add(s, f, tan_x), pos),
+            (add(tuple(-c for c in s), f, tan_x), pos),
+            (add(u, f, tan_y), pos),
+            (add(tuple(-c for c in u), f, tan_y), pos),
+        ])
+
+    @classmethod
+    def orthographic(cls, pos, look_at, left, right, bottom, top, near, far,
+                     up=(0, 1, 0)):
+        """Construct the frustum (a box) for an orthographic camera."""
+        f, s, u = camera_basis(pos, look_at, up)
+        pos = tuple(pos)
+
+        def at(k, v):
+            return tuple(p + c * k for p, c in zip(pos, v))
+
+        neg = lambda v: tuple(-c for c in v)
+        return cls._from_normals([
+            (f, at(near, f)),
+            (neg(f), at(far, f)),
+            (s, at(left, s)),
+            (neg(s), at(right, s)),
+            (u, at(bottom, u)),
+            (neg(u), at(top, u)),
+        ])
+
+    def contains_point(self, p):
+        """Return True if the point p is inside the frustum."""
+        x, y, z = p
+        for nx, ny, nz, d in self.planes:
+            if nx * x + ny * y + nz * z + d < 0:
+                return False
+        return True
+
+    def intersects_sphere(self, center, radius):
+        """Return True if the given sphere is at least partly inside."""
+        x, y, z = center
+        r = -radius
+        for nx, ny, nz, d in self.planes:
+            if nx * x + ny * y + nz * z + d < r:
+                return False
+        return True
+
+    def intersects_box(self, box):
+        """Return True if the given BoundingBox is at least partly inside.
+
+        This test is conservative: a box near a corner of the frustum may be
+        reported as intersecting even if it is just outside.
+
+        """
+        (x1, y1, z1), (x2, y2, z2) = box.min, box.max
+        for nx, ny, nz, d in self.planes:
+            # Test the corner of the box furthest along the plane normal
+            px = x2 if nx >= 0 else x1
+            py = y2 if ny >= 0 else y1
+            pz = z2 if nz >= 0 else z1
+            if nx * px + ny * py + nz * pz + d < 0:
+                return False
+        return True
+
+    def __repr__(self):
+        return 'Frustum(%r)' % (self.planes,)
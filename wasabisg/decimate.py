@@ -0,0 +1,172 @@
+"""Generate simplified versions of meshes for distant levels of detail.
+
+Meshes are simplified by vertex clustering: space is divided into a grid of
+cubic cells, all the vertices of a mesh that fall in the same cell are
+merged into one, and triangles that collapse as a result are discarded. This
+is fast, and because every mesh of a model is clustered on the same grid,
+neighbouring meshes still meet after simplification; it does not preserve
+fine features, so it is best suited to models that will only be seen from
+a distance, such as the lower levels of a
+:py:class:`~wasabisg.scenegraph.LODNode`::
+
+    from wasabisg.decimate import decimate_model
+
+    levels = [
+        (tree_model, 50),
+        (decimate_model(tree_model, 0.25), 200),
+        (decimate_model(tree_model, 0.05), float('inf')),
+    ]
+    scene.add(LODNode(levels, pos=(10, 0, 10)))
+
+"""
+import numpy as np
+from OpenGL.GL import GL_QUADS, GL_TRIANGLES
+
+from .model import Model, ArrayMesh, VERTEX_DTYPE
+
+
+# The number of cell sizes tried when searching for a target triangle count
+SEARCH_STEPS = 16
+
+
+def triangles(mesh):
+    """Get the triangles of a mesh as an (n, 3) array of vertex indices."""
+    indices = np.asarray(mesh.indices, dtype=np.uint32)
+    if mesh.mode == GL_TRIANGLES:
+        return indices.reshape(-1, 3)
+    elif mesh.mode == GL_QUADS:
+        quads = indices.reshape(-1, 4)
+        return np.vstack([quads[:, :3], quads[:, [0, 2, 3]]])
+    raise ValueError("Cannot decimate mesh with drawing mode %s" % mesh.mode)
+
+
+def _cells(positions, origin, cell_size):
+    """Get the index of the grid cell containing each position."""
+    cells = np.floor((positions - origin) / cell_size).astype(np.int64)
+    # Pack the three cell coordinates into one integer per vertex
+    cells -= cells.min(axis=0)
+    dims = cells.max(axis=0) + 1
+    return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+
+def _cluster(mesh, origin, cell_size):
+    """Cluster the vertices of an ArrayMesh.
+
+    Return the index of the cluster of each vertex, the number of clusters,
+    and the triangles that survive clustering, in terms of cluster indices.
+
+    """
+    keys = _cells(mesh.data['position'], origin, cell_size)
+    keys, clusters = np.unique(keys, return_inverse=True)
+    tris = clusters[triangles(mesh)]
+
+    # Drop triangles that have collapsed to a line or a point
+    keep = (
+        (tris[:, 0] != tris[:, 1]) &
+        (tris[:, 1] != tris[:, 2]) &
+        (tris[:, 2] != tris[:, 0])
+    )
+    tris = tris[keep]
+
+    # Drop duplicate triangles, rotating each so that its smallest index
+    # comes first; this preserves the winding, so triangles that face
+    # opposite ways are both kept
+    if len(tris):
+        first = tris.argmin(axis=1)
+        order = (first[:, np.newaxis] + np.arange(3)) % 3
+        tris = tris[np.arange(len(tris))[:, np.newaxis], order]
+        tris = np.unique(
+            tris.view([('', tris.dtype)] * 3)
+        ).view(tris.dtype).reshape(-1, 3)
+    return clusters, len(keys), tris
+
+
+def decimate_mesh(mesh, cell_size, origin=(0, 0, 0)):
+    """Simplify a mesh by merging its vertices within cubes of cell_size.
+
+    The merged vertices take the mean position, normal and texture
+    coordinates of the vertices they replace. Only GL_TRIANGLES and GL_QUADS
+    meshes can be decimated; the result is always an ArrayMesh of
+    triangles.
+
+    :param origin: A corner of the grid of cells. Meshes that are decimated
+                   with the same origin and cell size stay joined where they
+                   meet.
+
+    """
+    if not isinstance(mesh, ArrayMesh):
+        mesh = ArrayMesh.from_mesh(mesh)
+    clusters, count, tris = _cluster(mesh, np.asarray(origin), cell_size)
+
+    # Only clusters that are used by a remaining triangle are kept
+    used = np.zeros(count, dtype=bool)
+    used[tris.ravel()] = True
+    remap = np.cumsum(used) - 1
+
+    weights = np.bincount(clusters, minlength=count).astype(np.float32)
+    weights[weights == 0] = 1
+    data = np.zeros(count, dtype=VERTEX_DTYPE)
+    for field in ('position', 'normal', 'texcoord'):
+        values = mesh.data[field]
+        for axis in xrange(values.shape[1]):
+            data[field][:, axis] = np.bincount(
+                clusters, weights=values[:, axis], minlength=count
+            ) / weights
+
+    normals = data['normal']
+    lengths = np.sqrt((normals * normals).sum(axis=1))
+    lengths[lengths == 0] = 1
+    data['normal'] = normals / lengths[:, np.newaxis]
+
+    return ArrayMesh(
+        mode=GL_TRIANGLES,
+        data=data[used],
+        indices=remap[tris].ravel(),
+        material=mesh.material,
+        name=mesh.name
+    )
+
+
+def count_triangles(model, cell_size, origin):
+    """Count the triangles that would remain in a decimated model."""
+    total = 0
+    for mesh in model.meshes:
+        if not isinstance(mesh, ArrayMesh):
+            mesh = ArrayMesh.from_mesh(mesh)
+        total += len(_cluster(mesh, origin, cell_size)[2])
+    return total
+
+
+def decimate_model(model, ratio):
+    """Create a simplified copy of a model.
+
+    The cell size is chosen so that approximately the given ratio of the
+    model's triangles remain. Meshes with no remaining triangles are
+    omitted. The original model is not modified.
+
+    """
+    if not 0 < ratio <= 1:
+        raise ValueError("ratio must be between 0 and 1")
+    bounds = model.get_bounds()
+    if bounds is None:
+        return Model(meshes=list(model.meshes), name=model.name)
+    origin = np.asarray(bounds.min)
+    target = ratio * sum(len(triangles(m)) for m in model.meshes)
+
+    # The number of triangles falls as the cell size grows, so bisect on a
+    # logarithmic scale between a tiny cell and one covering the model
+    size = max(max(bounds.extents) * 2, 1e-6)
+    lo, hi = np.log(size * 1e-4), np.log(size)
+    for i in xrange(SEARCH_STEPS):
+        mid = 0.5 * (lo + hi)
+        if count_triangles(model, np.exp(mid), origin) > target:
+            lo = mid
+        else:
+            hi = mid
+    cell_size = np.exp(hi)
+
+    meshes = [decimate_mesh(m, cell_size, origin) for m in model.meshes]
+    return Model(
+        meshes=[m for m in meshes if len(m.indices)],
+        name=model.name
+    )
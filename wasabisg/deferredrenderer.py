@@ -0,0 +1,442 @@
+"""A deferred shading renderer.
+
+Opaque geometry is drawn once into a G-buffer - a framebuffer with several
+colour attachments recording the albedo, normal and material properties of
+each pixel, plus a depth texture. Lights are then applied in screen space:
+each light draws a full-screen quad, scissored to the rectangle of the screen
+that its cutoff sphere can reach, which reads the G-buffer and adds that
+light's contribution.
+
+"""
+from ctypes import c_uint
+
+import numpy as np
+
+import pyglet.graphics
+from OpenGL.GL import *
+
+from .shader import Shader
+from .lighting import BaseLight
+from .renderqueue import RenderQueue
+from .renderer import (
+    LightingPass, LightingAccumulationRenderer, RenderPass, Instancer,
+    LIGHTING_VERT, INSTANCED_LIGHTING_VERT, SKINNED_LIGHTING_VERT,
+    bind_lighting_material
+)
+from .lightbinning import light_screen_rects, rects_to_pixels
+
+
+GBUFFER_FRAG = """
+
+varying vec3 normal;
+varying vec3 pos;
+varying vec2 uv;
+
+uniform sampler2D diffuse_tex;
+uniform vec3 diffuse_colour;
+uniform vec4 specular;
+uniform float specular_exponent;
+uniform float transmit;
+uniform int illum;
+
+void main (void) {
+    vec4 mapcolour = texture2D(diffuse_tex, uv);
+
+    // Albedo, with alpha 1 if the surface is lit, 0 if not
+    gl_FragData[0] = vec4(
+        mapcolour.rgb * diffuse_colour,
+        illum == 0 ? 0.0 : 1.0
+    );
+    gl_FragData[1] = vec4(normalize(normal), specular_exponent);
+    gl_FragData[2] = vec4(specular.rgb, transmit);
+}
+"""
+
+SCREEN_VERT = """
+void main(void)
+{
+    gl_Position = gl_Vertex;
+}
+"""
+
+GBUFFER_UNIFORMS = """
+uniform sampler2D gbuf_albedo;
+uniform sampler2D gbuf_normal;
+uniform sampler2D gbuf_specular;
+uniform sampler2D gbuf_depth;
+
+// The viewport as (x, y, width, height)
+uniform vec4 viewport;
+
+vec2 screen_uv() {
+    return (gl_FragCoord.xy - viewport.xy) / viewport.zw;
+}
+"""
+
+AMBIENT_FRAG = GBUFFER_UNIFORMS + """
+uniform vec4 ambient;
+
+void main (void) {
+    vec2 uv = screen_uv();
+    float depth = texture2D(gbuf_depth, uv).r;
+    if (depth == 1.0) {
+        // Nothing was drawn here
+        discard;
+    }
+    vec4 albedo = texture2D(gbuf_albedo, uv);
+    vec3 colour = albedo.rgb;
+    if (albedo.a > 0.0) {
+        colour *= ambient.rgb;
+    }
+    gl_FragColor = vec4(colour, 1.0);
+    gl_FragDepth = depth;
+}
+"""
+
+LIGHT_FRAG = GBUFFER_UNIFORMS + """
+uniform mat4 inv_projection;
+uniform vec4 light_position;
+uniform vec3 light_colour;
+uniform float light_falloff;
+
+void main (void) {
+    vec2 uv = screen_uv();
+    vec4 albedo = texture2D(gbuf_albedo, uv);
+    if (albedo.a == 0.0) {
+        // Unlit surface, or nothing drawn here
+        discard;
+    }
+    vec4 n = texture2D(gbuf_normal, uv);
+    vec4 spec = texture2D(gbuf_specular, uv);
+    float depth = texture2D(gbuf_depth, uv).r;
+
+    vec4 p = inv_projection * vec4(vec3(uv, depth) * 2.0 - 1.0, 1.0);
+    vec3 pos = p.xyz / p.w;
+    vec3 frag_normal = n.xyz;
+    float transmit = spec.a;
+
+    float intensity = 1.0;
+    vec3 lightvec;
+
+    if (light_position.w > 0.0) {
+        lightvec = light_position.xyz - pos;
+
+        // Use quadratic attenuation
+        float lengthsq = dot(lightvec, lightvec);
+        intensity /= 1.0 + lengthsq * light_falloff;
+
+        lightvec = normalize(lightvec);
+    } else {
+        lightvec = light_position.xyz;
+    }
+
+    float diffuse_component = dot(
+        frag_normal, lightvec
+    );
+    diffuse_component = max(0.0, diffuse_component) - transmit * min(0.0, diffuse_component);
+
+    float specular_component = 0.0;
+    if (diffuse_component > 0.0) {
+        vec3 rlight = reflect(lightvec, frag_normal);
+        vec3 eye = normalize(pos);
+        specular_component = pow(max(0.0, dot(eye, rlight)), n.a);
+    }
+
+    vec3 colour = intensity * light_colour * (
+        diffuse_component * albedo.rgb +
+        specular_component * spec.rgb
+    );
+    gl_FragColor = vec4(colour, 1.0);
+}
+"""
+
+
+gbuffer_shader = Shader(
+    vert=LIGHTING_VERT,
+    frag=GBUFFER_FRAG,
+    name='gbuffer'
+)
+bind_lighting_material(gbuffer_shader)
+
+gbuffer_shader.skinned_variant = Shader(
+    vert=SKINNED_LIGHTING_VERT,
+    frag=GBUFFER_FRAG,
+    name='skinned gbuffer'
+)
+bind_lighting_material(gbuffer_shader.skinned_variant)
+
+instanced_gbuffer_shader = Shader(
+    vert=INSTANCED_LIGHTING_VERT,
+    frag=GBUFFER_FRAG,
+    name='instanced gbuffer'
+)
+bind_lighting_material(instanced_gbuffer_shader)
+
+deferred_ambient_shader = Shader(
+    vert=SCREEN_VERT,
+    frag=AMBIENT_FRAG,
+    name='deferred ambient'
+)
+
+deferred_light_shader = Shader(
+    vert=SCREEN_VERT,
+    frag=LIGHT_FRAG,
+    name='deferred light'
+)
+
+
+class DeferredLightingPass(LightingPass):
+    """Draw opaque objects into a G-buffer, then light them in screen space.
+
+    Objects with a custom shader cannot write the G-buffer, so they are drawn
+    afterwards in the same way as the accumulation renderer.
+
+    """
+    #: The attachments of the G-buffer, as (uniform, internal format)
+    ATTACHMENTS = [
+        ('gbuf_albedo', GL_RGBA8),
+        ('gbuf_normal', GL_RGBA16F),
+        ('gbuf_specular', GL_RGBA16F),
+    ]
+
+    def __init__(self, ambient=(0, 0, 0, 1), instancing=True):
+        super(DeferredLightingPass, self).__init__(ambient, instancing)
+        self.textures = None
+        if self.instancer:
+            self.instancer = Instancer(shader=instanced_gbuffer_shader)
+
+    def get_fbo(self, viewport):
+        if viewport == self.currentviewport:
+            return self.fbo
+        self.currentviewport = viewport
+
+        width, height = viewport
+
+        if not self.fbo:
+            self.fbo = glGenFramebuffers(1)
+            self.textures = [
+                glGenTextures(1) for _ in xrange(len(self.ATTACHMENTS))
+            ]
+            self.depthbuf = glGenTextures(1)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.fbo)
+        for i, ((uniform, fmt), tex) in enumerate(
+                zip(self.ATTACHMENTS, self.textures)):
+            glBindTexture(GL_TEXTURE_2D, tex)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(
+                GL_TEXTURE_2D, 0, fmt,
+                width, height,
+                0,
+                GL_RGBA, GL_FLOAT,
+                None
+            )
+            glFramebufferTexture2D(
+                GL_FRAMEBUFFER,
+                GL_COLOR_ATTACHMENT0 + i,
+                GL_TEXTURE_2D,
+                tex,
+                0
+            )
+
+        glBindTexture(GL_TEXTURE_2D, self.depthbuf)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(
+            GL_TEXTURE_2D, 0, GL_DEPTH_COMPONENT24,
+            width, height,
+            0,
+            GL_DEPTH_COMPONENT, GL_FLOAT,
+            None
+        )
+        glFramebufferTexture2D(
+            GL_FRAMEBUFFER,
+            GL_DEPTH_ATTACHMENT,
+            GL_TEXTURE_2D,
+            self.depthbuf,
+            0
+        )
+        glBindTexture(GL_TEXTURE_2D, 0)
+        assert glCheckFramebufferStatus(GL_FRAMEBUFFER) == GL_FRAMEBUFFER_COMPLETE, \
+            "Framebuffer is not complete!"
+        return self.fbo
+
+    def render(self, camera, objects):
+        lights = [o for o in objects if isinstance(o, BaseLight)]
+        self.prepare_lights(camera, lights)
+        glPushAttrib(GL_ALL_ATTRIB_BITS)
+        glClear(GL_DEPTH_BUFFER_BIT)
+
+        standard_objects = []
+        shader_objects = []
+        for o in objects:
+            if o.is_transparent():
+                continue
+            if hasattr(o, 'shader'):
+                shader_objects.append(o)
+            else:
+                standard_objects.append(o)
+
+        if standard_objects:
+            viewport = tuple(int(v) for v in glGetIntegerv(GL_VIEWPORT))
+            target = int(glGetIntegerv(GL_FRAMEBUFFER_BINDING))
+            self.render_gbuffer(camera, standard_objects, viewport[2:])
+            glBindFramebuffer(GL_FRAMEBUFFER, target)
+            self.render_lights(camera, lights, viewport)
+
+        for ls, objs in self.assign_lights(lights, shader_objects):
+            for o in objs:
+                self.render_objects(camera, ls, [o], shader=o.shader)
+
+        glPopAttrib()
+
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LEQUAL)
+
+    def render_gbuffer(self, camera, objects, size):
+        """Draw objects into the G-buffer."""
+        glBindFramebuffer(GL_FRAMEBUFFER, self.get_fbo(size))
+        n = len(self.ATTACHMENTS)
+        glDrawBuffers(n, (c_uint * n)(*(
+            GL_COLOR_ATTACHMENT0 + i for i in xrange(n)
+        )))
+        glClearColor(0, 0, 0, 0)
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LEQUAL)
+        glDepthMask(GL_TRUE)
+        glDisable(GL_BLEND)
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+
+        if self.instancer:
+            self.instancer.stats = self.stats
+            objects, batches = self.instancer.batch(objects)
+        else:
+            batches = []
+
+        gbuffer_shader.bind()
+        self.stats.shader_binds += 1
+        RenderQueue(objects, stats=self.stats).submit(camera)
+        if batches:
+            self.instancer.shader.bind()
+            self.stats.shader_binds += 1
+            for b in batches:
+                b.draw(camera)
+        gbuffer_shader.unbind()
+
+    def bind_gbuffer(self, shader, viewport):
+        """Bind the G-buffer textures to the uniforms of shader."""
+        for i, ((uniform, fmt), tex) in enumerate(
+                zip(self.ATTACHMENTS, self.textures)):
+            shader.bind_texture(uniform, i, tex)
+        shader.bind_texture('gbuf_depth', len(self.ATTACHMENTS), self.depthbuf)
+        shader.uniformf('viewport', *viewport)
+
+    def draw_screen(self):
+        """Draw a quad covering the whole viewport."""
+        pyglet.graphics.draw(4, GL_QUADS,
+            ('v2f', (-1, -1, 1, -1, 1, 1, -1, 1)),
+        )
+
+    @staticmethod
+    def inverse_projection(camera):
+        """Get the inverse of camera's projection matrix for the shader.
+
+        The matrix is returned as a list in column-major order.
+
+        """
+        return np.linalg.inv(camera.get_projection_array()).T.ravel().tolist()
+
+    def render_lights(self, camera, lights, viewport):
+        """Light the contents of the G-buffer into the current framebuffer.
+
+        The first pass writes ambient light and copies depth from the
+        G-buffer, so that transparent objects drawn later are correctly
+        occluded. Each light is then added with a separate scissored quad.
+
+        """
+        glDisable(GL_BLEND)
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_ALWAYS)
+        glDepthMask(GL_TRUE)
+
+        shader = deferred_ambient_shader
+        shader.bind()
+        self.stats.shader_binds += 1
+        self.bind_gbuffer(shader, viewport)
+        shader.uniformf('ambient', *self.ambient)
+        self.draw_screen()
+
+        positions, colours, intensities, falloffs, radii = \
+            self.light_data(lights)
+        colours = colours[:, :3] * intensities[:, np.newaxis]
+        rects, visible = light_screen_rects(
+            positions[:, :3], radii, camera.get_projection_array(),
+            camera.near, camera.far
+        )
+        visible &= radii > 0
+        rects = rects_to_pixels(rects, viewport[2:])
+
+        glDisable(GL_DEPTH_TEST)
+        glDepthMask(GL_FALSE)
+        glEnable(GL_BLEND)
+        glBlendFunc(GL_ONE, GL_ONE)
+        glEnable(GL_SCISSOR_TEST)
+
+        shader = deferred_light_shader
+        shader.bind()
+        self.stats.shader_binds += 1
+        self.bind_gbuffer(shader, viewport)
+        shader.uniform_matrixf(
+            'inv_projection', self.inverse_projection(camera)
+        )
+        x, y = viewport[:2]
+        for i in visible.nonzero()[0]:
+            rx, ry, rw, rh = (int(v) for v in rects[i])
+            glScissor(x + rx, y + ry, rw, rh)
+            shader.uniformf('light_position', *positions[i])
+            shader.uniformf('light_colour', *colours[i])
+            shader.uniformf('light_falloff', falloffs[i])
+            self.draw_screen()
+
+        shader.unbind()
+        glActiveTexture(GL_TEXTURE0)
+        glDisable(GL_SCISSOR_TEST)
+        glDepthMask(GL_TRUE)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+    def __del__(self):
+        if self.fbo:
+            glDeleteTextures(self.textures + [self.depthbuf])
+            glDeleteFramebuffers([self.fbo])
+            self.fbo = None
+
+
+class DeferredRenderer(LightingAccumulationRenderer):
+    """Render with deferred shading.
+
+    Opaque geometry is drawn only once, into a G-buffer, and the cost of each
+    light depends on the area of the screen it covers rather than the
+    complexity of the scene. This suits scenes with hundreds of small dynamic
+    lights. Requires OpenGL 3.0.
+
+    Use it by passing it to the Scene::
+
+        scene = Scene(renderer=DeferredRenderer())
+
+    """
+    def __init__(self, instancing=True):
+        super(DeferredRenderer, self).__init__(instancing=instancing)
+        self.lighting = DeferredLightingPass(instancing=instancing)
+        self.passes = [
+            self.lighting,
+            RenderPass(
+                transparency=True
+            )
+        ]
@@ -1,6 +1,7 @@
 from pyglet.graphics import Batch, Group
 from OpenGL.GL import *
 from .lighting import Light, Sunlight, BaseLight
+from .model import ArrayMesh
 
 
 def _pad_v4(*args):
@@ -20,10 +21,6 @@ def clamp(v, low, high):
 class MaterialGroup(Group):
     def __init__(self, material, parent=None):
         self.material = material
-        try:
-            self.tex = material['tex_map_Kd']
-        except KeyError:
-            self.tex = None
 
         self.diffuse = _pad_v4(*material.get('Kd', (1.0, 1.0, 1.0)))
         self.specular = _pad_v4(*material.get('Ks', (0, 0, 0, 1)))
@@ -31,11 +28,20 @@ class MaterialGroup(Group):
         self.illum = material.get('illum', 1)
         super(MaterialGroup, self).__init__(parent=parent)
 
+    @property
+    def tex(self):
+        # Look the texture up each time, as it may have been evicted from
+        # the texture cache and need reloading
+        if 'map_Kd' in self.material:
+            return self.material.get_texture('map_Kd')
+        return None
+
     def set_state(self):
         super(MaterialGroup, self).set_state()
-        if self.tex is not None:
+        tex = self.tex
+        if tex is not None:
             glActiveTexture(GL_TEXTURE0)
-            glBindTexture(GL_TEXTURE_2D, self.tex.id)
+            glBindTexture(GL_TEXTURE_2D, tex.id)
         if not self.illum:
             glDisable(GL_LIGHTING)
             glColor4fv(self.diffuse)
@@ -45,7 +51,7 @@ class MaterialGroup(Group):
             glMaterialf(GL_FRONT, GL_SHININESS, self.specular_exponent)
 
     def unset_state(self):
-        if self.tex:
+        if 'map_Kd' in self.material:
             glActiveTexture(GL_TEXTURE0)
             glBindTexture(GL_TEXTURE_2D, 0)
         if not self.illum:
@@ -83,24 +89,37 @@ class FallbackRenderer(object):
         # glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
 
         camera.set_matrix()
-        self.render_scene(camera, scene.objects)
+        self.render_scene(camera, scene.visible_objects(camera))
 
     def prepare_model(self, model):
         if hasattr(model, 'draw'):
             return model
         batch = Batch()
+        buffered = []
         for m in model.meshes:
-            self.prepare_mesh(m, batch)
+            group = self.prepare_mesh(m, batch)
+            if isinstance(m, ArrayMesh):
+                buffered.append((m, group))
+
+        def draw():
+            batch.draw()
+            for m, group in buffered:
+                group.set_state_recursive()
+                m.list.draw(m.mode)
+                group.unset_state_recursive()
+
         model.batch = batch
-        model.draw = batch.draw
+        model.draw = draw if buffered else batch.draw
         return model
 
     def prepare_mesh(self, mesh, batch):
         mat = mesh.material
         mat.load_textures()
 
-        l = mesh.to_list(batch, group=MaterialGroup(mat))
+        group = MaterialGroup(mat)
+        l = mesh.to_list(batch, group=group)
         mesh.list = l
+        return group
 
     def render_scene(self, camera, objects):
         lights = [o for o in objects if isinstance(o, BaseLight)]
@@ -0,0 +1,139 @@
+"""Work out which areas of the screen each light can affect.
+
+These functions operate on NumPy arrays of many lights at once. Positions are
+given in view space, where the camera looks down the -z axis; matrices are
+NumPy 4x4 arrays that transform column vectors.
+
+"""
+import numpy as np
+
+
+def euclid_to_array(m):
+    """Convert a euclid.Matrix4 to a NumPy 4x4 array."""
+    return np.array(m[:], dtype=np.float64).reshape(4, 4).T
+
+
+def light_screen_rects(view_pos, radii, projection, near, far):
+    """Compute the screen-space rectangles that bound spherical lights.
+
+    view_pos is an (n, 3) array of light positions in view space, and radii
+    an array of the n radii of the lights, where infinite radii denote lights
+    that reach everything.
+
+    Returns a tuple (rects, visible). rects is an (n, 4) array of
+    (xmin, ymin, xmax, ymax) in normalised device coordinates, clipped to the
+    range -1 to 1. visible is a boolean array that is False for lights that
+    cannot affect anything on screen.
+
+    The rectangles are conservative: they contain the whole projected sphere,
+    but may be somewhat larger.
+
+    """
+    view_pos = np.asarray(view_pos, dtype=np.float64).reshape(-1, 3)
+    r = np.asarray(radii, dtype=np.float64)
+    n = len(r)
+    cx, cy, cz = view_pos.T
+    sx = projection[0, 0]
+    sy = projection[1, 1]
+
+    infinite = np.isinf(r)
+    finite_r = np.where(infinite, 0.0, r)
+    nearest = -cz - finite_r
+    furthest = -cz + finite_r
+    visible = infinite | ((furthest > near) & (nearest < far))
+
+    if projection[3, 2] != 0:
+        # Perspective: lights that cross the near plane may cover anything
+        full = infinite | (nearest <= near)
+        zn = np.where(full, 1.0, nearest)
+        zf = np.where(full, 1.0, furthest)
+
+        def extent(c, s):
+            hi = c + finite_r
+            lo = c - finite_r
+            ext_max = np.where(hi > 0, hi / zn, hi / zf) * s
+            ext_min = np.where(lo < 0, lo / zn, lo / zf) * s
+            return ext_min, ext_max
+        xmin, xmax = extent(cx, sx)
+        ymin, ymax = extent(cy, sy)
+    else:
+        full = infinite
+        tx = projection[0, 3]
+        ty = projection[1, 3]
+        xmin = (cx - finite_r) * sx + tx
+        xmax = (cx + finite_r) * sx + tx
+        ymin = (cy - finite_r) * sy + ty
+        ymax = (cy + finite_r) * sy + ty
+
+    rects = np.empty((n, 4))
+    rects[:, 0] = np.where(full, -1.0, xmin)
+    rects[:, 1] = np.where(full, -1.0, ymin)
+    rects[:, 2] = np.where(full, 1.0, xmax)
+    rects[:, 3] = np.where(full, 1.0, ymax)
+
+    visible &= (
+        (rects[:, 2] >= -1) & (rects[:, 0] <= 1) &
+        (rects[:, 3] >= -1) & (rects[:, 1] <= 1)
+    )
+    np.clip(rects, -1.0, 1.0, out=rects)
+    return rects, visible
+
+
+def rects_to_pixels(rects, viewport):
+    """Convert NDC rectangles to integer (x, y, width, height) pixel rects."""
+    width, height = viewport
+    x0 = np.floor((rects[:, 0] + 1) * 0.5 * width).astype(np.int64)
+    y0 = np.floor((rects[:, 1] + 1) * 0.5 * height).astype(np.int64)
+    x1 = np.ceil((rects[:, 2] + 1) * 0.5 * width).astype(np.int64)
+    y1 = np.ceil((rects[:, 3] + 1) * 0.5 * height).astype(np.int64)
+    return np.column_stack([x0, y0, x1 - x0, y1 - y0])
+
+
+def bin_lights(rects, visible, viewport, tile_size):
+    """Assign lights to screen tiles.
+
+    The viewport is divided into square tiles of tile_size pixels, numbered
+    in rows from the bottom left (matching gl_FragCoord).
+
+    Returns (tiles, indices, grid). tiles is an (ntiles, 2) array of
+    (offset, count) into indices, which lists the light numbers that overlap
+    each tile, in ascending order. grid is the number of tiles in the
+    (x, y) directions.
+
+    """
+    width, height = viewport
+    tiles_x = -(-width // tile_size)
+    tiles_y = -(-height // tile_size)
+    ntiles = tiles_x * tiles_y
+
+    lights = np.flatnonzero(visible)
+    r = rects[lights]
+    scale_x = 0.5 * width / tile_size
+    scale_y = 0.5 * height / tile_size
+    tx0 = np.clip(((r[:, 0] + 1) * scale_x).astype(np.int64), 0, tiles_x - 1)
+    ty0 = np.clip(((r[:, 1] + 1) * scale_y).astype(np.int64), 0, tiles_y - 1)
+    tx1 = np.clip(((r[:, 2] + 1) * scale_x).astype(np.int64), 0, tiles_x - 1)
+    ty1 = np.clip(((r[:, 3] + 1) * scale_y).astype(np.int64), 0, tiles_y - 1)
+
+    # Expand each light's rectangle of tiles into a list of (tile, light)
+    w = tx1 - tx0 + 1
+    h = ty1 - ty0 + 1
+    counts = w * h
+    total = counts.sum()
+    light_ids = np.repeat(lights, counts)
+    starts = np.cumsum(counts) - counts
+    local = np.arange(total) - np.repeat(starts, counts)
+    rw = np.repeat(w, counts)
+    tile_ids = (
+        (np.repeat(ty0, counts) + local // rw) * tiles_x +
+        np.repeat(tx0, counts) + local % rw
+    )
+
+    # A stable sort keeps lights in ascending order within each tile
+    order = np.argsort(tile_ids, kind='mergesort')
+    indices = light_ids[order]
+    tile_counts = np.bincount(tile_ids, minlength=ntiles)
+    tiles = np.empty((ntiles, 2), dtype=np.int64)
+    tiles[:, 1] = tile_counts
+    tiles[:, 0] = np.cumsum(tile_counts) - tile_counts
+    return tiles, indices, (tiles_x, tiles_y)
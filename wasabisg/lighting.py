@@ -1,20 +1,68 @@
+import math
+import numpy as np
 from euclid import Point3, Vector3
 
 
+#: The light level below which a light is considered to have no effect. An
+#: 8-bit framebuffer cannot show a contribution smaller than this.
+LIGHT_CUTOFF = 1.0 / 256
+
+
 class BaseLight(object):
-    """Indicate that this is a light."""
+    """Indicate that this is a light.
+
+    Like scene nodes, lights can be watched; watchers have their
+    light_changed(light) method called whenever a property of the light is
+    assigned.
+
+    """
+    watchers = ()
 
     @property
     def colour(self):
         return self._colour
 
     @colour.setter
-    def set_colour(self, c):
+    def colour(self, c):
         self._colour = tuple(c) + (1.0,) * (4 - len(c))
+        self.changed()
+
+    @property
+    def intensity(self):
+        return self._intensity
+
+    @intensity.setter
+    def intensity(self, intensity):
+        self._intensity = intensity
+        self.changed()
+
+    def watch(self, watcher):
+        """Call watcher.light_changed(self) whenever this light changes."""
+        if not self.watchers:
+            self.watchers = []
+        self.watchers.append(watcher)
+
+    def unwatch(self, watcher):
+        """Stop notifying watcher when this light changes."""
+        if watcher in self.watchers:
+            self.watchers.remove(watcher)
+
+    def changed(self):
+        """Notify watchers that this light has changed."""
+        for w in self.watchers:
+            w.light_changed(self)
 
     def update(self, dt):
         pass
 
+    def get_radius(self, cutoff=LIGHT_CUTOFF):
+        """Get the distance beyond which this light has no visible effect.
+
+        Returns None if the light affects the whole scene.
+
+        """
+        return None
+
     def is_transparent(self):
         return True
 
@@ -41,7 +89,7 @@ class Light(BaseLight):
                  intensity=5,
                  falloff=2):
         self.pos = pos
-        self._colour = colour
+        self.colour = colour
         self.intensity = intensity
         self.falloff = falloff
 
@@ -52,6 +100,31 @@ class Light(BaseLight):
     @pos.setter
     def pos(self, pos):
         self._pos = Point3(*pos[:3])
+        self.changed()
+
+    @property
+    def falloff(self):
+        return self._falloff
+
+    @falloff.setter
+    def falloff(self, falloff):
+        self._falloff = falloff
+        self.changed()
+
+    def get_radius(self, cutoff=LIGHT_CUTOFF):
+        """Get the distance beyond which this light has no visible effect.
+
+        This is the distance at which the quadratic attenuation of the light
+        reduces its brightest colour component below cutoff. Returns None if
+        the light does not attenuate.
+
+        """
+        if self.falloff <= 0:
+            return None
+        strength = self.intensity * max(self.colour[:3])
+        if strength <= cutoff:
+            return 0.0
+        return math.sqrt((strength / cutoff - 1.0) / self.falloff)
 
 
 class Sunlight(BaseLight):
@@ -71,7 +144,7 @@ class Sunlight(BaseLight):
                  colour=(1, 1, 1, 1),
                  intensity=5):
         self.direction = direction
-        self._colour = colour
+        self.colour = colour
         self.intensity = intensity
 
     @property
@@ -82,3 +155,120 @@ class Sunlight(BaseLight):
     def direction(self, direction):
         self._pos = d = Vector3(*direction[:3])
         d.normalize()
+        self.changed()
+
+
+class LightArray(object):
+    """The properties of a set of lights, stored as NumPy arrays.
+
+    Each light occupies one row of each array. The arrays are kept up to
+    date by watching the lights, and only the rows of lights that have
+    changed are recomputed, when update() is called.
+
+    :ivar positions: An (n, 4) array of positions in world space, with w = 0
+                     for directional lights.
+    :ivar colours: An (n, 4) array of light colours.
+    :ivar intensities: The intensity of each light.
+    :ivar falloffs: The falloff of each light.
+    :ivar radii: The cutoff radius of each light (see
+                 :py:meth:`Light.get_radius`); infinite if the light
+                 reaches everything.
+
+    """
+    def __init__(self, lights=()):
+        self.lights = []
+        self.indices = {}
+        self.dirty = set()
+        self.resize(0)
+        for l in lights:
+            self.add(l)
+
+    def __len__(self):
+        return len(self.lights)
+
+    def __contains__(self, light):
+        return light in self.indices
+
+    def resize(self, n):
+        """Reallocate the arrays to hold n lights."""
+        self.positions = np.zeros((n, 4))
+        self.colours = np.zeros((n, 4))
+        self.intensities = np.zeros(n)
+        self.falloffs = np.zeros(n)
+        self.radii = np.zeros(n)
+        self.dirty.update(self.lights)
+
+    def add(self, light):
+        """Add a light to the array."""
+        if light in self.indices:
+            return
+        self.indices[light] = len(self.lights)
+        self.lights.append(light)
+        light.watch(self)
+        self.dirty.add(light)
+
+    def remove(self, light):
+        """Remove a light from the array."""
+        i = self.indices.pop(light, None)
+        if i is None:
+            return
+        light.unwatch(self)
+        self.dirty.discard(light)
+        # Move the last light into the vacated row
+        last = self.lights.pop()
+        if last is not light:
+            self.lights[i] = last
+            self.indices[last] = i
+            self.dirty.add(last)
+
+    def clear(self):
+        """Remove all lights."""
+        for l in self.lights:
+            l.unwatch(self)
+        del self.lights[:]
+        self.indices.clear()
+        self.dirty.clear()
+
+    def light_changed(self, light):
+        self.dirty.add(light)
+
+    def update(self):
+        """Recompute the rows of any lights that have changed."""
+        if len(self.positions) < len(self.lights):
+            # Grow geometrically to make adding lights cheap
+            self.resize(max(len(self.lights), 2 * len(self.positions)))
+        while self.dirty:
+            l = self.dirty.pop()
+            i = self.indices[l]
+            self.positions[i, :3] = tuple(l._pos)
+            self.positions[i, 3] = l.w
+            self.colours[i] = l.colour
+            self.intensities[i] = l.intensity
+            self.falloffs[i] = getattr(l, 'falloff', 0.0)
+            r = l.get_radius()
+            self.radii[i] = float('inf') if r is None else r
+
+    def index(self, lights):
+        """Get an array of the row numbers of lights.
+
+        Lights that are not in this array are added.
+
+        """
+        for l in lights:
+            if l not in self.indices:
+                self.add(l)
+        self.update()
+        return np.array(
+            [self.indices[l] for l in lights], dtype=np.intp
+        )
+
+    def view_positions(self, view_matrix):
+        """Get the positions of all lights in view space.
+
+        view_matrix should be a NumPy 4x4 array. Directional lights are
+        rotated but not translated.
+
+        """
+        self.update()
+        n = len(self.lights)
+        return self.positions[:n].dot(view_matrix.T)
@@ -0,0 +1,277 @@
+"""A cache of models compiled into a binary format.
+
+Parsing text model formats such as .obj is slow. A :py:class:`ModelCache`
+stores each model that has been loaded in a compiled file containing a JSON
+header, which describes the meshes and materials, followed by the raw vertex
+and index buffers. The buffers are memory mapped when the model is loaded
+again, so they can be passed to OpenGL without being parsed or copied.
+
+A compiled model is reused only while the source file, and any material
+libraries it uses, have the same modification time and size as when it was
+compiled.
+
+"""
+import os
+import json
+import struct
+import hashlib
+import tempfile
+from array import array
+
+import numpy as np
+
+from ..model import Model, Mesh, ArrayMesh, Material, VERTEX_DTYPE
+
+
+MAGIC = 'WSGMODEL'
+VERSION = 1
+EXTENSION = '.wsgm'
+
+# Buffers are aligned to this many bytes in the file
+ALIGN = 16
+
+# The dtype matching array('L'), used for the indices of uncompacted Meshes
+_LONG = np.dtype('u%d' % array('L').itemsize)
+
+
+def _stat(path):
+    """Get the part of a file's state that invalidates a compiled model."""
+    st = os.stat(path)
+    return {'path': path, 'mtime': st.st_mtime, 'size': st.st_size}
+
+
+def _str(v):
+    """Convert unicode strings read from JSON back to str."""
+    if isinstance(v, unicode):
+        return v.encode('utf8')
+    if isinstance(v, list):
+        return [_str(i) for i in v]
+    return v
+
+
+def _pad(n):
+    """Round n up to a multiple of ALIGN."""
+    return -(-n // ALIGN) * ALIGN
+
+
+def pack_model(filename, model, mtl_loader, swapyz=False):
+    """Convert a model loaded from filename to a compiled form.
+
+    Return a header, which can be serialised as JSON, and a list of the
+    vertex and index arrays of each mesh in turn.
+
+    """
+    libs = []
+    arrays = []
+    meshes = []
+    for m in model.meshes:
+        # Record which attributes were given, so that uncompacted
+        # Meshes can be recreated exactly
+        attrs = [a for a in ('normals', 'texcoords') if len(getattr(m, a))]
+        if not isinstance(m, ArrayMesh):
+            m = ArrayMesh.from_mesh(m)
+        lib = mtl_loader.library_of.get(m.material['name'])
+        if lib and lib not in libs:
+            libs.append(lib)
+        meshes.append({
+            'name': m.name,
+            'mode': int(m.mode),
+            'material': m.material['name'],
+            'vertex_count': len(m.data),
+            'index_count': len(m.indices),
+            'index_dtype': m.indices.dtype.str,
+            'attributes': attrs,
+        })
+        arrays.extend([m.data, m.indices])
+
+    libraries = []
+    for lib in libs:
+        entry = _stat(lib)
+        entry['materials'] = [
+            dict(
+                (k, v) for k, v in mtl.items()
+                if not k.startswith('tex_')
+            )
+            for mtl in mtl_loader.materials.values()
+            if mtl_loader.library_of.get(mtl['name']) == lib
+        ]
+        libraries.append(entry)
+
+    header = {
+        'version': VERSION,
+        'source': _stat(filename),
+        'swapyz': swapyz,
+        'libraries': libraries,
+        'meshes': meshes,
+    }
+    return header, arrays
+
+
+def unpack_model(filename, header, arrays, loader):
+    """Construct a Model from the output of pack_model().
+
+    Materials are registered with the loader's MtlFileLoader, unless their
+    library has been loaded already. The meshes are ArrayMeshes wrapping
+    the given arrays if the loader is compact, otherwise Meshes.
+
+    """
+    mtl_loader = loader.mtl_loader
+    for lib in header['libraries']:
+        libpath = _str(lib['path'])
+        if libpath in mtl_loader.mtllibs:
+            continue
+        mtl_loader.mtllibs.add(libpath)
+        for attrs in lib['materials']:
+            mtl = Material(
+                (_str(k), _str(v)) for k, v in attrs.items()
+            )
+            mtl_loader.add_material(mtl, libpath)
+
+    meshes = []
+    for i, m in enumerate(header['meshes']):
+        mesh = ArrayMesh(
+            mode=m['mode'],
+            data=arrays[2 * i],
+            indices=arrays[2 * i + 1],
+            material=mtl_loader.get_material(_str(m['material'])),
+            name=_str(m['name'])
+        )
+        if not loader.compact:
+            attrs = dict(
+                (a, array('f', getattr(mesh, a).tostring())
+                    if a in m['attributes'] else array('f'))
+                for a in ('normals', 'texcoords')
+            )
+            indices = mesh.indices.astype(_LONG)
+            mesh = Mesh(
+                mode=mesh.mode,
+                vertices=array('f', mesh.vertices.tostring()),
+                indices=array('L', indices.tostring()),
+                normals=attrs['normals'],
+                texcoords=attrs['texcoords'],
+                material=mesh.material,
+                name=mesh.name
+            )
+        meshes.append(mesh)
+    return Model(name=filename, meshes=meshes)
+
+
+class ModelCache(object):
+    """Store and load compiled models.
+
+    :param directory: The directory to write compiled models to. If None,
+                      each compiled model is written next to its source
+                      file.
+
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path_for(self, filename):
+        """Get the path of the compiled version of filename."""
+        if self.directory is None:
+            return filename + EXTENSION
+        key = hashlib.sha1(os.path.abspath(filename)).hexdigest()
+        return os.path.join(self.directory, key + EXTENSION)
+
+    def read_header(self, path):
+        """Read the header of a compiled model.
+
+        Return the header and the offset at which the buffers start.
+
+        """
+        with open(path, 'rb') as f:
+            magic = f.read(len(MAGIC))
+            if magic != MAGIC:
+                raise ValueError("%s is not a compiled model" % path)
+            size, = struct.unpack('<I', f.read(4))
+            header = json.loads(f.read(size))
+        return header, _pad(len(MAGIC) + 4 + size)
+
+    def is_current(self, header, filename, swapyz):
+        """Return True if a header matches the current source files."""
+        if header.get('version') != VERSION:
+            return False
+        if header['swapyz'] != swapyz:
+            return False
+        try:
+            deps = [_stat(filename)] + [
+                _stat(lib['path']) for lib in header['libraries']
+            ]
+        except OSError:
+            return False
+        recorded = [header['source']] + header['libraries']
+        return all(
+            d['mtime'] == r['mtime'] and d['size'] == r['size']
+            for d, r in zip(deps, recorded)
+        )
+
+    def load(self, filename, loader, swapyz=False):
+        """Load the compiled version of a model.
+
+        Return None if there is no compiled version of filename, or if it is
+        out of date or corrupt.
+
+        """
+        path = self.path_for(filename)
+        try:
+            header, start = self.read_header(path)
+            if not self.is_current(header, filename, swapyz):
+                return None
+            buf = np.memmap(path, dtype=np.uint8, mode='r')
+            arrays = []
+            for m in header['meshes']:
+                arrays.append(self._slice(
+                    buf, start + m['vertex_offset'], m['vertex_count'],
+                    VERTEX_DTYPE
+                ))
+                arrays.append(self._slice(
+                    buf, start + m['index_offset'], m['index_count'],
+                    np.dtype(str(m['index_dtype']))
+                ))
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            return None
+        return unpack_model(filename, header, arrays, loader)
+
+    @staticmethod
+    def _slice(buf, offset, count, dtype):
+        """View count items of dtype in buf, starting at offset."""
+        data = buf[offset:offset + count * dtype.itemsize]
+        if len(data) != count * dtype.itemsize:
+            raise ValueError("Compiled model is truncated")
+        return data.view(dtype)
+
+    def save(self, filename, model, loader, swapyz=False):
+        """Write the compiled version of a model loaded from filename."""
+        header, arrays = pack_model(
+            filename, model, loader.mtl_loader, swapyz
+        )
+        buffers = []
+        offset = 0
+        for i, m in enumerate(header['meshes']):
+            for key, buf in (('vertex_offset', arrays[2 * i]),
+                             ('index_offset', arrays[2 * i + 1])):
+                m[key] = offset
+                raw = buf.tostring()
+                buffers.append(raw + '\0' * (_pad(len(raw)) - len(raw)))
+                offset += len(buffers[-1])
+
+        header = json.dumps(header)
+        preamble = MAGIC + struct.pack('<I', len(header)) + header
+        preamble += '\0' * (_pad(len(preamble)) - len(preamble))
+
+        # Write to a temporary file and rename it into place, so that a
+        # partially written file is never loaded
+        path = self.path_for(filename)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path) or '.')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(preamble)
+                for buf in buffers:
+                    f.write(buf)
+            os.rename(tmp, path)
+        except Exception:
+            os.unlink(tmp)
+            raise
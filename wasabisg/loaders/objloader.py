@@ -1,6 +1,15 @@
 import os.path
+from operator import itemgetter
+from multiprocessing import Pool, cpu_count
 
-from ..model import Model, Mesh, AnimatedModel, DEFAULT_FRAMERATE, Material
+import numpy as np
+
+from ..model import (
+    Model, Mesh, ArrayMesh, AnimatedModel, DEFAULT_FRAMERATE, Material,
+    compact_model, merge_array_meshes
+)
+from ..morph import MorphModel
+from .modelcache import pack_model, unpack_model
 
 from OpenGL.GL import GL_TRIANGLES, GL_QUADS
 
@@ -8,6 +17,124 @@ from OpenGL.GL import GL_TRIANGLES, GL_QUADS
 ANIMDIR = 'assets/mesh-animations/'
 
 
+# Statements that affect how faces are grouped into meshes
+_CONTROL_STATEMENTS = ('usemtl', 'usemat', 'mtllib', 'o')
+
+
+def _select(lines, indices):
+    """Get the lines at the given indices, as a sequence."""
+    if len(indices) == 0:
+        return ()
+    if len(indices) == 1:
+        return (lines[indices[0]],)
+    return itemgetter(*indices.tolist())(lines)
+
+
+def _statements(heads, keyword):
+    """Find the lines that start with the given keyword.
+
+    heads is a tuple of arrays of the first characters of each line.
+
+    """
+    key = keyword + ' '
+    mask = heads[0] == ord(key[0])
+    for h, c in zip(heads[1:], key[1:]):
+        mask &= h == ord(c)
+    return np.flatnonzero(mask)
+
+
+def _parse_floats(lines, keyword, widths):
+    """Parse statements of whitespace-separated floats into an (n, w) array.
+
+    Every line must have the same number of values, which must be one of
+    widths; return None otherwise.
+
+    """
+    text = ' '.join(lines).replace(keyword + ' ', ' ')
+    values = np.fromstring(text, dtype=float, sep=' ')
+    n = len(lines)
+    for w in widths:
+        if values.size == n * w:
+            return values.reshape(n, w)
+    return None
+
+
+def _parse_faces(lines):
+    """Parse f statements into an array of index triples.
+
+    The result has shape (faces, corners, 3) and holds (vertex, normal,
+    texcoord) indices for each corner, with 0 for indices that are omitted.
+
+    Return None if the faces have differing numbers of corners or mix
+    different corner formats.
+
+    """
+    if not lines:
+        return ()
+
+    w = lines[0].split(None, 2)[1].split('/')
+    has_uv = len(w) >= 2 and len(w[1]) > 0
+    has_n = len(w) >= 3 and len(w[2]) > 0
+    components = 1 + has_uv + has_n
+    if len(w) > 3 or len(w) - 1 > components:
+        return None
+
+    joined = '\n'.join(lines).replace('f ', ' ')
+
+    # Count the corners on each line by finding the starts of words
+    chars = np.frombuffer(joined, dtype=np.uint8)
+    space = (chars == 32) | (chars == 10)
+    starts = ~space
+    starts[1:] &= space[:-1]
+    line_of = np.cumsum(chars == 10)
+    counts = np.bincount(line_of[starts], minlength=len(lines))
+    corners = counts[0]
+    if corners not in (3, 4) or (counts != corners).any():
+        return None
+
+    ncorners = corners * len(lines)
+    if joined.count('/') != ncorners * (len(w) - 1):
+        return None
+    if joined.count('//') != (ncorners if len(w) == 3 and not has_uv else 0):
+        return None
+
+    values = np.fromstring(joined.replace('/', ' '), dtype=int, sep=' ')
+    if values.size != ncorners * components:
+        return None
+    values = values.reshape(len(lines), corners, components)
+
+    faces = np.zeros((len(lines), corners, 3), dtype=int)
+    faces[..., 0] = values[..., 0]
+    if has_n:
+        faces[..., 1] = values[..., -1]
+    if has_uv:
+        faces[..., 2] = values[..., 1]
+    return faces
+
+
+def _dedup_rows(rows):
+    """Find the distinct rows of an integer array.
+
+    Return the distinct rows, in order of first occurrence, and the index of
+    each input row in that result.
+
+    """
+    lo = rows.min(axis=0)
+    span = rows.max(axis=0) - lo + 1
+    shifted = (rows - lo).astype(np.int64)
+    keys = shifted[:, 0]
+    for col in xrange(1, rows.shape[1]):
+        keys = keys * span[col] + shifted[:, col]
+
+    _, first, inverse = np.unique(
+        keys, return_index=True, return_inverse=True
+    )
+    order = np.argsort(first, kind='mergesort')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    return rows[first[order]], rank[inverse]
+
+
 def optimise_model(model):
     """Combine meshes with identical materials.
 
@@ -25,6 +152,9 @@ def optimise_model(model):
 
     out = []
     for (mode, matid), meshes in meshes_by_mat.items():
+        if all(isinstance(m, ArrayMesh) for m in meshes):
+            out.append(merge_array_meshes(meshes))
+            continue
         vs = array('f')
         ns = array('f')
         uvs = array('f')
@@ -46,13 +176,109 @@ def optimise_model(model):
     model.meshes = out
 
 
+def _compile_obj(args):
+    """Load an OBJ file in a worker process and return it packed."""
+    filename, swapyz, cache = args
+    loader = ObjFileLoader(cache=cache)
+    model = loader.load_obj(filename, swapyz)
+    return pack_model(filename, model, loader.mtl_loader, swapyz)
+
+
 class ObjFileLoader(object):
-    """Load models from Wavefront .obj files."""
-    def __init__(self):
+    """Load models from Wavefront .obj files.
+
+    :param compact: If True, load meshes as
+                    :py:class:`~wasabisg.model.ArrayMesh` objects, which
+                    use much less memory and are uploaded to the GPU
+                    without conversion.
+    :param cache: A :py:class:`~wasabisg.loaders.modelcache.ModelCache` in
+                  which to store compiled versions of the models loaded,
+                  or None to parse the .obj files every time.
+    :param processes: The number of worker processes used by
+                      :py:meth:`load_objs`, or None to use one per CPU.
+                      The default, 1, loads files in this process. On
+                      platforms that spawn rather than fork worker
+                      processes, the main script must be guarded by
+                      ``if __name__ == '__main__'`` to load in parallel.
+
+    """
+    def __init__(self, compact=False, cache=None, processes=1):
         self.mtl_loader = MtlFileLoader()
+        self.compact = compact
+        self.cache = cache
+        self.processes = processes
 
     def load_obj(self, filename, swapyz=False):
         """Load a Wavefront OBJ file and return a Model."""
+        if self.cache:
+            model = self.cache.load(filename, self, swapyz)
+            if model is not None:
+                return model
+
+        with open(filename, 'r') as f:
+            data = f.read()
+
+        meshes = self._parse_obj_fast(data, filename, swapyz)
+        if meshes is None:
+            meshes = self._parse_obj(data.splitlines(), filename, swapyz)
+
+        model = Model(name=filename, meshes=meshes)
+        optimise_model(model)
+        if self.cache:
+            try:
+                self.cache.save(filename, model, self, swapyz)
+            except (IOError, OSError):
+                # The cache may not be writable; carry on without it
+                pass
+        if self.compact:
+            compact_model(model)
+        return model
+
+    def load_objs(self, filenames, swapyz=False):
+        """Load several Wavefront OBJ files and return a list of Models.
+
+        If the loader was given more than one process, the files are parsed
+        in parallel in a pool of worker processes, which pass the vertex
+        data back as arrays. Files that are in the cache are loaded
+        directly.
+
+        """
+        processes = self.processes or cpu_count()
+        if processes == 1 or len(filenames) < 2:
+            return [self.load_obj(f, swapyz) for f in filenames]
+
+        models = [None] * len(filenames)
+        todo = []
+        for i, f in enumerate(filenames):
+            if self.cache:
+                models[i] = self.cache.load(f, self, swapyz)
+            if models[i] is None:
+                todo.append(i)
+
+        if not todo:
+            return models
+
+        pool = Pool(min(processes, len(todo)))
+        try:
+            results = pool.map(
+                _compile_obj,
+                [(filenames[i], swapyz, self.cache) for i in todo],
+                chunksize=1
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+        for i, (header, arrays) in zip(todo, results):
+            models[i] = unpack_model(filenames[i], header, arrays, self)
+        return models
+
+    def _parse_obj(self, lines, filename, swapyz=False):
+        """Parse the lines of an OBJ file into a list of Meshes.
+
+        This handles any file that the fast path rejects.
+
+        """
 
         mode = GL_TRIANGLES
 
@@ -70,7 +296,7 @@ class ObjFileLoader(object):
         material = None
         name = None
 
-        for line in open(filename, "r"):
+        for line in lines:
             if line.startswith('#'):
                 continue
 
@@ -161,10 +387,123 @@ class ObjFileLoader(object):
                 indices=indices,
                 material=material,
             ))
+        return meshes
+
+    def _parse_obj_fast(self, data, filename, swapyz=False):
+        """Parse an OBJ file into a list of Meshes using NumPy.
+
+        Vertex attributes and faces are parsed in bulk rather than line by
+        line, and vertices are deduplicated with array operations. The
+        Meshes are identical to those produced by _parse_obj().
+
+        Return None if the file uses a feature that the fast path does not
+        support, such as faces with differing numbers of corners.
+
+        """
+        if '\r' in data:
+            data = data.replace('\r', '')
+        if '\t' in data:
+            data = data.replace('\t', ' ')
+        if data.startswith(' ') or '\n ' in data:
+            # Indented statements are left to the slow path
+            return None
+        lines = data.split('\n')
+
+        # Classify the lines by their first three characters
+        chars = np.frombuffer(data + '\0\0\0', dtype=np.uint8)
+        starts = np.flatnonzero(chars == 10) + 1
+        starts = np.concatenate([[0], starts])
+        heads = chars[starts], chars[starts + 1], chars[starts + 2]
+
+        vertices = _parse_floats(
+            _select(lines, _statements(heads, 'v')), 'v', (3,)
+        )
+        normals = _parse_floats(
+            _select(lines, _statements(heads, 'vn')), 'vn', (3,)
+        )
+        texcoords = _parse_floats(
+            _select(lines, _statements(heads, 'vt')), 'vt', (2, 3)
+        )
+        if vertices is None or normals is None or texcoords is None:
+            return None
+        texcoords = texcoords[:, :2]
+        if swapyz:
+            vertices = vertices[:, [0, 2, 1]]
+            normals = normals[:, [0, 2, 1]]
+
+        # Split the faces into chunks separated by the statements that
+        # affect how they are grouped
+        candidates = np.flatnonzero(
+            (heads[0] == ord('u')) | (heads[0] == ord('m')) |
+            ((heads[0] == ord('o')) & (heads[1] == ord(' ')))
+        )
+        controls = []
+        for i in candidates.tolist():
+            values = lines[i].split()
+            if values[0] in _CONTROL_STATEMENTS:
+                if len(values) < 2:
+                    return None
+                controls.append((i, values[0], values[1]))
+
+        face_lines = _statements(heads, 'f')
+        bounds = np.searchsorted(
+            face_lines, [i for i, cmd, arg in controls] + [len(lines)]
+        )
 
-        model = Model(name=filename, meshes=meshes)
-        optimise_model(model)
-        return model
+        mode = GL_TRIANGLES
+        facegroups = []
+        faces = []
+        material = None
+        name = None
+        start = 0
+        for end, (_, cmd, arg) in zip(bounds, controls + [(0, None, None)]):
+            chunk = _parse_faces(_select(lines, face_lines[start:end]))
+            if chunk is None:
+                return None
+            if len(chunk):
+                if chunk.shape[1] == 4:
+                    mode = GL_QUADS
+                faces.append(chunk)
+            start = end
+
+            if cmd in ('usemtl', 'usemat'):
+                if faces and material:
+                    facegroups.append((faces, material, name))
+                    faces = []
+                material = self.mtl_loader.get_material(arg)
+            elif cmd == 'mtllib':
+                self.mtl_loader.load_materials(
+                    os.path.join(os.path.dirname(filename), arg)
+                )
+            elif cmd == 'o':
+                name = arg
+
+        if faces and material:
+            facegroups.append((faces, material, name))
+
+        meshes = []
+        for faces, material, name in facegroups:
+            # Corners as (vertex, normal, texcoord) index triples
+            corners = np.concatenate(
+                [f.reshape(-1, 3) for f in faces]
+            )
+            unique, indices = _dedup_rows(corners)
+            v, n, uv = unique.T
+            meshes.append(Mesh(
+                name=name,
+                mode=mode,
+                vertices=vertices[v - 1].ravel().tolist(),
+                normals=(
+                    normals[n - 1].ravel().tolist() if len(normals) else []
+                ),
+                texcoords=(
+                    texcoords[uv - 1].ravel().tolist()
+                    if len(texcoords) else []
+                ),
+                indices=indices.tolist(),
+                material=material,
+            ))
+        return meshes
 
     def load_model(self, name):
         return self.load_obj(os.path.join(ANIMDIR, name + '.obj'))
@@ -178,7 +517,15 @@ class ObjFileLoader(object):
                        sequences={},
                        default=None,
                        next={},
-                       framerate=DEFAULT_FRAMERATE):
+                       framerate=DEFAULT_FRAMERATE,
+                       morph=False):
+        """Load the frames of an animation from a series of .obj files.
+
+        If morph is True, the frames must share topology, and are stored
+        compactly in a :py:class:`~wasabisg.morph.MorphModel`, which
+        interpolates smoothly between them.
+
+        """
         frames = sorted(self._get_frames(name))
         if not frames:
             raise ValueError(
@@ -186,20 +533,24 @@ class ObjFileLoader(object):
                     ANIMDIR, name
                 )
             )
-        models = [self.load_obj(f) for f in frames]
-        return AnimatedModel(
+        models = self.load_objs(frames)
+        anim = AnimatedModel(
             models,
             sequences=sequences,
             default=default,
             next=next,
             framerate=framerate
         )
+        if morph:
+            return MorphModel.from_animated_model(anim)
+        return anim
 
 
 class MtlFileLoader(object):
     def __init__(self):
         self.mtllibs = set()
         self.materials = {}
+        self.library_of = {}
 
     def get_material(self, name):
         """Get a loaded material."""
@@ -243,6 +594,11 @@ class MtlFileLoader(object):
         self.mtllibs.add(filename)
 
         for mtl in self._read_mtl(filename):
-            name = mtl['name']
             mtl['relpath'] = os.path.dirname(filename)
-            self.materials[name] = mtl
+            self.add_material(mtl, filename)
+
+    def add_material(self, mtl, library):
+        """Register a material that was loaded from the given library."""
+        name = mtl['name']
+        self.materials[name] = mtl
+        self.library_of[name] = library
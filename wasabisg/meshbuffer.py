@@ -0,0 +1,94 @@
+"""Vertex buffers for meshes stored in NumPy arrays."""
+from ctypes import c_void_p
+
+import numpy as np
+from OpenGL.GL import *
+
+
+INDEX_TYPES = {
+    np.dtype(np.uint16): GL_UNSIGNED_SHORT,
+    np.dtype(np.uint32): GL_UNSIGNED_INT,
+}
+
+
+class MeshBuffer(object):
+    """An interleaved vertex buffer and an index buffer.
+
+    This plays the part of a pyglet vertex list for an
+    :py:class:`~wasabisg.model.ArrayMesh`. The arrays are uploaded to the GPU
+    as they are, without conversion to Python lists.
+
+    :param data: A structured array of vertices, with position, normal and
+                 texcoord fields.
+    :param indices: A uint16 or uint32 array of indices.
+
+    The buffers are freed when the MeshBuffer is garbage collected.
+
+    """
+    vbo = ibo = None
+
+    def __init__(self, data, indices):
+        # Keep the arrays, so that they can be identified by id while the
+        # buffer exists
+        self.data = data
+        self.indices = indices
+        self.count = len(indices)
+        self.index_type = INDEX_TYPES[indices.dtype]
+        self.stride = data.dtype.itemsize
+        self.offsets = dict(
+            (name, data.dtype.fields[name][1])
+            for name in ('position', 'normal', 'texcoord')
+        )
+
+        self.vbo, self.ibo = (int(b) for b in glGenBuffers(2))
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        raw = data.view(np.uint8)
+        glBufferData(GL_ARRAY_BUFFER, raw.nbytes, raw, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glBufferData(
+            GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW
+        )
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+
+    def bind(self):
+        """Bind the buffers and set up the vertex array pointers."""
+        stride = self.stride
+        offsets = self.offsets
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glVertexPointer(3, GL_FLOAT, stride, c_void_p(offsets['position']))
+        glEnableClientState(GL_NORMAL_ARRAY)
+        glNormalPointer(GL_FLOAT, stride, c_void_p(offsets['normal']))
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, stride, c_void_p(offsets['texcoord']))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+
+    def unbind(self):
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+        glPopClientAttrib()
+
+    def draw(self, mode):
+        """Draw the mesh."""
+        self.bind()
+        glDrawElements(mode, self.count, self.index_type, c_void_p(0))
+        self.unbind()
+
+    def draw_instanced(self, mode, count):
+        """Draw count instances of the mesh."""
+        self.bind()
+        glDrawElementsInstanced(
+            mode, self.count, self.index_type, c_void_p(0), count
+        )
+        self.unbind()
+
+    def delete(self):
+        """Free the buffers."""
+        if self.vbo is not None:
+            glDeleteBuffers(2, [self.vbo, self.ibo])
+            self.vbo = self.ibo = None
+
+    def __del__(self):
+        self.delete()
@@ -7,14 +7,19 @@ A mesh consists of some geometry and an associated material.
 A material is a dictionary of parameters, some of which may be textures.
 
 """
+import os
 from weakref import WeakValueDictionary
+from collections import OrderedDict
 from OpenGL.GL import GL_QUADS, GL_TRIANGLES
 from copy import copy
+import numpy as np
 import pyglet
 import pyglet.graphics
 import pyglet.image
 import pyglet.resource
 
+from .bounds import BoundingBox, union_bounds
+
 
 DEFAULT_FRAMERATE = 40
 
@@ -32,6 +37,26 @@ class Mesh(object):
         self.material = material
         self.indices = indices
 
+    def get_bounds(self):
+        """Get the BoundingBox of the mesh's vertices.
+
+        The bounds are computed the first time this is called and cached; if
+        you modify the vertices you must call invalidate_bounds().
+
+        """
+        try:
+            return self._bounds
+        except AttributeError:
+            if len(self.vertices):
+                self._bounds = BoundingBox.from_vertices(self.vertices)
+            else:
+                self._bounds = None
+            return self._bounds
+
+    def invalidate_bounds(self):
+        """Discard the cached bounds, eg. after the vertices were changed."""
+        self.__dict__.pop('_bounds', None)
+
     def inside_out(self):
         """Return a copy of this mesh that is inside out.
 
@@ -94,13 +119,225 @@ class Mesh(object):
         """Create a copy of this mesh, eg. to apply a different material."""
         # TODO: share VBOs with original
         m = copy(self)
-        del m.list
+        m.__dict__.pop('list', None)
         return m
 
     def __repr__(self):
         return '<Mesh %s>' % self.name
 
 
+#: The layout of a vertex in an ArrayMesh
+VERTEX_DTYPE = np.dtype([
+    ('position', np.float32, 3),
+    ('normal', np.float32, 3),
+    ('texcoord', np.float32, 2),
+])
+
+
+def index_dtype(num_vertices):
+    """Get the smallest index type that can address num_vertices vertices."""
+    if num_vertices <= 1 << 16:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+
+# Buffers that have been uploaded for ArrayMeshes, keyed by the ids of their
+# arrays. Each buffer holds references to its arrays, so the ids are not
+# reused for different arrays while the buffer is alive, which is only while
+# a mesh uses it.
+_mesh_buffers = WeakValueDictionary()
+
+
+class ArrayMesh(Mesh):
+    """A Mesh stored compactly in NumPy arrays.
+
+    The vertex attributes are interleaved in a single structured array with
+    the dtype VERTEX_DTYPE, and the indices are stored as 16-bit integers if
+    possible, otherwise 32-bit. The arrays are uploaded directly to a vertex
+    buffer by :py:meth:`to_list`.
+
+    :param data: An array of vertices with dtype VERTEX_DTYPE.
+    :param indices: An array of indices into data.
+
+    """
+    def __init__(self, mode, data, indices, material, name=None):
+        self.name = name
+        self.mode = mode
+        self.data = data
+        self.indices = np.asarray(indices, dtype=index_dtype(len(data)))
+        self.material = material
+
+    @classmethod
+    def from_arrays(cls, mode, vertices, normals, texcoords, indices,
+                    material, name=None):
+        """Construct an ArrayMesh from flat sequences of vertex attributes.
+
+        normals and texcoords may be empty, in which case they are filled
+        with zeros.
+
+        """
+        vertices = np.asarray(vertices, dtype=np.float32).reshape(-1, 3)
+        data = np.zeros(len(vertices), dtype=VERTEX_DTYPE)
+        data['position'] = vertices
+        if len(normals):
+            data['normal'] = np.asarray(normals).reshape(-1, 3)
+        if len(texcoords):
+            data['texcoord'] = np.asarray(texcoords).reshape(-1, 2)
+        return cls(mode, data, indices, material, name=name)
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        """Convert a Mesh to an ArrayMesh."""
+        return cls.from_arrays(
+            mesh.mode, mesh.vertices, mesh.normals, mesh.texcoords,
+            mesh.indices, mesh.material, name=mesh.name
+        )
+
+    @property
+    def vertices(self):
+        return self.data['position'].ravel()
+
+    @property
+    def normals(self):
+        return self.data['normal'].ravel()
+
+    @property
+    def texcoords(self):
+        return self.data['texcoord'].ravel()
+
+    def get_bounds(self):
+        try:
+            return self._bounds
+        except AttributeError:
+            if len(self.data):
+                p = self.data['position']
+                self._bounds = BoundingBox(p.min(axis=0), p.max(axis=0))
+            else:
+                self._bounds = None
+            return self._bounds
+
+    def inside_out(self):
+        if self.mode == GL_QUADS:
+            batch = 4
+        elif self.mode == GL_TRIANGLES:
+            batch = 3
+        else:
+            raise ValueError(
+                "Cannot invert mesh with drawing mode %s" % self.mode
+            )
+        data = self.data.copy()
+        data['normal'] *= -1
+        indices = self.indices.reshape(-1, batch)[:, ::-1].ravel()
+        return ArrayMesh(
+            self.mode, data, indices, self.material, name=self.name
+        )
+
+    def transformed(self, matrix):
+        """Return a copy of this mesh transformed by a 4x4 NumPy matrix.
+
+        Normals are transformed by the inverse transpose of the matrix, and
+        the winding order is reversed if the matrix is a reflection.
+
+        """
+        data = self.data.copy()
+        m = np.asarray(matrix, dtype=np.float64)
+        linear = m[:3, :3]
+        data['position'] = self.data['position'].dot(linear.T) + m[:3, 3]
+        normals = self.data['normal'].dot(np.linalg.inv(linear))
+        lengths = np.sqrt((normals * normals).sum(axis=1))
+        lengths[lengths == 0] = 1
+        data['normal'] = normals / lengths[:, np.newaxis]
+
+        indices = self.indices
+        if np.linalg.det(linear) < 0:
+            batch = 4 if self.mode == GL_QUADS else 3
+            indices = indices.reshape(-1, batch)[:, ::-1].ravel()
+        return ArrayMesh(
+            self.mode, data, indices, self.material, name=self.name
+        )
+
+    def to_list(self, batch=None, group=None):
+        """Upload the mesh to a MeshBuffer.
+
+        The buffer is not part of the pyglet batch, and must be drawn
+        separately. Meshes that share the same data and index arrays share
+        the same buffer.
+
+        """
+        from .meshbuffer import MeshBuffer
+        key = (id(self.data), id(self.indices))
+        buf = _mesh_buffers.get(key)
+        if buf is None:
+            buf = _mesh_buffers[key] = MeshBuffer(self.data, self.indices)
+        self.list = buf
+        return self.list
+
+    def __repr__(self):
+        return '<ArrayMesh %s>' % self.name
+
+
+def merge_array_meshes(meshes):
+    """Combine ArrayMeshes with the same mode and material into one."""
+    if len(meshes) == 1:
+        return meshes[0]
+    offsets = np.cumsum([0] + [len(m.data) for m in meshes[:-1]])
+    return ArrayMesh(
+        mode=meshes[0].mode,
+        data=np.concatenate([m.data for m in meshes]),
+        indices=np.concatenate([
+            m.indices.astype(np.uint32) + off
+            for m, off in zip(meshes, offsets)
+        ]),
+        material=meshes[0].material,
+        name=meshes[0].name
+    )
+
+
+def compact_model(model):
+    """Convert the meshes of a model to ArrayMeshes, in place."""
+    model.meshes = [
+        m if isinstance(m, ArrayMesh) else ArrayMesh.from_mesh(m)
+        for m in model.meshes
+    ]
+    return model
+
+
+class Geometry(object):
+    """The vertex and index arrays of an ArrayMesh, shared via a cache."""
+    def __init__(self, data, indices):
+        self.data = data
+        self.indices = indices
+        # The arrays are shared, so must not be modified in place
+        data.flags.writeable = False
+        indices.flags.writeable = False
+
+
+class GeometryCache(object):
+    """Share generated geometry between meshes with the same parameters.
+
+    Entries are kept only as long as a mesh holds a reference to the
+    Geometry.
+
+    """
+    def __init__(self):
+        self.entries = WeakValueDictionary()
+
+    def get(self, key, build):
+        """Get the Geometry for key, calling build() to create it if needed.
+
+        build should return a pair of data and index arrays.
+
+        """
+        try:
+            return self.entries[key]
+        except KeyError:
+            geometry = self.entries[key] = Geometry(*build())
+            return geometry
+
+    def clear(self):
+        self.entries.clear()
+
+
 class Model(object):
     def __init__(self, meshes=[], name=None):
         self.name = name
@@ -123,6 +360,10 @@ class Model(object):
     def update(self, dt):
         pass
 
+    def get_bounds(self):
+        """Get the BoundingBox of all meshes in the model."""
+        return union_bounds(m.get_bounds() for m in self.meshes)
+
     def to_batch(self):
         # This is renderer-specific and belongs elsewhere
         return self.batch
@@ -136,8 +377,33 @@ class Model(object):
 #            self.batch.draw()
 
 
+def sequence_frames(model, name):
+    """Get the frame numbers of a named sequence of an animated model.
+
+    The name 'all' plays every frame, unless the model defines a sequence
+    with that name.
+
+    """
+    try:
+        return model.sequences[name]
+    except KeyError:
+        if name == 'all':
+            return range(model.num_frames)
+        raise
+
+
 class AnimatedModelInstance(object):
-    """Track the current frame for an animated model."""
+    """Track the current frame for an animated model.
+
+    An instance may be added to an
+    :py:class:`~wasabisg.animation.AnimationClock`, which then holds its
+    playback state and advances it together with many other instances; in
+    that case update() does nothing.
+
+    """
+    clock = None
+    slot = None
+
     def __init__(self, model):
         self.model = model
         if self.model.default:
@@ -145,18 +411,55 @@ class AnimatedModelInstance(object):
         else:
             self.play_all()
 
+    @property
+    def t(self):
+        if self.clock is None:
+            return self._t
+        return float(self.clock.t[self.slot])
+
+    @t.setter
+    def t(self, t):
+        if self.clock is None:
+            self._t = t
+        else:
+            self.clock.t[self.slot] = t
+
+    @property
+    def currentframe(self):
+        if self.clock is None:
+            return self._currentframe
+        return int(self.clock.frame[self.slot])
+
+    @currentframe.setter
+    def currentframe(self, frame):
+        if self.clock is None:
+            self._currentframe = frame
+        else:
+            self.clock.frame[self.slot] = frame
+
+    @property
+    def anim(self):
+        if self.clock is None:
+            return self._anim
+        return self.clock.sequence_frames(self.slot)
+
+    @property
+    def playing(self):
+        if self.clock is None:
+            return self._playing
+        return self.clock.sequence_name(self.slot)
+
     def play_all(self):
-        self.anim = range(len(self.model.frames))
-        self.playing = 'all'
-        self.currentframe = 0
-        self.t = 0.0
-        self.end = len(self.anim)
+        self.play('all')
 
     def play(self, name):
-        self.anim = self.model.sequences[name]
-        self.playing = name
-        self.currentframe = self.anim[0]
-        self.t = 0.0
+        if self.clock is not None:
+            self.clock.play(self, name)
+            return
+        self._anim = sequence_frames(self.model, name)
+        self._playing = name
+        self._currentframe = self._anim[0]
+        self._t = 0.0
 
     def next_animation(self):
         """cue to the next animation, or restart the current one."""
@@ -169,11 +472,17 @@ class AnimatedModelInstance(object):
 
     def update(self, dt):
         """calculate correct frame to show"""
-        self.t += dt * self.model.framerate
-        if self.t >= len(self.anim):
+        if self.clock is not None:
+            # The clock advances all its instances at once
+            return
+        self._t += dt * self.model.framerate
+        if self._t >= len(self._anim):
             self.next_animation()
         else:
-            self.currentframe = self.anim[int(self.t)]
+            self._currentframe = self._anim[int(self._t)]
+
+    def get_bounds(self):
+        return self.model.get_bounds()
 
     def draw(self):
         self.model.frames[self.currentframe].draw()
@@ -190,6 +499,18 @@ class AnimatedModel(object):
         self.next = next
         self.framerate = float(framerate)
 
+    @property
+    def num_frames(self):
+        return len(self.frames)
+
+    def get_bounds(self):
+        """Get a BoundingBox that contains every frame of the animation."""
+        try:
+            return self._bounds
+        except AttributeError:
+            self._bounds = union_bounds(f.get_bounds() for f in self.frames)
+            return self._bounds
+
     def copy(self):
         """Create a copy of the model that shares vertex data only.
 
@@ -231,16 +552,128 @@ class AnimatedModel(object):
 
 
 class TextureLoader(object):
-    def __init__(self):
-        self.cache = WeakValueDictionary()
+    """Load textures, sharing them between all the materials that use them.
+
+    Textures are cached by the resolved path of their image, and kept on the
+    GPU until evicted. If a budget is given, the least recently requested
+    textures are evicted whenever the estimated video memory used by the
+    cached textures exceeds it; materials using an evicted texture will load
+    it again when next drawn.
 
-    def load_texture(self, name):
+    The number of cache hits, misses and evictions, and the estimated
+    number of bytes of video memory in use, are available as attributes.
+
+    :param budget: The maximum estimated video memory to use for textures,
+                   in bytes, or None for no limit.
+
+    """
+    def __init__(self, budget=None):
+        self.budget = budget
+        # Decoded images that have not yet been uploaded
+        self.images = WeakValueDictionary()
+        # Resolved path -> (texture, size in bytes, materials using it), in
+        # order of least recent use
+        self.textures = OrderedDict()
+        self.texture_keys = {}
+        self.vram = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def resolve(self, name):
+        """Get the key under which the texture for a resource is cached."""
+        try:
+            location = pyglet.resource.location(name)
+        except pyglet.resource.ResourceNotFoundException:
+            return name
+        path = getattr(location, 'path', None)
+        if path is None:
+            return name
+        return os.path.normpath(os.path.abspath(os.path.join(path, name)))
+
+    def load_image(self, name):
+        """Load and decode an image, without uploading it to the GPU.
+
+        This does not use OpenGL, so it may be called from a background
+        thread.
+
+        """
+        key = self.resolve(name)
         try:
-            return self.cache[name]
+            return self.images[key]
         except KeyError:
             image = pyglet.image.load(name, pyglet.resource.file(name))
-            self.cache[name] = image
-            return image.get_mipmapped_texture()
+            self.images[key] = image
+            return image
+
+    def load_texture(self, name, user=None):
+        """Get the texture for the named image resource.
+
+        :param user: The Material that will use the texture; it is notified
+                     if the texture is evicted.
+
+        """
+        key = self.resolve(name)
+        try:
+            entry = self.textures.pop(key)
+        except KeyError:
+            self.misses += 1
+            tex = self.load_image(name).get_mipmapped_texture()
+            # Include a third for the mipmaps
+            size = tex.width * tex.height * 4 * 4 // 3
+            entry = (tex, size, WeakValueDictionary())
+            self.texture_keys[id(tex)] = key
+            self.vram += size
+        else:
+            self.hits += 1
+        self.textures[key] = entry
+        if user is not None:
+            # Materials are dicts and so unhashable; key them by id
+            entry[2][id(user)] = user
+        self.evict()
+        return entry[0]
+
+    def touch(self, texture):
+        """Mark a cached texture as recently used."""
+        key = self.texture_keys.get(id(texture))
+        if key is not None:
+            self.textures[key] = self.textures.pop(key)
+
+    def add_user(self, texture, user):
+        """Notify the Material user too if a cached texture is evicted.
+
+        Textures that are not in the cache, such as atlas pages, are ignored.
+
+        """
+        key = self.texture_keys.get(id(texture))
+        if key is not None:
+            self.textures[key][2][id(user)] = user
+
+    def evict(self):
+        """Evict the least recently used textures until within budget.
+
+        The most recently requested texture is never evicted.
+
+        """
+        if self.budget is None:
+            return
+        while self.vram > self.budget and len(self.textures) > 1:
+            self.evict_oldest()
+
+    def evict_oldest(self):
+        """Evict the least recently used texture."""
+        key, (tex, size, users) = self.textures.popitem(last=False)
+        del self.texture_keys[id(tex)]
+        for mtl in users.values():
+            mtl.forget_texture(tex)
+        tex.delete()
+        self.vram -= size
+        self.evictions += 1
+
+    def clear(self):
+        """Evict all textures."""
+        while self.textures:
+            self.evict_oldest()
 
 
 class Material(dict):
@@ -255,23 +688,86 @@ class Material(dict):
     def get_texture(self, groupname):
         k = 'tex_' + groupname
         try:
-            return self[k]
+            tex = self[k]
         except KeyError:
-            tex = self.loader.load_texture(self[groupname])
+            tex = self.loader.load_texture(self[groupname], user=self)
             self[k] = tex
-            return tex
+        else:
+            self.loader.touch(tex)
+        return tex
+
+    def touch_textures(self):
+        """Mark the textures this material has loaded as recently used."""
+        for k, v in self.items():
+            if k.startswith('tex_'):
+                self.loader.touch(v)
+
+    def forget_texture(self, texture):
+        """Drop any references to texture, eg. because it was evicted."""
+        for k, v in self.items():
+            if k.startswith('tex_') and v is texture:
+                dict.__delitem__(self, k)
+        self._modified()
+
+    @property
+    def packed(self):
+        """A cache of this material's uniform values, packed by each shader.
+
+        This is cleared whenever the material is modified.
+
+        """
+        try:
+            return self.__dict__['_packed']
+        except KeyError:
+            packed = self._packed = {}
+            return packed
 
     def __setitem__(self, key, value):
         dict.__setitem__(self, key, value)
+        self._modified()
         if key.startswith('map_'):
             tk = 'tex_' + key
             if tk in self:
                 del(self[tk])
                 self.get_texture(key)
 
+    def _modified(self):
+        """Discard the packed values, as the material has changed."""
+        self.__dict__.pop('_packed', None)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._modified()
+
+    def clear(self):
+        dict.clear(self)
+        self._modified()
+
+    def pop(self, *args):
+        self._modified()
+        return dict.pop(self, *args)
+
+    def popitem(self):
+        self._modified()
+        return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        dict.update(self, *args, **kwargs)
+        self._modified()
+
     def copy(self):
         m = Material()
         m.update(self)
+        m.loader = self.loader
+        # The copy shares our textures, so must also forget them if evicted
+        for k, v in m.items():
+            if k.startswith('tex_'):
+                self.loader.add_user(v, m)
         return m
 
     def create_group(self, parent=None):
@@ -0,0 +1,363 @@
+"""Compact vertex animation, interpolated between frames on the GPU.
+
+An :py:class:`~wasabisg.model.AnimatedModel` stores every frame as a
+complete model, with its own vertex buffers, and draws whichever frame is
+current. When every frame has the same topology, as is the case when the
+frames are exported from one animated mesh, a :py:class:`MorphModel` stores
+the indices and texture coordinates once, and for each frame just the
+vertex positions and normals. These can be quantised to 16-bit positions and
+8-bit normals, so each vertex costs 12 bytes per frame rather than 32 bytes
+plus a copy of the indices.
+
+All frames are uploaded to a single vertex buffer. When drawn with a shader
+whose vertex shader is built from ``wasabisg.renderer.LIGHTING_VERT``, the
+two frames either side of the current time are passed to the vertex shader,
+which blends between them, so the animation is smooth at any framerate.
+This is the case for the lighting shaders of the accumulation and tiled
+renderers and the G-buffer shader of the deferred renderer. With other
+shaders, such as the instanced shaders or custom node shaders, or with no
+shader, the frames are blended on the CPU and streamed to the GPU each
+time the mesh is drawn.
+
+"""
+from ctypes import c_void_p
+
+import numpy as np
+from OpenGL.GL import *
+
+from . import shader as shadermod
+from .shader import MaterialGroup
+from .model import ArrayMesh, AnimatedModelInstance, DEFAULT_FRAMERATE
+from .meshbuffer import INDEX_TYPES
+from .bounds import BoundingBox, union_bounds
+
+
+# Per-frame vertex layouts. Quantised vertices are padded to a multiple of
+# 4 bytes.
+FRAME_DTYPE = np.dtype([
+    ('position', np.float32, 3),
+    ('normal', np.float32, 3),
+])
+QUANTISED_FRAME_DTYPE = np.dtype([
+    ('position', np.int16, 4),
+    ('normal', np.int8, 4),
+])
+
+# The range of quantised positions and normals
+POSITION_RANGE = 32767
+NORMAL_RANGE = 127
+
+GL_TYPES = {
+    np.dtype(np.float32): GL_FLOAT,
+    np.dtype(np.int16): GL_SHORT,
+    np.dtype(np.int8): GL_BYTE,
+}
+
+
+class MorphMesh(object):
+    """The geometry of one mesh in every frame of a vertex animation.
+
+    :param frames: A structured array of shape (num_frames, num_vertices)
+                   with dtype FRAME_DTYPE or QUANTISED_FRAME_DTYPE.
+    :param offset, scale: For quantised frames, the model space position of
+                          a vertex is offset + scale * position.
+
+    """
+    def __init__(self, mode, indices, texcoords, frames, material,
+                 name=None, offset=(0, 0, 0), scale=1.0):
+        self.mode = mode
+        self.indices = indices
+        self.texcoords = np.asarray(texcoords, dtype=np.float32)
+        self.frames = frames
+        self.material = material
+        self.name = name
+        self.offset = np.asarray(offset, dtype=np.float32)
+        self.scale = float(scale)
+        self.vbo = None
+
+    @classmethod
+    def from_frames(cls, meshes, quantise=True):
+        """Construct a MorphMesh from one mesh per frame.
+
+        The meshes must all have the same indices and texture coordinates.
+
+        """
+        meshes = [
+            m if isinstance(m, ArrayMesh) else ArrayMesh.from_mesh(m)
+            for m in meshes
+        ]
+        first = meshes[0]
+        for m in meshes[1:]:
+            if m.mode != first.mode or len(m.data) != len(first.data) or \
+                    not np.array_equal(m.indices, first.indices):
+                raise ValueError(
+                    "Frames of mesh %s have different topology" % first.name
+                )
+            if not np.allclose(m.data['texcoord'], first.data['texcoord']):
+                raise ValueError(
+                    "Frames of mesh %s have different texture "
+                    "coordinates" % first.name
+                )
+
+        positions = np.array([m.data['position'] for m in meshes])
+        normals = np.array([m.data['normal'] for m in meshes])
+        shape = positions.shape[:2]
+        offset = (0, 0, 0)
+        scale = 1.0
+        if quantise:
+            frames = np.zeros(shape, dtype=QUANTISED_FRAME_DTYPE)
+            if positions.size:
+                lo = positions.min(axis=(0, 1))
+                hi = positions.max(axis=(0, 1))
+                offset = 0.5 * (lo + hi)
+                scale = max((hi - lo).max() * 0.5 / POSITION_RANGE, 1e-12)
+            q = np.round((positions - offset) / scale)
+            frames['position'][..., :3] = q
+            frames['normal'][..., :3] = np.round(
+                np.clip(normals, -1, 1) * NORMAL_RANGE
+            )
+        else:
+            frames = np.zeros(shape, dtype=FRAME_DTYPE)
+            frames['position'] = positions
+            frames['normal'] = normals
+        return cls(
+            first.mode, first.indices, first.data['texcoord'].copy(), frames,
+            first.material, name=first.name, offset=offset, scale=scale
+        )
+
+    @property
+    def quantised(self):
+        return self.frames.dtype == QUANTISED_FRAME_DTYPE
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the geometry of all frames."""
+        return (
+            self.frames.nbytes + self.indices.nbytes + self.texcoords.nbytes
+        )
+
+    def frame(self, i):
+        """Get the model space positions and normals of frame i."""
+        return self.blend(i, i, 0.0)
+
+    def blend(self, a, b, t):
+        """Interpolate between frames a and b.
+
+        Return an array of model space positions and unit normals, with
+        dtype FRAME_DTYPE.
+
+        """
+        fa = self.frames[a]
+        fb = self.frames[b]
+        out = np.empty(len(fa), dtype=FRAME_DTYPE)
+        pa = fa['position'][:, :3].astype(np.float32)
+        pb = fb['position'][:, :3].astype(np.float32)
+        na = fa['normal'][:, :3].astype(np.float32)
+        nb = fb['normal'][:, :3].astype(np.float32)
+        p = pa + (pb - pa) * t
+        n = na + (nb - na) * t
+        if self.quantised:
+            p = p * self.scale + self.offset
+        lengths = np.sqrt((n * n).sum(axis=1))
+        lengths[lengths == 0] = 1
+        out['position'] = p
+        out['normal'] = n / lengths[:, np.newaxis]
+        return out
+
+    def get_bounds(self):
+        try:
+            return self._bounds
+        except AttributeError:
+            p = self.frames['position'][..., :3].reshape(-1, 3)
+            if not len(p):
+                self._bounds = None
+            else:
+                lo = p.min(axis=0) * self.scale + self.offset
+                hi = p.max(axis=0) * self.scale + self.offset
+                self._bounds = BoundingBox(lo, hi)
+            return self._bounds
+
+    def upload(self):
+        """Upload the frames, texture coordinates and indices to buffers."""
+        self.material.load_textures()
+        self.group = MaterialGroup(self.material)
+        self.vbo, self.uv_vbo, self.ibo, self.stream_vbo = (
+            int(b) for b in glGenBuffers(4)
+        )
+        for target, buf, data in (
+                (GL_ARRAY_BUFFER, self.vbo, self.frames.view(np.uint8)),
+                (GL_ARRAY_BUFFER, self.uv_vbo, self.texcoords),
+                (GL_ELEMENT_ARRAY_BUFFER, self.ibo, self.indices)):
+            glBindBuffer(target, buf)
+            glBufferData(target, data.nbytes, data, GL_STATIC_DRAW)
+            glBindBuffer(target, 0)
+
+    @staticmethod
+    def morph_locations(shader):
+        """Get the attribute locations for the next frame in shader.
+
+        Return None if the shader does not support blending frames.
+
+        """
+        if shader is None or shader.getUniformLocation('morph_blend') < 0:
+            return None
+        locs = (
+            shader.getAttribLocation('next_position'),
+            shader.getAttribLocation('next_normal'),
+        )
+        if min(locs) < 0:
+            return None
+        return locs
+
+    def draw(self, a, b, t):
+        """Draw the mesh, interpolated between frames a and b."""
+        if self.vbo is None:
+            self.upload()
+        shader = shadermod.activeshader
+        locs = self.morph_locations(shader)
+
+        self.group.set_state_recursive()
+        glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+        glEnableClientState(GL_VERTEX_ARRAY)
+        glEnableClientState(GL_NORMAL_ARRAY)
+        if locs:
+            # Pass both frames to the shader, in quantised units
+            dtype = self.frames.dtype
+            stride = dtype.itemsize
+            frame_size = self.frames.shape[1] * stride
+            ptype = GL_TYPES[dtype['position'].base]
+            ntype = GL_TYPES[dtype['normal'].base]
+            pos_off = dtype.fields['position'][1]
+            normal_off = dtype.fields['normal'][1]
+            glPushMatrix()
+            glTranslatef(*self.offset)
+            glScalef(self.scale, self.scale, self.scale)
+            glBindBuffer(GL_ARRAY_BUFFER, self.vbo)
+            base = a * frame_size
+            glVertexPointer(3, ptype, stride, c_void_p(base + pos_off))
+            glNormalPointer(ntype, stride, c_void_p(base + normal_off))
+            base = b * frame_size
+            next_pos, next_normal = locs
+            glEnableVertexAttribArray(next_pos)
+            glVertexAttribPointer(
+                next_pos, 3, ptype, GL_FALSE, stride,
+                c_void_p(base + pos_off)
+            )
+            glEnableVertexAttribArray(next_normal)
+            glVertexAttribPointer(
+                next_normal, 3, ntype, GL_TRUE, stride,
+                c_void_p(base + normal_off)
+            )
+            shader.uniformf('morph_blend', float(t))
+        else:
+            data = self.blend(a, b, t)
+            stride = FRAME_DTYPE.itemsize
+            glBindBuffer(GL_ARRAY_BUFFER, self.stream_vbo)
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+            glVertexPointer(3, GL_FLOAT, stride, c_void_p(0))
+            glNormalPointer(GL_FLOAT, stride, c_void_p(12))
+
+        glBindBuffer(GL_ARRAY_BUFFER, self.uv_vbo)
+        glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+        glTexCoordPointer(2, GL_FLOAT, 0, c_void_p(0))
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, self.ibo)
+        glDrawElements(
+            self.mode, len(self.indices), INDEX_TYPES[self.indices.dtype],
+            c_void_p(0)
+        )
+        glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        if locs:
+            shader.uniformf('morph_blend', 0.0)
+            glDisableVertexAttribArray(locs[0])
+            glDisableVertexAttribArray(locs[1])
+            glPopMatrix()
+        glPopClientAttrib()
+        self.group.unset_state_recursive()
+
+    def delete(self):
+        """Free the buffers."""
+        if self.vbo is not None:
+            glDeleteBuffers(
+                4, [self.vbo, self.uv_vbo, self.ibo, self.stream_vbo]
+            )
+            self.vbo = None
+
+
+class MorphModel(object):
+    """A vertex animation whose frames share topology.
+
+    Sequences are given as for :py:class:`~wasabisg.model.AnimatedModel`.
+
+    """
+    def __init__(self, meshes, num_frames, sequences={}, default=None,
+                 next={}, framerate=DEFAULT_FRAMERATE):
+        self.meshes = meshes
+        self.num_frames = num_frames
+        self.sequences = sequences
+        self.default = default
+        self.next = next
+        self.framerate = float(framerate)
+
+    @classmethod
+    def from_animated_model(cls, model, quantise=True):
+        """Convert an AnimatedModel whose frames share topology.
+
+        Raise ValueError if the frames differ other than in their vertex
+        positions and normals.
+
+        """
+        frames = model.frames
+        counts = set(len(f.meshes) for f in frames)
+        if len(counts) != 1:
+            raise ValueError("Frames have different numbers of meshes")
+        meshes = [
+            MorphMesh.from_frames([f.meshes[i] for f in frames], quantise)
+            for i in xrange(counts.pop())
+        ]
+        return cls(
+            meshes,
+            len(frames),
+            sequences=model.sequences,
+            default=model.default,
+            next=model.next,
+            framerate=model.framerate
+        )
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the geometry of all frames."""
+        return sum(m.nbytes for m in self.meshes)
+
+    def get_bounds(self):
+        """Get a BoundingBox that contains every frame of the animation."""
+        return union_bounds(m.get_bounds() for m in self.meshes)
+
+    def get_instance(self):
+        return MorphModelInstance(self)
+
+
+class MorphModelInstance(AnimatedModelInstance):
+    """Track the current time in a MorphModel's animation."""
+
+    def frame_pair(self):
+        """Get the frames either side of the current time.
+
+        Return the two frame numbers and the blend factor between them.
+
+        """
+        i = min(int(self.t), len(self.anim) - 1)
+        a = self.anim[i]
+        if i + 1 < len(self.anim):
+            b = self.anim[i + 1]
+        else:
+            # Blend into the animation that will play next
+            next = self.model.next.get(self.playing)
+            b = self.model.sequences[next][0] if next else self.anim[0]
+        return a, b, min(max(self.t - i, 0.0), 1.0)
+
+    def draw(self):
+        a, b, t = self.frame_pair()
+        for mesh in self.model.meshes:
+            mesh.draw(a, b, t)
@@ -1,8 +1,20 @@
 
-from OpenGL.GL import GL_QUADS, GL_QUAD_STRIP, GL_TRIANGLE_STRIP
+import numpy as np
+from OpenGL.GL import GL_QUADS, GL_TRIANGLES, GL_QUAD_STRIP, GL_TRIANGLE_STRIP
 from euclid import Point3, Vector3
 
-from .model import Mesh, Material
+from .model import (
+    Mesh, ArrayMesh, Material, GeometryCache, VERTEX_DTYPE, index_dtype
+)
+
+
+# Planes with the same parameters share their vertex and index arrays
+geometry_cache = GeometryCache()
+
+# The width in cells of the bands in which the cells of a Plane are drawn;
+# the vertices of two rows of a band must fit in a 32-vertex cache with a
+# little room to spare
+GRID_BAND = 14
 
 
 class Quad(Mesh):
@@ -60,12 +72,69 @@ class Quad(Mesh):
         return '<%s at 0x%x>' % (self.__class__.__name__, id(self))
 
 
-class Plane(Mesh):
+def plane_geometry(center, normal, size, divisions):
+    """Build the vertex and index arrays of a subdivided square."""
+    normal = Vector3(*normal).normalized()
+    up = Vector3(0, 1, 0)
+    x = up.cross(normal)
+    if x.magnitude_squared() < 1e-3:
+        up = Vector3(0, 0, 1)
+        x = up.cross(normal)
+
+    x = x.normalized()
+    y = x.cross(normal)
+
+    sx = np.array(tuple(x)) * float(size) / divisions
+    sy = np.array(tuple(y)) * float(size) / divisions
+
+    steps = np.arange(divisions + 1)
+    offsets = steps - divisions * 0.5
+    # Rows of vertices follow y, columns follow x
+    positions = (
+        np.array(center) +
+        offsets[:, np.newaxis, np.newaxis] * sy +
+        offsets[np.newaxis, :, np.newaxis] * sx
+    )
+    uv = np.empty((divisions + 1, divisions + 1, 2))
+    uv[..., 0] = steps / float(divisions)
+    uv[..., 1] = (steps / float(divisions))[:, np.newaxis]
+
+    data = np.zeros((divisions + 1) ** 2, dtype=VERTEX_DTYPE)
+    data['position'] = positions.reshape(-1, 3)
+    data['normal'] = tuple(normal)
+    data['texcoord'] = uv.reshape(-1, 2)
+
+    # Index of vertex (i, j) is j * (divisions + 1) + i
+    i = steps[:-1]
+    j = steps[:-1, np.newaxis] * (divisions + 1)
+    a = j + i
+    b = a + 1
+    c = b + divisions + 1
+    d = a + divisions + 1
+    cells = np.dstack([d, c, b, d, b, a]).reshape(-1, 6)
+
+    # Draw the cells in bands of columns, row by row within each band, so
+    # that the vertices shared with the previous row are still in the
+    # vertex cache
+    col = np.tile(i, divisions)
+    row = np.repeat(i, divisions)
+    order = np.lexsort((col, row, col // GRID_BAND))
+    indices = cells[order].astype(index_dtype(len(data))).ravel()
+    return data, indices
+
+
+class Plane(ArrayMesh):
     """Construct a single square mesh.
 
     If divisions == 1, then this will be a single quad, otherwise the quad
     will be subdivided that number of times in each direction. For example, if
-    divisions == 4 then the Plane mesh will consist of 16 squares.
+    divisions == 4 then the Plane mesh will consist of 16 squares. Each
+    square is drawn as two triangles, in an order that makes good use of
+    the vertex cache.
+
+    Planes with the same center, normal, size and divisions share their
+    vertex and index arrays, and their vertex buffers once prepared; only
+    their materials differ.
 
     """
 
@@ -79,54 +148,16 @@ class Plane(Mesh):
 
         material = material or Material(name='plane_material')
 
-        normal = normal.normalized()
-        up = Vector3(0, 1, 0)
-        x = up.cross(normal)
-        if x.magnitude_squared() < 1e-3:
-            up = Vector3(0, 0, 1)
-            x = up.cross(normal)
-
-        x = x.normalized()
-        y = x.cross(normal)
-
-        sx = x * float(size) / divisions
-        sy = y * float(size) / divisions
-
-        ns = []
-        uvs = []
-        vs = []
-
-        y = -sy * divisions * 0.5
-        for j in xrange(divisions + 1):
-            x = -sx * divisions * 0.5
-            v = j / float(divisions)
-            for i in xrange(divisions + 1):
-                vs.extend(center + x + y)
-                ns.extend(normal)
-                u = i / float(divisions)
-                uvs.extend((u, v))
-                x += sx
-            y += sy
-
-        indices = []
-
-        def idx(i, j):
-            indices.append(j * (divisions + 1) + i)
-
-        # TODO: Use quad strips and save some index memory
-        for j in xrange(divisions):
-            for i in xrange(divisions):
-                idx(i, j + 1)
-                idx(i + 1, j + 1)
-                idx(i + 1, j)
-                idx(i, j)
-
+        params = (
+            tuple(center)[:3], tuple(normal)[:3], float(size), divisions
+        )
+        self.geometry = geometry_cache.get(
+            params, lambda: plane_geometry(*params)
+        )
         super(Plane, self).__init__(
-            GL_QUADS,
-            vertices=vs,
-            normals=ns,
-            texcoords=uvs,
-            indices=indices,
+            GL_TRIANGLES,
+            data=self.geometry.data,
+            indices=self.geometry.indices,
             material=material,
             name=repr(self)
         )
@@ -1,8 +1,16 @@
+from collections import OrderedDict
+from ctypes import c_void_p
+
+import numpy as np
 from pyglet.graphics import Batch
 from OpenGL.GL import *
 
 from .shader import Shader, MaterialGroup
-from .lighting import Light, Sunlight, BaseLight
+from .lighting import Light, Sunlight, BaseLight, LightArray
+from .stats import RenderStats
+from .model import ArrayMesh
+from .skeletal import MAX_JOINTS
+from .renderqueue import RenderQueue
 
 
 class Renderer(object):
@@ -30,35 +38,114 @@ class RenderPass(object):
             self.group.unset_state_recursive()
 
 
-lighting_shader = Shader(
-    vert="""
+LIGHTING_VERT = """
 
 varying vec3 normal;
 varying vec3 pos; // position of the fragment in screen space
 varying vec2 uv;
 
+// The next frame of a vertex animation, and how far to blend towards it
+// (see wasabisg.morph); morph_blend is 0 for other meshes
+attribute vec3 next_position;
+attribute vec3 next_normal;
+uniform float morph_blend;
+
 //uniform mat4 inv_view;
 
 void main(void)
 {
-    vec4 a = gl_Vertex;
+    vec4 a = vec4(mix(gl_Vertex.xyz, next_position, morph_blend), 1.0);
     gl_Position = gl_ModelViewProjectionMatrix * a;
-    normal = (gl_NormalMatrix * gl_Normal).xyz;
+    normal = (gl_NormalMatrix * mix(gl_Normal, next_normal, morph_blend)).xyz;
     pos = (gl_ModelViewMatrix * a).xyz;
     uv = gl_MultiTexCoord0.st;
 }
-""",
-    frag="""
+"""
+
+#: A variant of LIGHTING_VERT for skinned meshes (see wasabisg.skeletal).
+#: The joint palette takes many uniforms, so it is only declared in this
+#: variant, which is bound just while a SkinnedMesh is drawn.
+SKINNED_LIGHTING_VERT = """
 
 varying vec3 normal;
-varying vec3 pos;
+varying vec3 pos; // position of the fragment in screen space
 varying vec2 uv;
 
-uniform int num_lights;
+// The joints influencing each vertex and their weights; each joint matrix
+// is given as its top three rows
+attribute vec4 joint_indices;
+attribute vec4 joint_weights;
+uniform vec4 joints[%d];
+
+void main(void)
+{
+    ivec4 j = ivec4(joint_indices) * 3;
+    vec4 w = joint_weights;
+    vec4 r0 = w.x * joints[j.x] + w.y * joints[j.y]
+            + w.z * joints[j.z] + w.w * joints[j.w];
+    vec4 r1 = w.x * joints[j.x + 1] + w.y * joints[j.y + 1]
+            + w.z * joints[j.z + 1] + w.w * joints[j.w + 1];
+    vec4 r2 = w.x * joints[j.x + 2] + w.y * joints[j.y + 2]
+            + w.z * joints[j.z + 2] + w.w * joints[j.w + 2];
+    vec4 a = vec4(dot(r0, gl_Vertex), dot(r1, gl_Vertex), dot(r2, gl_Vertex), 1.0);
+    vec3 n = vec3(dot(r0.xyz, gl_Normal), dot(r1.xyz, gl_Normal), dot(r2.xyz, gl_Normal));
+    gl_Position = gl_ModelViewProjectionMatrix * a;
+    normal = gl_NormalMatrix * n;
+    pos = (gl_ModelViewMatrix * a).xyz;
+    uv = gl_MultiTexCoord0.st;
+}
+""" % (3 * MAX_JOINTS)
+
+INSTANCED_LIGHTING_VERT = """
+
+attribute mat4 instance_matrix;
+
+varying vec3 normal;
+varying vec3 pos; // position of the fragment in screen space
+varying vec2 uv;
+
+void main(void)
+{
+    mat4 modelview = gl_ModelViewMatrix * instance_matrix;
+    vec4 a = modelview * gl_Vertex;
+    gl_Position = gl_ProjectionMatrix * a;
+    normal = (modelview * vec4(gl_Normal, 0.0)).xyz;
+    pos = a.xyz;
+    uv = gl_MultiTexCoord0.st;
+}
+"""
+
+#: Light data as plain uniform arrays
+LIGHT_UNIFORMS = """
 uniform vec4 colours[8];
 uniform vec4 positions[8];
 uniform float intensities[8];
 uniform float falloffs[8];
+
+float light_intensity(in int i) { return intensities[i]; }
+float light_falloff(in int i) { return falloffs[i]; }
+"""
+
+#: Light data in a uniform block, laid out as written by LightUniformBuffer
+LIGHT_BLOCK = """#extension GL_ARB_uniform_buffer_object : enable
+
+layout(std140) uniform Lights {
+    vec4 colours[8];
+    vec4 positions[8];
+    vec4 params[8];  // intensity, falloff
+};
+
+float light_intensity(in int i) { return params[i].x; }
+float light_falloff(in int i) { return params[i].y; }
+"""
+
+LIGHTING_FRAG_BODY = """
+
+varying vec3 normal;
+varying vec3 pos;
+varying vec2 uv;
+
+uniform int num_lights;
 uniform sampler2D diffuse_tex;
 uniform vec3 diffuse_colour;
 uniform vec4 specular;
@@ -70,7 +157,7 @@ uniform int illum;
 
 vec3 calc_light(in vec3 frag_normal, in int lnum, in vec3 diffuse) {
     vec4 light = positions[lnum];
-    float intensity = intensities[lnum];
+    float intensity = light_intensity(lnum);
     vec3 light_colour = colours[lnum].rgb;
 
     vec3 lightvec;
@@ -80,7 +167,7 @@ vec3 calc_light(in vec3 frag_normal, in int lnum, in vec3 diffuse) {
 
         // Use quadratic attenuation
         float lengthsq = dot(lightvec, lightvec);
-        intensity /= 1.0 + lengthsq * falloffs[lnum];
+        intensity /= 1.0 + lengthsq * light_falloff(lnum);
 
         lightvec = normalize(lightvec);
     } else {
@@ -125,22 +212,290 @@ void main (void) {
     gl_FragColor = vec4(colour.xyz, mapcolour.a * dissolve);
 }
 """
+
+LIGHTING_FRAG = LIGHT_UNIFORMS + LIGHTING_FRAG_BODY
+
+#: The uniform buffer binding point used for light data
+LIGHT_BLOCK_BINDING = 0
+
+
+def bind_lighting_material(shader):
+    """Bind material properties to the uniforms of a lighting shader."""
+    shader.bind_material_to_texture('map_Kd', 'diffuse_tex')
+    shader.bind_material_to_uniformf('Kd', 'diffuse_colour')
+    shader.bind_material_to_uniformf('Ks', 'specular')
+    shader.bind_material_to_uniformf('Ns', 'specular_exponent')
+    shader.bind_material_to_uniformf('d', 'dissolve')
+    shader.bind_material_to_uniformf('transmit', 'transmit')
+    shader.bind_material_to_uniformi('illum', 'illum')
+
+
+def uniform_buffers_supported():
+    """Return True if the OpenGL implementation supports uniform buffers."""
+    return bool(glGetUniformBlockIndex) and bool(glBindBufferRange)
+
+
+def make_lighting_shader(vert, name):
+    """Create a lighting shader.
+
+    If possible the shader reads light data from a uniform buffer, and has
+    its light_block attribute set to True; otherwise it falls back to plain
+    uniform arrays.
+
+    """
+    if uniform_buffers_supported():
+        shader = Shader(
+            vert=vert,
+            frag=LIGHT_BLOCK + LIGHTING_FRAG_BODY,
+            name=name
+        )
+        block = glGetUniformBlockIndex(shader.handle, 'Lights')
+        if shader.linked and block != GL_INVALID_INDEX:
+            glUniformBlockBinding(shader.handle, block, LIGHT_BLOCK_BINDING)
+            shader.light_block = True
+            bind_lighting_material(shader)
+            return shader
+    shader = Shader(
+        vert=vert,
+        frag=LIGHTING_FRAG,
+        name=name
+    )
+    shader.light_block = False
+    bind_lighting_material(shader)
+    return shader
+
+
+lighting_shader = make_lighting_shader(LIGHTING_VERT, 'lighting')
+lighting_shader.skinned_variant = make_lighting_shader(
+    SKINNED_LIGHTING_VERT, 'skinned lighting'
+)
+instanced_lighting_shader = make_lighting_shader(
+    INSTANCED_LIGHTING_VERT, 'instanced lighting'
 )
-lighting_shader.bind_material_to_texture('map_Kd', 'diffuse_tex')
-lighting_shader.bind_material_to_uniformf('Kd', 'diffuse_colour')
-lighting_shader.bind_material_to_uniformf('Ks', 'specular')
-lighting_shader.bind_material_to_uniformf('Ns', 'specular_exponent')
-lighting_shader.bind_material_to_uniformf('d', 'dissolve')
-lighting_shader.bind_material_to_uniformf('transmit', 'transmit')
-lighting_shader.bind_material_to_uniformi('illum', 'illum')
+
+
+class LightUniformBuffer(object):
+    """A uniform buffer holding the light data for several lighting passes.
+
+    The data for all passes is uploaded at once; each pass then binds its
+    range of the buffer.
+
+    """
+    #: The size of the Lights uniform block
+    BLOCK_SIZE = 3 * 8 * 16
+
+    def __init__(self):
+        self.buffer = None
+        align = int(glGetIntegerv(GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        self.stride = -(-self.BLOCK_SIZE // align) * align
+
+    def upload(self, blocks):
+        """Upload an array of blocks of shape (n, 3, 8, 4)."""
+        n = len(blocks)
+        data = np.zeros((n, self.stride // 4), dtype=np.float32)
+        data[:, :self.BLOCK_SIZE // 4] = blocks.reshape(n, -1)
+        if self.buffer is None:
+            self.buffer = glGenBuffers(1)
+        glBindBuffer(GL_UNIFORM_BUFFER, self.buffer)
+        glBufferData(GL_UNIFORM_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+        glBindBuffer(GL_UNIFORM_BUFFER, 0)
+
+    def bind(self, i):
+        """Bind the i'th block to the light data binding point."""
+        glBindBufferRange(
+            GL_UNIFORM_BUFFER, LIGHT_BLOCK_BINDING, self.buffer,
+            i * self.stride, self.BLOCK_SIZE
+        )
+
+    def __del__(self):
+        if self.buffer is not None:
+            glDeleteBuffers(1, [self.buffer])
+            self.buffer = None
+
+
+def draw_instanced(vertex_list, mode, count):
+    """Draw count instances of a pyglet IndexedVertexList.
+
+    This mirrors IndexedVertexDomain.draw(), but issues a single instanced
+    draw call.
+
+    """
+    if hasattr(vertex_list, 'draw_instanced'):
+        vertex_list.draw_instanced(mode, count)
+        return
+    domain = vertex_list.domain
+    glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+    for buffer, attributes in domain.buffer_attributes:
+        buffer.bind()
+        for attribute in attributes:
+            attribute.enable()
+            attribute.set_pointer(attribute.buffer.ptr)
+    domain.index_buffer.bind()
+    offset = (
+        domain.index_buffer.ptr +
+        vertex_list.index_start * domain.index_element_size
+    )
+    glDrawElementsInstanced(
+        mode,
+        vertex_list.index_count,
+        domain.index_gl_type,
+        c_void_p(offset),
+        count
+    )
+    domain.index_buffer.unbind()
+    for buffer, _ in domain.buffer_attributes:
+        buffer.unbind()
+    glPopClientAttrib()
+
+
+class InstanceBatch(object):
+    """A set of ModelNodes that share a Model, drawn with instancing.
+
+    The nodes' transformation matrices must already have been uploaded to the
+    instancer's buffer, starting at instance number offset.
+
+    """
+    def __init__(self, instancer, model, nodes, offset):
+        self.instancer = instancer
+        self.model = model
+        self.nodes = nodes
+        self.offset = offset
+
+    def is_transparent(self):
+        return False
+
+    def draw(self, camera):
+        instancer = self.instancer
+        shader = instancer.shader
+        loc = shader.getAttribLocation('instance_matrix')
+        count = len(self.nodes)
+
+        glBindBuffer(GL_ARRAY_BUFFER, instancer.buffer)
+        base = self.offset * 64
+        for i in range(4):
+            glEnableVertexAttribArray(loc + i)
+            glVertexAttribPointer(
+                loc + i, 4, GL_FLOAT, GL_FALSE, 64, c_void_p(base + 16 * i)
+            )
+            glVertexAttribDivisor(loc + i, 1)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        for mesh in self.model.meshes:
+            mesh.group.set_state_recursive()
+            draw_instanced(mesh.list, mesh.mode, count)
+            mesh.group.unset_state_recursive()
+        instancer.stats.draw_calls += len(self.model.meshes)
+
+        for i in range(4):
+            glVertexAttribDivisor(loc + i, 0)
+            glDisableVertexAttribArray(loc + i)
+
+
+class Instancer(object):
+    """Group ModelNodes that share a Model into InstanceBatches.
+
+    Only nodes with no pyglet group and no custom shader can be instanced,
+    and only if the model is a plain (not animated) Model that has been
+    prepared by the LightingAccumulationRenderer.
+
+    :param min_instances: The minimum number of nodes sharing a model for
+                          instancing to be used.
+
+    """
+    def __init__(self, shader=instanced_lighting_shader, min_instances=2):
+        self.shader = shader
+        self.min_instances = min_instances
+        self.buffer = None
+        self.stats = RenderStats()
+        # A TransformArray holding the scene's world matrices; if not set,
+        # the matrices are computed from the nodes passed to batch()
+        self.transforms = None
+
+    @staticmethod
+    def is_supported():
+        """Return True if the OpenGL implementation supports instancing."""
+        return (
+            bool(glDrawElementsInstanced) and
+            bool(glVertexAttribDivisor) and
+            instanced_lighting_shader.linked
+        )
+
+    def can_instance(self, node):
+        """Return True if node could be drawn as part of an InstanceBatch."""
+        if getattr(node, 'group', True) is not None:
+            return False
+        if hasattr(node, 'shader') or not hasattr(node, 'get_matrix'):
+            return False
+        model = getattr(node, 'model_instance', None)
+        meshes = getattr(model, 'meshes', None)
+        return bool(meshes) and all(hasattr(m, 'group') for m in meshes)
+
+    def batch(self, objects):
+        """Split objects into those that must be drawn individually and a list
+        of InstanceBatches.
+
+        The transformation matrices for all batches are uploaded in one go.
+
+        """
+        by_model = OrderedDict()
+        rest = []
+        for o in objects:
+            if self.can_instance(o):
+                by_model.setdefault(o.model_instance, []).append(o)
+            else:
+                rest.append(o)
+
+        batches = []
+        instanced = []
+        for model, nodes in by_model.iteritems():
+            if len(nodes) < self.min_instances:
+                rest.extend(nodes)
+                continue
+            batches.append(InstanceBatch(self, model, nodes, len(instanced)))
+            instanced.extend(nodes)
+
+        if instanced:
+            if self.transforms is not None:
+                data = self.transforms.get(instanced)
+            else:
+                data = np.array(
+                    [n.get_world_matrix()[:] for n in instanced],
+                    dtype=np.float32
+                )
+            if self.buffer is None:
+                self.buffer = glGenBuffers(1)
+            glBindBuffer(GL_ARRAY_BUFFER, self.buffer)
+            glBufferData(GL_ARRAY_BUFFER, data.nbytes, data, GL_STREAM_DRAW)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            self.stats.instanced_nodes += len(instanced)
+        return rest, batches
+
+    def __del__(self):
+        if self.buffer is not None:
+            glDeleteBuffers(1, [self.buffer])
+            self.buffer = None
 
 
 class LightingPass(object):
-    def __init__(self, ambient=(0, 0, 0, 1)):
+    def __init__(self, ambient=(0, 0, 0, 1), instancing=True):
         self.ambient = ambient
         self.currentviewport = None
         self.fbo = None
         self.lightbuf = self.depthbuf = None
+        self.stats = RenderStats()
+        if instancing and Instancer.is_supported():
+            self.instancer = Instancer()
+        else:
+            self.instancer = None
+        # A LightArray holding the scene's lights; if not set, one is built
+        # from the lights passed to render()
+        self.light_array = None
+        self.frame_lights = None
+        self.view_positions = None
+        if uniform_buffers_supported():
+            self.light_buffer = LightUniformBuffer()
+        else:
+            self.light_buffer = None
 
     def get_fbo(self, viewport):
         if viewport == self.currentviewport:
@@ -181,8 +536,37 @@ class LightingPass(object):
             "Framebuffer is not complete!"
         return self.fbo
 
+    def prepare_lights(self, camera, lights):
+        """Transform all lights into view space for this frame."""
+        array = self.light_array
+        if array is None:
+            array = LightArray(lights)
+        self.frame_lights = array
+        self.view_positions = array.view_positions(
+            camera.get_view_array()
+        )
+
+    def light_data(self, lights):
+        """Get the properties of lights as arrays.
+
+        Returns (positions, colours, intensities, falloffs, radii), where
+        positions are in view space. prepare_lights() must have been called
+        first.
+
+        """
+        array = self.frame_lights
+        idx = array.index(lights)
+        return (
+            self.view_positions[idx],
+            array.colours[idx],
+            array.intensities[idx],
+            array.falloffs[idx],
+            array.radii[idx],
+        )
+
     def render(self, camera, objects):
         lights = [o for o in objects if isinstance(o, BaseLight)]
+        self.prepare_lights(camera, lights)
         glPushAttrib(GL_ALL_ATTRIB_BITS)
         glClear(GL_DEPTH_BUFFER_BIT)
 
@@ -195,18 +579,100 @@ class LightingPass(object):
                 shader_objects.append(o)
             else:
                 standard_objects.append(o)
-        self.render_objects(camera, lights, standard_objects, shader=lighting_shader)
+        for ls, objs in self.assign_lights(lights, standard_objects):
+            if self.instancer:
+                self.instancer.stats = self.stats
+                objs, batches = self.instancer.batch(objs)
+            else:
+                batches = []
+            self.render_objects(camera, ls, objs, shader=lighting_shader)
+            if batches:
+                self.render_objects(
+                    camera, ls, batches, shader=self.instancer.shader
+                )
 
-        for o in shader_objects:
-            self.render_objects(camera, lights, [o], shader=o.shader)
+        for ls, objs in self.assign_lights(lights, shader_objects):
+            for o in objs:
+                self.render_objects(camera, ls, [o], shader=o.shader)
 
         glPopAttrib()
 
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LEQUAL)
 
+    def assign_lights(self, lights, objects):
+        """Work out which lights reach each object.
+
+        Lights with a finite radius (see Light.get_radius()) only affect the
+        objects whose bounds fall within that radius. Objects without bounds
+        are affected by every light.
+
+        Return a list of (lights, objects) pairs, grouping together objects
+        that are affected by the same lights.
+
+        """
+        if not objects:
+            return []
+
+        array = self.frame_lights
+        idx = array.index(lights)
+        radii = array.radii[idx]
+        local = np.flatnonzero(np.isfinite(radii))
+        if not len(local):
+            return [(lights, objects)]
+
+        bounds = [getattr(o, 'get_bounds', lambda: None)() for o in objects]
+        bounded = [i for i, b in enumerate(bounds) if b is not None]
+        affected = np.ones((len(objects), len(lights)), dtype=bool)
+        if bounded:
+            boxes = np.array([bounds[i].min + bounds[i].max for i in bounded])
+            centers = array.positions[idx[local], :3]
+            r2 = radii[local] ** 2
+
+            # Squared distance from each light to the nearest point of each
+            # box, as an (objects x lights) array
+            below = boxes[:, np.newaxis, :3] - centers[np.newaxis]
+            above = centers[np.newaxis] - boxes[:, np.newaxis, 3:]
+            d = np.maximum(np.maximum(below, above), 0.0)
+            dist2 = (d * d).sum(axis=2)
+            affected[np.ix_(bounded, local)] = dist2 <= r2
+
+        groups = OrderedDict()
+        for o, row in zip(objects, affected):
+            groups.setdefault(row.tobytes(), (row, []))[1].append(o)
+        return [
+            ([l for l, a in zip(lights, row) if a], objs)
+            for row, objs in groups.itervalues()
+        ]
+
+    def pack_lights(self, lights):
+        """Pack the data for lights into blocks of up to 8 lights.
+
+        Returns a list of the number of lights in each block, and an array
+        of shape (blocks, 3, 8, 4) holding the colour, view space position
+        and (intensity, falloff) of each light. There is always at least one
+        block, which may be empty.
+
+        """
+        positions, colours, intensities, falloffs, radii = \
+            self.light_data(lights)
+        n = len(lights)
+        nblocks = max(1, -(-n // 8))
+        data = np.zeros((nblocks * 8, 3, 4), dtype=np.float32)
+        data[:n, 0] = colours
+        data[:n, 1] = positions
+        data[:n, 2, 0] = intensities
+        data[:n, 2, 1] = falloffs
+        counts = [min(8, n - i) for i in xrange(0, n, 8)] or [0]
+        return counts, data.reshape(nblocks, 8, 3, 4).transpose(0, 2, 1, 3)
+
     def render_objects(self, camera, lights, objects, shader=lighting_shader):
-        lights = lights[:]
+        """Draw objects lit by lights.
+
+        The first pass over the objects writes depth and ambient light; each
+        further batch of 8 lights is then added in another pass.
+
+        """
         glEnable(GL_DEPTH_TEST)
         glDepthFunc(GL_LEQUAL)
         glBlendFunc(GL_SRC_ALPHA, GL_ZERO)
@@ -222,40 +688,37 @@ class LightingPass(object):
         glDepthMask(GL_TRUE)
 
         #glBindFramebuffer(GL_FRAMEBUFFER, fbo)
-        if not lights:
+        if not objects:
             return
 
+        queue = RenderQueue(objects, stats=self.stats)
         shader.bind()
+        self.stats.shader_binds += 1
         shader.uniformf('ambient', *self.ambient)
-        view_matrix = camera.get_view_matrix()
-
-        while lights:
-            ls = lights[:8]
-            lights = lights[8:]
-
-            light_pos = []
-            for l in ls:
-                x, y, z = view_matrix * l._pos
-                light_pos.append((x, y, z, l.w))
-
-            shader.uniform4fv('colours', [l.colour for l in ls])
-            shader.uniform4fv('positions', light_pos)
-            shader.uniform1fv(
-                'intensities', [l.intensity for l in ls])
-            shader.uniform1fv(
-                'falloffs', [l.falloff for l in ls])
-            shader.uniformi('num_lights', len(ls))
-            for o in objects:
-                o.draw(camera)
 
-            if not lights:
-                break
-
-            # Subsequent passes are drawn without writing to the z-buffer
-            glDisable(GL_POLYGON_OFFSET_FILL)
-            glDepthMask(GL_FALSE)
-            glBlendFunc(GL_SRC_ALPHA, GL_ONE)
-            shader.uniformf('ambient', 0, 0, 0, 0)
+        counts, blocks = self.pack_lights(lights)
+        use_block = getattr(shader, 'light_block', False)
+        if use_block:
+            self.light_buffer.upload(blocks)
+
+        for i, count in enumerate(counts):
+            if i:
+                # Subsequent passes are drawn without writing to the z-buffer
+                glDisable(GL_POLYGON_OFFSET_FILL)
+                glDepthMask(GL_FALSE)
+                glBlendFunc(GL_SRC_ALPHA, GL_ONE)
+                shader.uniformf('ambient', 0, 0, 0, 0)
+
+            if use_block:
+                self.light_buffer.bind(i)
+            elif count:
+                colours, positions, params = blocks[i, :, :count]
+                shader.uniform4fv('colours', colours.tolist())
+                shader.uniform4fv('positions', positions.tolist())
+                shader.uniform1fv('intensities', params[:, 0].tolist())
+                shader.uniform1fv('falloffs', params[:, 1].tolist())
+            shader.uniformi('num_lights', count)
+            queue.submit(camera)
 
         shader.unbind()
         glDepthMask(GL_TRUE)
@@ -341,8 +804,16 @@ class CompositePass(object):
 
 
 class LightingAccumulationRenderer(object):
-    def __init__(self):
-        self.lighting = LightingPass()
+    """Render with per-pixel lighting, accumulating up to 8 lights per pass.
+
+    :param instancing: If True, and the hardware supports it, ModelNodes
+                       that share a Model are drawn with one instanced draw
+                       call per mesh.
+
+    """
+    def __init__(self, instancing=True):
+        self.stats = RenderStats()
+        self.lighting = LightingPass(instancing=instancing)
 #        self.composite = CompositePass(self.lighting)
         self.passes = [
             self.lighting,
@@ -356,22 +827,40 @@ class LightingAccumulationRenderer(object):
         if hasattr(model, 'draw'):
             return model
         batch = Batch()
+        ncalls = 0
         for m in model.meshes:
             if not hasattr(m, 'list'):
                 self.prepare_mesh(m, batch)
+                ncalls += 1
+        # ArrayMeshes have their own buffers rather than being in the batch
+        buffered = [m for m in model.meshes if isinstance(m, ArrayMesh)]
+
+        def draw():
+            self.stats.draw_calls += ncalls
+            batch.draw()
+            for m in buffered:
+                m.group.set_state_recursive()
+                m.list.draw(m.mode)
+                m.group.unset_state_recursive()
+
         model.batch = batch
-        model.draw = batch.draw
+        model.draw = draw
         return model
 
     def prepare_mesh(self, mesh, batch):
         mat = mesh.material
         mat.load_textures()
 
-        l = mesh.to_list(batch, group=MaterialGroup(mat))
+        mesh.group = MaterialGroup(mat)
+        l = mesh.to_list(batch, group=mesh.group)
         mesh.list = l
 
     def render(self, scene, camera):
         self.lighting.ambient = scene.ambient
+        self.lighting.light_array = scene.lights
+        if self.lighting.instancer:
+            self.lighting.instancer.transforms = scene.transforms
+        self.stats = self.lighting.stats = scene.stats
 
         flags = GL_ALL_ATTRIB_BITS
         glPushAttrib(flags)
@@ -382,6 +871,7 @@ class LightingAccumulationRenderer(object):
         glEnable(GL_BLEND)
         glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
         camera.set_matrix()
+        objects = scene.visible_objects(camera)
         for p in self.passes:
-            p.render(camera, scene.objects)
+            p.render(camera, objects)
         glPopAttrib()
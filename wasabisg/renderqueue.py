@@ -0,0 +1,181 @@
+"""Sort the drawing of a frame to minimise changes of OpenGL state.
+
+Instead of each node setting up and tearing down its own state as it is
+drawn, a :py:class:`RenderQueue` collects the individual meshes to draw from
+the scene graph, sorts them by the state they need, and draws them with as
+few state changes as possible.
+
+Nodes take part by implementing an enqueue(queue, matrix, group) method that
+adds their meshes to the queue with :py:meth:`RenderQueue.add_mesh`, or their
+children with :py:meth:`RenderQueue.add`. Any other object is queued as a
+whole and drawn by calling its draw() method.
+
+"""
+from OpenGL.GL import *
+
+from . import shader
+from .stats import RenderStats
+
+
+def _invalidate_textures():
+    """Forget the texture bindings of the active shader.
+
+    This must be called after running code that may bind textures without
+    going through the shader.
+
+    """
+    if shader.activeshader:
+        shader.activeshader.invalidate_textures()
+
+
+def _shader_of(group):
+    """Get the shader that a pyglet group (or its parents) binds, if any."""
+    while group is not None:
+        s = getattr(group, 'shader', None)
+        if s is not None:
+            return s
+        group = group.parent
+    return None
+
+
+class RenderQueue(object):
+    """A list of things to draw, sorted by the state they require.
+
+    Items are sorted by the pyglet group they are drawn in (which may bind a
+    shader), then by texture, then by material. Items with the same sort key
+    are drawn in the order they were added.
+
+    :param objects: Scene objects to add to the queue.
+    :param stats: A RenderStats to count draw calls and state changes in.
+
+    """
+    def __init__(self, objects=(), stats=None):
+        self.stats = stats or RenderStats()
+        self.items = []
+        self.ranks = {}
+        for o in objects:
+            self.add(o)
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        """Remove all items from the queue."""
+        del self.items[:]
+        self.ranks.clear()
+
+    def rank(self, obj):
+        """Get a small integer identifying obj, for use in a sort key."""
+        if obj is None:
+            return 0
+        k = id(obj)
+        try:
+            return self.ranks[k]
+        except KeyError:
+            r = self.ranks[k] = len(self.ranks) + 1
+            return r
+
+    def add(self, node, matrix=None, group=None):
+        """Add a scene node to the queue.
+
+        :param matrix: A euclid.Matrix4 to apply when drawing the node.
+        :param group: A pyglet group to set when drawing the node.
+
+        """
+        enqueue = getattr(node, 'enqueue', None)
+        if enqueue:
+            enqueue(self, matrix, group)
+        else:
+            self.add_node(node, matrix, group)
+
+    def add_node(self, node, matrix=None, group=None):
+        """Add a node that is drawn by calling its draw() method."""
+        key = self.rank(group) << 40
+        m = (GLfloat * 16)(*matrix) if matrix is not None else None
+        self.items.append(
+            (key, group, None, None, None, None, m, node)
+        )
+
+    def add_mesh(self, mesh, matrix, group=None):
+        """Add a Mesh that has been prepared by the renderer.
+
+        The mesh must have a vertex list (mesh.list) and a MaterialGroup
+        (mesh.group).
+
+        """
+        material = mesh.group
+        texture = material.material.get('tex_map_Kd')
+        key = (
+            self.rank(group) << 40 |
+            self.rank(texture) << 20 |
+            self.rank(material)
+        )
+        self.items.append((
+            key, group, material, texture, mesh.list, mesh.mode,
+            (GLfloat * 16)(*matrix), None
+        ))
+
+    def sort(self):
+        """Sort the items in the queue by state."""
+        self.items.sort(key=lambda item: item[0])
+
+    def submit(self, camera):
+        """Draw everything in the queue.
+
+        The queue is not cleared, so it can be submitted again, eg. once for
+        each lighting pass.
+
+        """
+        self.sort()
+        stats = self.stats
+        current_group = current_material = current_texture = None
+        for (key, group, material, texture, vlist, mode,
+                matrix, node) in self.items:
+            if group is not current_group:
+                if current_material:
+                    current_material.unset_state()
+                    current_material = current_texture = None
+                if current_group:
+                    current_group.unset_state_recursive()
+                if group:
+                    group.set_state_recursive()
+                    if _shader_of(group):
+                        stats.shader_binds += 1
+                _invalidate_textures()
+                current_group = group
+
+            if node is not None:
+                # Drawing the node may change any state
+                if current_material:
+                    current_material.unset_state()
+                    current_material = current_texture = None
+                if matrix is not None:
+                    glPushMatrix()
+                    glMultMatrixf(matrix)
+                    node.draw(camera)
+                    glPopMatrix()
+                else:
+                    node.draw(camera)
+                _invalidate_textures()
+                continue
+
+            if material is not current_material:
+                if current_material:
+                    current_material.unset_state()
+                material.set_state()
+                stats.material_uploads += 1
+                if texture is not current_texture:
+                    stats.texture_binds += 1
+                    current_texture = texture
+                current_material = material
+
+            glPushMatrix()
+            glMultMatrixf(matrix)
+            vlist.draw(mode)
+            glPopMatrix()
+            stats.draw_calls += 1
+
+        if current_material:
+            current_material.unset_state()
+        if current_group:
+            current_group.unset_state_recursive()
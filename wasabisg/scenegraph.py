@@ -1,13 +1,25 @@
+import math
 import itertools
+from collections import OrderedDict
 import pyglet
+import numpy as np
 
 from pyglet.graphics import Group
 from OpenGL.GL import *
-from OpenGL.GLU import *
 from euclid import Matrix4, Point3, Vector3
 
 from .renderer import LightingAccumulationRenderer
-from .model import Model, Mesh
+from .model import (
+    Model, Mesh, ArrayMesh, AnimatedModelInstance, merge_array_meshes
+)
+from .animation import AnimationClock
+from .transforms import TransformArray
+from .skeletal import SkinnedModelInstance, pose_instances
+from .lightbinning import euclid_to_array
+from .streaming import PendingModel
+from .lighting import BaseLight, LightArray
+from .bounds import BoundingBox, Frustum, union_bounds, camera_basis
+from .stats import RenderStats
 
 
 def v3(a, *args):
@@ -46,15 +58,199 @@ class GLStateGroup(Group):
             glDepthMask(GL_TRUE)
 
 
-class ModelNode(object):
-    """Draw a model at a point in space, with a rotation."""
+def transform_matrix(pos, rotation):
+    """Get a euclid.Matrix4 equivalent to glTranslatef() then glRotatef()."""
+    m = Matrix4.new_translate(*pos[:3])
+    angle, x, y, z = rotation
+    if angle:
+        m *= Matrix4.new_rotate_axis(math.radians(angle), Vector3(x, y, z))
+    return m
+
+
+class Node(object):
+    """Base class for scene nodes.
+
+    Other objects, such as a spatial index or a parent group, can watch a node
+    to be notified when it moves. Watchers must have a node_moved(node)
+    method.
+
+    Subclasses that have bounds should implement compute_bounds(); the bounds
+    are cached until the node moves.
+
+    """
+    watchers = ()
+
+    def get_bounds(self):
+        """Get the BoundingBox of the node in its parent's coordinates.
+
+        Returns None if the node's bounds are unknown.
+
+        """
+        try:
+            return self._bounds
+        except AttributeError:
+            self._bounds = self.compute_bounds()
+            return self._bounds
+
+    def compute_bounds(self):
+        return None
+
+    def enqueue(self, queue, matrix=None, group=None):
+        """Add this node to a RenderQueue.
+
+        By default the node is drawn as a whole by calling its draw() method;
+        subclasses may instead add their meshes individually so that they can
+        be sorted by state.
+
+        """
+        queue.add_node(self, matrix, group)
+
+    def watch(self, watcher):
+        """Call watcher.node_moved(self) whenever this node moves."""
+        if not self.watchers:
+            self.watchers = []
+        self.watchers.append(watcher)
+
+    def unwatch(self, watcher):
+        """Stop notifying watcher when this node moves."""
+        if watcher in self.watchers:
+            self.watchers.remove(watcher)
+
+    def moved(self):
+        """Notify watchers that this node has moved.
+
+        This must also be called if the node's geometry changes in any other
+        way that affects its bounds.
+
+        """
+        self.__dict__.pop('_bounds', None)
+        for w in self.watchers:
+            w.node_moved(self)
+
+
+class TransformNode(Node):
+    """Base class for nodes with a position and rotation.
+
+    Assigning to pos or rotation notifies watchers; note that modifying a
+    position vector in place (eg. node.pos.x = 5) does not, and the node will
+    continue to be drawn where it was.
+
+    The node's local matrix, and its world matrix, which includes the
+    transformations of the GroupNodes containing it, are cached until the
+    node or one of its ancestors moves, so nodes that do not move cost no
+    matrix computation to draw.
+
+    """
+    # The GroupNode containing this node, if any
+    parent = None
+
+    # The TransformArray holding this node's world matrix, if any, and the
+    # row of it in that array
+    transforms = None
+    slot = None
+
+    @property
+    def pos(self):
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        self._pos = pos
+        self.transform_changed()
+
+    @property
+    def rotation(self):
+        return self._rotation
+
+    @rotation.setter
+    def rotation(self, rotation):
+        self._rotation = rotation
+        self.transform_changed()
+
+    def transform_changed(self):
+        """Discard the cached matrices and notify watchers."""
+        d = self.__dict__
+        d.pop('_matrix', None)
+        d.pop('_gl_matrix', None)
+        self.world_moved()
+        self.moved()
+
+    def world_moved(self):
+        """Discard the cached world matrix, because this node or an ancestor
+        has moved."""
+        self.__dict__.pop('_world', None)
+        if self.transforms is not None:
+            self.transforms.node_moved(self)
+
+    def get_matrix(self):
+        """Get the transformation of this node as a euclid.Matrix4.
+
+        The matrix is cached, and must not be modified.
+
+        """
+        try:
+            return self._matrix
+        except AttributeError:
+            m = self._matrix = transform_matrix(self.pos, self.rotation)
+            return m
+
+    def get_gl_matrix(self):
+        """Get the transformation of this node as an array for glMultMatrixf."""
+        try:
+            return self._gl_matrix
+        except AttributeError:
+            m = self._gl_matrix = (GLfloat * 16)(*self.get_matrix())
+            return m
+
+    def enqueue_matrix(self, matrix):
+        """Get the matrix to draw this node with when enqueued with matrix.
+
+        GroupNodes enqueue their children with their own world matrix, so
+        the child's cached world matrix can be used without multiplying the
+        matrices down the tree every frame.
+
+        """
+        if matrix is None:
+            return self.get_matrix()
+        parent = self.parent
+        if parent is not None and matrix is parent.get_world_matrix():
+            return self.get_world_matrix()
+        return matrix * self.get_matrix()
+
+    def get_world_matrix(self):
+        """Get the transformation of this node including its ancestors.
+
+        The matrix is cached, and must not be modified.
+
+        """
+        try:
+            return self._world
+        except AttributeError:
+            m = self.get_matrix()
+            if self.parent is not None:
+                m = self.parent.get_world_matrix() * m
+            self._world = m
+            return m
+
+
+class ModelNode(TransformNode):
+    """Draw a model at a point in space, with a rotation.
+
+    Nodes that are flagged as static will never move, and may be merged with
+    other static nodes by :py:meth:`Scene.bake_static`.
+
+    """
     def __init__(self,
             model,
             pos=(0, 0, 0),
             rotation=(0, 0, 1, 0),
             group=None,
-            transparent=False):
+            transparent=False,
+            static=False):
         self.model_instance = model.get_instance()
+        self.static = static
+        if isinstance(self.model_instance, PendingModel):
+            self.model_instance.watch(self)
         self.pos = pos
         self.rotation = rotation
         self.group = group
@@ -67,9 +263,33 @@ class ModelNode(object):
     def update(self, dt):
         self.model_instance.update(dt)
 
+    def model_loaded(self, model):
+        """A pending model has loaded, so our bounds have changed."""
+        self.moved()
+
     def is_transparent(self):
         return self.transparent
 
+    def compute_bounds(self):
+        get_bounds = getattr(self.model_instance, 'get_bounds', None)
+        bounds = get_bounds and get_bounds()
+        if bounds is None:
+            return None
+        return bounds.transformed(self.get_matrix())
+
+    def enqueue(self, queue, matrix=None, group=None):
+        meshes = getattr(self.model_instance, 'meshes', None)
+        prepared = meshes and all(hasattr(m, 'list') for m in meshes)
+        if not prepared or (self.group and group):
+            # Animated or unprepared models, and nested groups, are drawn
+            # as a whole
+            queue.add_node(self, matrix, group)
+            return
+        m = self.enqueue_matrix(matrix)
+        group = self.group or group
+        for mesh in meshes:
+            queue.add_mesh(mesh, m, group)
+
     def draw_with_group(self, camera):
         self.group.set_state_recursive()
         self.draw_inner(camera)
@@ -77,13 +297,128 @@ class ModelNode(object):
 
     def draw_inner(self, camera):
         glPushMatrix()
-        glTranslatef(*self.pos)
-        glRotatef(*self.rotation)
+        glMultMatrixf(self.get_gl_matrix())
         self.model_instance.draw()
         glPopMatrix()
 
 
-class GroupNode(object):
+class LODNode(ModelNode):
+    """Draw one of several versions of a model, chosen by how large it appears.
+
+    levels is a sequence of (model, threshold) pairs, from the most detailed
+    model to the least. If metric is 'distance', each level is drawn while
+    the distance from the camera to the center of the node's bounds is at
+    most its threshold; if metric is 'screen', while the node's bounding
+    sphere covers at least its threshold as a fraction of the viewport
+    height. Beyond the last threshold nothing is drawn, so give the last
+    level a threshold of float('inf') or 0 respectively to always draw it.
+
+    To avoid flickering between levels when the node is near a threshold,
+    the level only changes once the threshold has been passed by the
+    fraction given as hysteresis.
+
+    Levels are selected by the Scene before each frame is drawn, so LODNodes
+    must be added to the scene directly rather than inside a GroupNode.
+
+    """
+    def __init__(self,
+            levels,
+            pos=(0, 0, 0),
+            rotation=(0, 0, 1, 0),
+            group=None,
+            transparent=False,
+            metric='distance',
+            hysteresis=0.1):
+        levels = list(levels)
+        if not levels:
+            raise ValueError("At least one level is required")
+        if metric not in ('distance', 'screen'):
+            raise ValueError("Unknown LOD metric %r" % metric)
+        self.metric = metric
+        self.hysteresis = hysteresis
+        self.thresholds = [float(t) for m, t in levels]
+        self.level = 0
+        super(LODNode, self).__init__(
+            levels[0][0], pos, rotation, group, transparent
+        )
+        self.models = [self.model_instance]
+        for model, t in levels[1:]:
+            model = model.get_instance()
+            if isinstance(model, PendingModel):
+                model.watch(self)
+            self.models.append(model)
+
+    def compute_bounds(self):
+        # The bounds cover every level, so they do not change when the
+        # level does
+        bounds = union_bounds(
+            getattr(m, 'get_bounds', lambda: None)() for m in self.models
+        )
+        if bounds is None:
+            return None
+        return bounds.transformed(self.get_matrix())
+
+    def lod_metric(self, camera, projection=None):
+        """Measure the node from camera, according to the metric.
+
+        Return None if the node has no bounds.
+
+        """
+        bounds = self.get_bounds()
+        if bounds is None:
+            return None
+        d = (v3(bounds.center) - v3(camera.pos)).magnitude()
+        if self.metric == 'distance':
+            return d
+        if projection is None:
+            projection = camera.get_projection_matrix()
+        if not projection.o:
+            # Orthographic: the size does not depend on distance
+            return bounds.radius * projection.f
+        if d <= bounds.radius:
+            return float('inf')
+        return bounds.radius * projection.f / d
+
+    def level_for(self, value, slack=1.0):
+        """Get the level to draw for a metric value.
+
+        The thresholds are loosened by the factor slack, which favours more
+        detailed levels if greater than 1. Return len(self.models) if
+        nothing should be drawn.
+
+        """
+        for i, t in enumerate(self.thresholds):
+            if self.metric == 'distance':
+                if value <= t * slack:
+                    return i
+            elif value * slack >= t:
+                return i
+        return len(self.thresholds)
+
+    def select_lod(self, camera, projection=None):
+        """Choose the level to draw for camera.
+
+        Return False if the node is too small to draw at all.
+
+        """
+        value = self.lod_metric(camera, projection)
+        if value is None:
+            return True
+        level = self.level_for(value)
+        if level > self.level:
+            slack = 1.0 + self.hysteresis
+            level = max(self.level, self.level_for(value, slack))
+        elif level < self.level:
+            slack = 1.0 / (1.0 + self.hysteresis)
+            level = min(self.level, self.level_for(value, slack))
+        self.level = level
+        if level == len(self.models):
+            return False
+        self.model_instance = self.models[level]
+        return True
+
+
+class GroupNode(TransformNode):
     """Group a bunch of other nodes."""
     def __init__(self,
             nodes,
@@ -91,6 +426,11 @@ class GroupNode(object):
             rotation=(0, 0, 1, 0),
             group=None):
         self.nodes = nodes
+        for n in nodes:
+            if isinstance(n, Node):
+                n.watch(self)
+            if isinstance(n, TransformNode):
+                n.parent = self
         self.pos = pos
         self.rotation = rotation
         self.group = group
@@ -99,6 +439,16 @@ class GroupNode(object):
         else:
             self.draw = self.draw_inner
 
+    def node_moved(self, node):
+        """A child has moved, so the group's bounds have changed."""
+        self.moved()
+
+    def world_moved(self):
+        super(GroupNode, self).world_moved()
+        for n in self.nodes:
+            if isinstance(n, TransformNode):
+                n.world_moved()
+
     def update(self, dt):
         for n in self.nodes:
             n.update(dt)
@@ -106,6 +456,25 @@ class GroupNode(object):
     def is_transparent(self):
         return False
 
+    def compute_bounds(self):
+        # If any of the nodes in the group cannot report bounds then the
+        # group is considered unbounded.
+        bounds = union_bounds(
+            getattr(n, 'get_bounds', lambda: None)() for n in self.nodes
+        )
+        if bounds is None:
+            return None
+        return bounds.transformed(self.get_matrix())
+
+    def enqueue(self, queue, matrix=None, group=None):
+        if self.group and group:
+            queue.add_node(self, matrix, group)
+            return
+        m = self.enqueue_matrix(matrix)
+        group = self.group or group
+        for n in self.nodes:
+            queue.add(n, m, group)
+
     def draw_with_group(self, camera):
         self.group.set_state_recursive()
         self.draw_inner(camera)
@@ -113,14 +482,13 @@ class GroupNode(object):
 
     def draw_inner(self, camera):
         glPushMatrix()
-        glTranslatef(*self.pos)
-        glRotatef(*self.rotation)
+        glMultMatrixf(self.get_gl_matrix())
         for n in self.nodes:
             n.draw(camera)
         glPopMatrix()
 
 
-class RayNode(object):
+class RayNode(Node):
     """A ray, drawn as a billboard towards the camera."""
     ta = (0, 0)
     tb = (0, 1)
@@ -135,12 +503,45 @@ class RayNode(object):
         self.transparent = transparent
         self.group = group
 
+    @property
+    def p1(self):
+        return self._p1
+
+    @p1.setter
+    def p1(self, p):
+        self._p1 = p
+        self.moved()
+
+    @property
+    def p2(self):
+        return self._p2
+
+    @p2.setter
+    def p2(self, p):
+        self._p2 = p
+        self.moved()
+
+    @property
+    def width(self):
+        return self._width
+
+    @width.setter
+    def width(self, width):
+        self._width = width
+        self.moved()
+
     def update(self, dt):
         pass
 
     def is_transparent(self):
         return self.transparent
 
+    def compute_bounds(self):
+        # Contain the ray whichever way it faces the camera
+        return BoundingBox.from_points(
+            [self.p1, self.p2]
+        ).expanded(0.5 * self.width)
+
     def draw(self, camera):
         p1, p2 = self.p1, self.p2
         along = (p2 - p1).normalize()
@@ -169,26 +570,89 @@ class Scene(object):
     At present this class does little more than render a list of objects; in
     future however it may support more sophisticated behaviour.
 
+    If culling is True, objects that are outside the camera's view frustum
+    are skipped when rendering. The number of objects drawn and culled in
+    the most recent frame is available in the stats attribute.
+
+    index may be given as a spatial index such as
+    :py:class:`~wasabisg.spatial.LooseOctree` (or a callable that returns
+    one). Nodes that can report their bounds will be kept in the index, so
+    that culling need not test every node in the scene; the index can also be
+    queried directly, eg. for picking.
+
+    If atlas is given as a :py:class:`~wasabisg.atlas.TextureAtlas`, the
+    small textures of models are packed into it as they are prepared, so
+    that more of their meshes can be merged.
+
     """
     def __init__(
             self,
             ambient=(0, 0, 0, 1.0),
-            renderer=LightingAccumulationRenderer):
+            renderer=LightingAccumulationRenderer,
+            culling=True,
+            index=None,
+            atlas=None):
 
         self.ambient = ambient
-        self.objects = []
+        # Map each object to a sequence number, so that we can restore the
+        # order in which objects were added after querying the index
+        self._objects = OrderedDict()
+        self._seq = itertools.count()
         self.models = {}
+        self.culling = culling
+        self.stats = RenderStats()
+        # The properties of all lights in the scene, in NumPy arrays
+        self.lights = LightArray()
+        # The world matrices of the nodes in the scene
+        self.transforms = TransformArray()
 
         if callable(renderer):
             self.renderer = renderer()
         else:
             self.renderer = renderer
 
+        if callable(index):
+            self.index = index()
+        else:
+            self.index = index
+        # Objects that are not stored in the index
+        self.unindexed = set()
+        # Unindexed nodes that have moved, and so may now have bounds
+        self.reindex = set()
+        self.atlas = atlas
+        # LODNodes, whose levels are selected before each frame
+        self.lod_nodes = set()
+        # The playback state of the animated models of nodes in the scene
+        self.clock = AnimationClock()
+        # Map nodes to the instances they added to the clock
+        self.clocked = {}
+        # Objects that must be updated individually, because their
+        # animation is not advanced by the clock
+        self.updated = OrderedDict()
+
+    @property
+    def objects(self):
+        """A list of the objects in the scene, in the order they were added.
+
+        This is a new list each time it is read; modifying it does not change
+        the scene, so use add() and remove() instead.
+
+        """
+        return self._objects.keys()
+
     def prepare_model(self, model):
+        if self.atlas is not None and hasattr(model, 'meshes') \
+                and not hasattr(model, 'draw'):
+            if self.atlas.add_model(model):
+                self.atlas.upload()
         return self.renderer.prepare_model(model)
 
     def prepare_modelnode(self, c):
-        c.model_instance = self.prepare_model(c.model_instance)
+        if isinstance(c, LODNode):
+            c.models = [self.prepare_model(m) for m in c.models]
+            c.model_instance = c.models[min(c.level, len(c.models) - 1)]
+        else:
+            c.model_instance = self.prepare_model(c.model_instance)
 
     def prepare_group(self, group):
         for c in group.nodes:
@@ -199,13 +663,29 @@ class Scene(object):
 
     def clear(self):
         """Remove all objects from the scene."""
-        del self.objects[:]
+        self._objects.clear()
+        for o in self.unindexed:
+            unwatch = getattr(o, 'unwatch', None)
+            if unwatch:
+                unwatch(self)
+        self.unindexed.clear()
+        self.reindex.clear()
+        self.lights.clear()
+        self.transforms.clear()
+        self.lod_nodes.clear()
+        self.clock.clear()
+        self.clocked.clear()
+        self.updated.clear()
+        if self.index is not None:
+            self.index.clear()
 
     def add(self, obj):
         """Add obj to the scene.
 
         obj should be a scenegraph node, but currently adding a Mesh or Model
-        directly is supported as a convenience.
+        directly is supported as a convenience. A PendingModel from a
+        :py:class:`~wasabisg.streaming.StreamingLoader` may also be added;
+        it is drawn once it has loaded.
 
         """
         if isinstance(obj, Mesh):
@@ -215,40 +695,267 @@ class Scene(object):
         elif isinstance(obj, Model):
             model = self.prepare_model(obj)
             obj = ModelNode(model)
+        elif isinstance(obj, PendingModel):
+            obj = ModelNode(obj)
         elif isinstance(obj, ModelNode):
-            obj.model_instance = self.prepare_model(obj.model_instance)
+            self.prepare_modelnode(obj)
         elif isinstance(obj, GroupNode):
             self.prepare_group(obj)
-        if obj in self.objects:
+        if obj in self._objects:
             return
-        self.objects.append(obj)
+        self._objects[obj] = next(self._seq)
+        if isinstance(obj, BaseLight):
+            self.lights.add(obj)
+        elif isinstance(obj, LODNode):
+            self.lod_nodes.add(obj)
+        if isinstance(obj, TransformNode):
+            self.transforms.add(obj)
+        instance = self._clocked_instance(obj)
+        if instance is not None:
+            self.clock.add(instance)
+            self.clocked[obj] = instance
+        else:
+            self.updated[obj] = True
+        if self.index is None or not hasattr(obj, 'get_bounds'):
+            self.unindexed.add(obj)
+        elif not self.index.add(obj):
+            # The node's bounds are not known yet, eg. because its model is
+            # still loading; index it once it moves
+            self.unindexed.add(obj)
+            watch = getattr(obj, 'watch', None)
+            if watch:
+                watch(self)
+
+    def node_moved(self, node):
+        """An unindexed node has moved, so may now be able to be indexed."""
+        if node in self.unindexed:
+            self.reindex.add(node)
+
+    def _reindex(self):
+        """Add unindexed nodes that have moved to the index if possible."""
+        while self.reindex:
+            node = self.reindex.pop()
+            if self.index.add(node):
+                self.unindexed.discard(node)
+                node.unwatch(self)
+
+    @staticmethod
+    def _clocked_instance(obj):
+        """Get the animated model instance of obj to add to the clock.
+
+        Return None if obj should be updated individually, including if it
+        overrides ModelNode.update().
+
+        """
+        if isinstance(obj, ModelNode) and not isinstance(obj, LODNode) \
+                and type(obj).update == ModelNode.update \
+                and 'update' not in obj.__dict__:
+            instance = obj.model_instance
+            if isinstance(instance, AnimatedModelInstance):
+                return instance
+        return None
 
     def remove(self, obj):
         """Remove obj from the scene."""
-        try:
-            self.objects.remove(obj)
-        except ValueError:
-            pass
+        if self._objects.pop(obj, None) is None:
+            return
+        self.lights.remove(obj)
+        if isinstance(obj, TransformNode):
+            self.transforms.remove(obj)
+        self.lod_nodes.discard(obj)
+        instance = self.clocked.pop(obj, None)
+        if instance is not None:
+            self.clock.remove(instance)
+        else:
+            self.updated.pop(obj, None)
+        if obj in self.unindexed:
+            self.unindexed.discard(obj)
+            self.reindex.discard(obj)
+            unwatch = getattr(obj, 'unwatch', None)
+            if unwatch:
+                unwatch(self)
+        else:
+            self.index.remove(obj)
+
+    def bake_static(self, chunk_size=100.0):
+        """Merge the static ModelNodes in the scene into a few large nodes.
+
+        The vertices of each static node are transformed into world space,
+        and the nodes are divided into chunks of chunk_size along each axis,
+        by the center of their bounds. The meshes in each chunk are merged
+        by material, so each chunk is drawn with one draw call per material
+        but can still be culled as a whole.
+
+        Nodes that are transparent, have a group, or have animated models
+        are left alone.
+
+        Return the list of new nodes, which replace the static nodes in the
+        scene.
+
+        """
+        nodes = [
+            o for o in self._objects
+            if isinstance(o, ModelNode) and o.static and not o.transparent
+            and not o.group and isinstance(o.model_instance, Model)
+        ]
+        chunks = {}
+        for node in nodes:
+            bounds = node.get_bounds()
+            center = bounds.center if bounds else tuple(node.pos)[:3]
+            key = tuple(int(math.floor(c / chunk_size)) for c in center)
+            by_material = chunks.setdefault(key, {})
+            matrix = euclid_to_array(node.get_matrix())
+            for mesh in node.model_instance.meshes:
+                if not isinstance(mesh, ArrayMesh):
+                    mesh = ArrayMesh.from_mesh(mesh)
+                by_material.setdefault(
+                    (mesh.mode, id(mesh.material)), []
+                ).append(mesh.transformed(matrix))
+
+        for node in nodes:
+            self.remove(node)
+        baked = []
+        for key in sorted(chunks):
+            model = Model(
+                meshes=[merge_array_meshes(ms) for ms in chunks[key].values()],
+                name='static chunk %d,%d,%d' % key
+            )
+            node = ModelNode(model, static=True)
+            self.add(node)
+            baked.append(node)
+        return baked
 
     def update(self, dt):
-        """Update all objects in the scene with the given time step."""
-        for o in self.objects:
+        """Update all objects in the scene with the given time step.
+
+        The animations of the scene's animated models are advanced together
+        by the scene's AnimationClock, and the poses of its skinned models
+        are then computed together.
+
+        """
+        self.clock.tick(dt)
+        skinned = []
+        for o in self.updated:
             o.update(dt)
+            instance = getattr(o, 'model_instance', None)
+            if isinstance(instance, SkinnedModelInstance):
+                skinned.append(instance)
+        if skinned:
+            pose_instances(skinned)
+
+    def visible_objects(self, camera):
+        """Get the objects in the scene that may be visible to camera.
+
+        Objects that cannot report their bounds, such as lights, are always
+        included. The visible LODNodes select the level to draw, and are
+        omitted if they are too small to draw.
+
+        """
+        visible = self._visible(camera)
+        if self.lod_nodes:
+            visible = self._select_lods(visible, camera)
+        return visible
+
+    def _select_lods(self, objects, camera):
+        """Select the levels of the LODNodes among objects."""
+        projection = camera.get_projection_matrix()
+        visible = []
+        for o in objects:
+            if o in self.lod_nodes and not o.select_lod(camera, projection):
+                self.stats.drawn -= 1
+                self.stats.culled += 1
+                continue
+            visible.append(o)
+        return visible
+
+    def _visible(self, camera):
+        """Get the objects that are within the camera's view."""
+        if not self.culling:
+            self.stats.drawn += len(self._objects) - len(self.lights)
+            return list(self._objects)
+
+        frustum = camera.get_frustum()
+        if self.index is not None:
+            return self._visible_indexed(frustum)
+
+        visible = []
+        drawn = culled = 0
+        for o in self._objects:
+            try:
+                get_bounds = o.get_bounds
+            except AttributeError:
+                visible.append(o)
+                if not isinstance(o, BaseLight):
+                    drawn += 1
+                continue
+            bounds = get_bounds()
+            if bounds is None or frustum.intersects_box(bounds):
+                visible.append(o)
+                drawn += 1
+            else:
+                culled += 1
+        self.stats.drawn += drawn
+        self.stats.culled += culled
+        return visible
+
+    def _visible_indexed(self, frustum):
+        """Get the visible objects by querying the spatial index."""
+        self._reindex()
+        visible = self.index.query_frustum(frustum)
+        self.stats.drawn += len(visible)
+        self.stats.culled += len(self.index) - len(visible)
+        for o in self.unindexed:
+            visible.append(o)
+            if not isinstance(o, BaseLight):
+                self.stats.drawn += 1
+        visible.sort(key=self._objects.__getitem__)
+        return visible
 
     def render(self, camera):
         """Render the scene with the given camera."""
+        self.stats.reset()
         self.renderer.render(self, camera)
 
 
+def _camera_param(name, doc=None):
+    """Make a property that discards a camera's cached matrices when set."""
+    attr = '_' + name
+
+    def get(self):
+        return getattr(self, attr)
+
+    def set(self, value):
+        setattr(self, attr, value)
+        self._cache = {}
+    return property(get, set, doc=doc)
+
+
+def _array_to_euclid(a):
+    """Convert a 4x4 NumPy array to a euclid.Matrix4."""
+    return Matrix4.new(*a.T.ravel().tolist())
+
+
 class Camera(object):
     """The camera class is a view onto a scene.
 
     This class offers the ability to set up the projection and modelview
     matrixes.
 
+    The view and projection matrices and the view frustum are computed when
+    they are first needed, and cached until one of the camera's parameters is
+    assigned; note that modifying pos or look_at in place (eg.
+    camera.pos.x = 5) does not update them.
+
     :param fov: The field of view in the y direction.
 
     """
+    pos = _camera_param('pos')
+    look_at = _camera_param('look_at')
+    fov = _camera_param('fov')
+    near = _camera_param('near')
+    far = _camera_param('far')
+    viewport = _camera_param('viewport', "The (width, height) of the view.")
+
     def __init__(
             self,
             width=800,
@@ -259,59 +966,134 @@ class Camera(object):
             near=1.0,
             far=10000.0):
         self.viewport = width, height
-        self.aspect = float(width) / height
         self.fov = fov
         self.pos = pos
         self.look_at = look_at
         self.near = near
         self.far = far
 
+    @property
+    def aspect(self):
+        """The aspect ratio of the view.
+
+        Setting it changes the width of the viewport to match, keeping its
+        height.
+
+        """
+        w, h = self.viewport
+        return float(w) / h
+
+    @aspect.setter
+    def aspect(self, aspect):
+        w, h = self.viewport
+        self.viewport = aspect * h, h
+
+    def _cached(self, key, compute):
+        """Get a cached value, computing it if the camera has changed."""
+        try:
+            return self._cache[key]
+        except KeyError:
+            v = self._cache[key] = compute()
+            return v
+
     def eye_vector(self):
         """Get the direction in which the camera is looking."""
         return self.look_at - self.pos
 
+    def _gl_matrix(self, key, get_array):
+        """Get a cached matrix in the column-major order OpenGL expects."""
+        return self._cached(key, lambda: np.ascontiguousarray(get_array().T))
+
     def set_projection_matrix(self):
         glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        gluPerspective(self.fov, self.aspect, self.near, self.far)
+        glLoadMatrixd(
+            self._gl_matrix('gl_projection', self.get_projection_array)
+        )
 
     def set_matrix(self):
         self.set_projection_matrix()
         glMatrixMode(GL_MODELVIEW)
-        glLoadIdentity()
-        gluLookAt(*itertools.chain(
-            self.pos,
-            self.look_at,
-            (0, 1, 0)
-        ))
+        glLoadMatrixd(self._gl_matrix('gl_view', self.get_view_array))
 
-    def get_view_matrix_gl(self):
-        from ctypes import c_double
-        mat = (c_double * 16)()
-        glGetDoublev(GL_MODELVIEW_MATRIX, mat)
-        return Matrix4.new(*mat)
+    def compute_projection_array(self):
+        fy = 1.0 / math.tan(math.radians(self.fov) * 0.5)
+        n, f = self.near, self.far
+        return np.array([
+            [fy / self.aspect, 0, 0, 0],
+            [0, fy, 0, 0],
+            [0, 0, (f + n) / (n - f), 2.0 * f * n / (n - f)],
+            [0, 0, -1, 0],
+        ])
+
+    def get_projection_array(self):
+        """Get the projection matrix as a read-only 4x4 NumPy array."""
+        def compute():
+            a = self.compute_projection_array()
+            a.flags.writeable = False
+            return a
+        return self._cached('projection', compute)
+
+    def get_projection_matrix(self):
+        """Get the projection matrix as a euclid.Matrix4.
+
+        The matrix is cached, and must not be modified.
+
+        """
+        return self._cached(
+            'projection_euclid',
+            lambda: _array_to_euclid(self.get_projection_array())
+        )
+
+    def get_view_array(self):
+        """Get the view matrix as a read-only 4x4 NumPy array."""
+        def compute():
+            f, s, u = camera_basis(self.pos, self.look_at)
+            a = np.identity(4)
+            a[0, :3] = s
+            a[1, :3] = u
+            a[2, :3] = [-c for c in f]
+            a[:3, 3] = -np.dot(a[:3, :3], tuple(self.pos)[:3])
+            a.flags.writeable = False
+            return a
+        return self._cached('view', compute)
 
     def get_view_matrix(self):
-        """Get the view matrix as a euclid.Matrix4."""
-        f = (v3(self.look_at) - v3(self.pos)).normalized()
-        #print "f=", f
-        up = Vector3(0, 1, 0)
-        s = f.cross(up).normalize()
-        #print abs(f), abs(up), abs(s)
-        #print "s=", s
-        u = s.cross(f)
-        m = Matrix4.new(*itertools.chain(
-            s, [0],
-            u, [0],
-            -f, [0],
-            [0, 0, 0, 1]
-        ))
-        #print m
-        xlate = Matrix4.new_translate(*(-self.pos))
-        #print xlate
-        mat = m.inverse() * xlate
-        #print mat
-        return mat
+        """Get the view matrix as a euclid.Matrix4.
+
+        The matrix is cached, and must not be modified.
+
+        """
+        return self._cached(
+            'view_euclid', lambda: _array_to_euclid(self.get_view_array())
+        )
+
+    def get_view_matrix_gl(self):
+        """Get the view matrix as a euclid.Matrix4.
+
+        This used to read back the matrix from OpenGL, which stalls the
+        pipeline; the matrix loaded by set_matrix() is the same.
+
+        """
+        return self.get_view_matrix()
+
+    def get_view_projection_array(self):
+        """Get the product of the projection and view matrices.
+
+        This transforms from world space into clip space.
+
+        """
+        def compute():
+            a = np.dot(self.get_projection_array(), self.get_view_array())
+            a.flags.writeable = False
+            return a
+        return self._cached('view_projection', compute)
+
+    def get_frustum(self):
+        """Get the Frustum of space that is visible to this camera."""
+        return self._cached(
+            'frustum',
+            lambda: Frustum.from_matrix(self.get_view_projection_array())
+        )
 
 
 class OrthographicCamera(Camera):
@@ -320,6 +1102,8 @@ class OrthographicCamera(Camera):
     :param scale: the width of the viewport in world space.
 
     """
+    scale = _camera_param('scale')
+
     def __init__(
             self,
             width=800,
@@ -330,7 +1114,6 @@ class OrthographicCamera(Camera):
             near=1.0,
             far=10000.0):
         self.viewport = width, height
-        self.aspect = float(width) / height
         self.pos = pos
         self.look_at = look_at
         self.near = near
@@ -346,7 +1129,13 @@ class OrthographicCamera(Camera):
         t = vs
         return l, r, b, t, self.near, self.far
 
-    def set_projection_matrix(self):
-        glMatrixMode(GL_PROJECTION)
-        glLoadIdentity()
-        glOrtho(*self.bounds())
+    def compute_projection_array(self):
+        l, r, b, t, n, f = self.bounds()
+        a = np.identity(4)
+        a[0, 0] = 2.0 / (r - l)
+        a[1, 1] = 2.0 / (t - b)
+        a[2, 2] = -2.0 / (f - n)
+        a[0, 3] = -(r + l) / float(r - l)
+        a[1, 3] = -(t + b) / float(t - b)
+        a[2, 3] = -(f + n) / float(f - n)
+        return a
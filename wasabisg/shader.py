@@ -40,6 +40,23 @@ def get_white_texture():
     return white
 
 
+# How to upload a uniform of each GL type from a flat tuple of values: the
+# function, the number of values per element, and the value type
+UNIFORM_UPLOADS = {
+    GL_FLOAT: (glUniform1fv, 1, float),
+    GL_FLOAT_VEC2: (glUniform2fv, 2, float),
+    GL_FLOAT_VEC3: (glUniform3fv, 3, float),
+    GL_FLOAT_VEC4: (glUniform4fv, 4, float),
+    GL_FLOAT_MAT4: (glUniformMatrix4fv, 16, float),
+    GL_INT: (glUniform1iv, 1, int),
+    GL_INT_VEC2: (glUniform2iv, 2, int),
+    GL_INT_VEC3: (glUniform3iv, 3, int),
+    GL_INT_VEC4: (glUniform4iv, 4, int),
+    GL_BOOL: (glUniform1iv, 1, int),
+    GL_SAMPLER_2D: (glUniform1iv, 1, int),
+}
+
+
 class Shader(object):
     # vert, frag and geom take arrays of source strings
     # the arrays will be concattenated into one string by OpenGL
@@ -47,8 +64,16 @@ class Shader(object):
         self.uniform_bindings = {}
         self.texture_bindings = {}
         self.locations = {}
+        self.attrib_locations = {}
         self.name = name
 
+        # Shadow copies of the values of uniforms, by location, and of the
+        # textures bound to each texture unit while this shader is bound,
+        # so that redundant uploads can be skipped
+        self.values = {}
+        self.bound_textures = {}
+        self.arrays = {}
+
         # Number of texture units not used for material maps
         self.reserved_textures = reserved_textures
 
@@ -139,6 +164,8 @@ class Shader(object):
         global activeshader
         glUseProgram(self.handle)
         activeshader = self
+        # Textures may have been rebound while we were not bound
+        self.bound_textures.clear()
 
     def unbind(self):
         # unbind whatever program is currently bound - not necessarily this
@@ -147,6 +174,15 @@ class Shader(object):
         glUseProgram(0)
         activeshader = None
 
+    def invalidate_textures(self):
+        """Forget which textures are bound.
+
+        Call this if textures may have been bound by other code while this
+        shader was bound.
+
+        """
+        self.bound_textures.clear()
+
     UNIFORMFS = [
         None,
         glUniform1f,
@@ -168,18 +204,26 @@ class Shader(object):
         loc = self.locations[name] = glGetUniformLocation(self.handle, name)
         return loc
 
+    def getAttribLocation(self, name):
+        if name in self.attrib_locations:
+            return self.attrib_locations[name]
+        loc = self.attrib_locations[name] = glGetAttribLocation(self.handle, name)
+        return loc
+
     def uniformf(self, name, *vals):
         """Upload a floating point uniform
 
         This program must be currently bound.
         """
         assert len(vals) in range(1, 5)
-        f = self.UNIFORMFS[len(vals)]
         if name not in self.locations:
             self.locations[name] = loc = glGetUniformLocation(self.handle, name)
         else:
             loc = self.locations[name]
-        f(loc, *vals)
+        if self.values.get(loc) == vals:
+            return
+        self.values[loc] = vals
+        self.UNIFORMFS[len(vals)](loc, *vals)
 
     def uniformi(self, name, *vals):
         """Upload an integer uniform
@@ -187,92 +231,165 @@ class Shader(object):
         This program must be currently bound.
         """
         assert len(vals) in range(1, 5)
-        f = self.UNIFORMIS[len(vals)]
         if name not in self.locations:
             self.locations[name] = loc = glGetUniformLocation(self.handle, name)
         else:
             loc = self.locations[name]
-        f(loc, *vals)
+        if self.values.get(loc) == vals:
+            return
+        self.values[loc] = vals
+        self.UNIFORMIS[len(vals)](loc, *vals)
 
     # upload a uniform matrix
     # works with matrices stored as lists,
     # as well as euclid matrices
     def uniform_matrixf(self, name, mat):
-        # obtian the uniform location
-        loc = selg.getUniformLocation(name)
-        # uplaod the 4x4 floating point matrix
-        glUniformMatrix4fv(loc, 1, False, (c_float * 16)(*mat))
+        self._upload_array(name, glUniformMatrix4fv, 16, tuple(mat), False)
+
+    def _upload_array(self, name, func, width, values, *args):
+        """Upload a flat sequence of floats to a uniform array.
+
+        The ctypes array used for the upload is kept and reused. Nothing is
+        uploaded if the values are unchanged since the last upload.
+
+        """
+        loc = self.getUniformLocation(name)
+        if self.values.get(loc) == values:
+            return
+        self.values[loc] = values
+        l = len(values)
+        arr = self.arrays.get(loc)
+        if arr is None or len(arr) < l:
+            arr = self.arrays[loc] = (c_float * l)()
+        arr[:l] = values
+        func(loc, l // width, *(args + (arr,)))
+
+    def active_uniforms(self):
+        """Get a dict mapping the names of this program's uniforms to their
+        GL types.
+
+        Arrays are named without a subscript.
+
+        """
+        try:
+            return self._active_uniforms
+        except AttributeError:
+            pass
+        count = c_int(0)
+        glGetProgramiv(self.handle, GL_ACTIVE_UNIFORMS, byref(count))
+        uniforms = {}
+        for i in xrange(count.value):
+            name, size, type_ = glGetActiveUniform(self.handle, i)
+            uniforms[name.split('[')[0]] = int(type_)
+        self._active_uniforms = uniforms
+        return uniforms
+
+    def copy_uniforms(self, source):
+        """Upload the uniform values last set on source to this program.
+
+        This lets a variant of a shader, such as one with extra vertex
+        attributes, be bound in its place partway through drawing. This
+        program must be currently bound.
+
+        """
+        types = self.active_uniforms()
+        for name, loc in source.locations.iteritems():
+            values = source.values.get(loc)
+            type_ = types.get(name)
+            if values is None or type_ is None:
+                continue
+            upload = UNIFORM_UPLOADS.get(type_)
+            if upload is None:
+                continue
+            func, width, cast = upload
+            if func is glUniformMatrix4fv:
+                self._upload_array(name, func, width, values, False)
+            elif cast is float:
+                self._upload_array(name, func, width, values)
+            else:
+                dest = self.getUniformLocation(name)
+                if self.values.get(dest) != values:
+                    self.values[dest] = values
+                    func(dest, len(values) // width,
+                         (c_int * len(values))(*values))
 
     def uniform1fv(self, name, values):
         """Pass an array of values"""
-        if name not in self.locations:
-            self.locations[name] = loc = glGetUniformLocation(self.handle, name)
-        else:
-            loc = self.locations[name]
-        l = len(values)
-        arr = (c_float * l)(*values)
-        glUniform1fv(loc, l, arr)
+        self._upload_array(name, glUniform1fv, 1, tuple(values))
 
     def uniform2fv(self, name, values):
         """Pass an array of values"""
-        if name not in self.locations:
-            self.locations[name] = loc = glGetUniformLocation(self.handle, name)
-        else:
-            loc = self.locations[name]
-        arr = (c_float * (len(values) * 2))(*(f for v in values for f in v))
-        glUniform2fv(loc, len(values), arr)
+        self._upload_array(name, glUniform2fv, 2, tuple(chain(*values)))
 
     def uniform3fv(self, name, values):
         """Pass an array of values"""
-        if name not in self.locations:
-            self.locations[name] = loc = glGetUniformLocation(self.handle, name)
-        else:
-            loc = self.locations[name]
-        arr = (c_float * (len(values) * 3))(*(f for v in values for f in v))
-        glUniform3fv(loc, len(values), arr)
+        self._upload_array(name, glUniform3fv, 3, tuple(chain(*values)))
 
     def uniform4fv(self, name, values):
         """Pass an array of values"""
-        if name not in self.locations:
-            self.locations[name] = loc = glGetUniformLocation(self.handle, name)
-        else:
-            loc = self.locations[name]
-        l = len(values)
-        arr = (c_float * (l * 4))(*(f for v in values for f in v))
-        glUniform4fv(loc, l, arr)
+        self._upload_array(name, glUniform4fv, 4, tuple(chain(*values)))
 
-    def set_material(self, material):
-        """Read uniform properties from the given material."""
+    def pack_material(self, material):
+        """Work out the uniform values and textures for a material.
+
+        Returns a list of (uniform, type, values) tuples and a list of
+        (uniform, texture unit, texture id) tuples.
+
+        """
+        uniforms = []
         for matprop, (uniform, type_) in self.uniform_bindings.iteritems():
             try:
                 value = material[matprop]
             except KeyError:
                 continue
-            else:
-                if type_ is int:
-                    if isinstance(value, numbers.Number):
-                        self.uniformi(uniform, int(value))
-                    else:
-                        self.uniformi(uniform, *(int(v) for v in value))
-                else:
-                    if isinstance(value, numbers.Number):
-                        self.uniformf(uniform, value)
-                    else:
-                        self.uniformf(uniform, *value)
+            if isinstance(value, numbers.Number):
+                value = (value,)
+            uniforms.append((uniform, type_, tuple(type_(v) for v in value)))
 
+        textures = []
         texid = self.reserved_textures
         for mat_property, uniform in self.texture_bindings.iteritems():
             try:
                 value = material.get_texture(mat_property)
             except KeyError:
                 value = get_white_texture()
-            self.bind_texture(uniform, texid, value.id)
+            textures.append((uniform, texid, value.id))
             texid += 1
+        return uniforms, textures
+
+    def set_material(self, material):
+        """Read uniform properties from the given material.
+
+        The packed values are cached on Material objects; uniforms and
+        textures that already have the right values are not uploaded again.
+
+        """
+        cache = getattr(material, 'packed', None)
+        try:
+            uniforms, textures = cache[self.handle]
+        except (TypeError, KeyError):
+            uniforms, textures = self.pack_material(material)
+            if cache is not None:
+                cache[self.handle] = uniforms, textures
+        else:
+            # Keep the textures we are drawing with from being evicted
+            material.touch_textures()
+
+        for uniform, type_, values in uniforms:
+            if type_ is int:
+                self.uniformi(uniform, *values)
+            else:
+                self.uniformf(uniform, *values)
+
+        for uniform, unit, id in textures:
+            self.bind_texture(uniform, unit, id)
 
     def bind_texture(self, uniform, unit, id):
         """Bind a texture id to the uniform 'uniform', using texture unit unit"""
-        glActiveTexture(GL_TEXTURE0 + unit)
-        glBindTexture(GL_TEXTURE_2D, id)
+        if self.bound_textures.get(unit) != id:
+            glActiveTexture(GL_TEXTURE0 + unit)
+            glBindTexture(GL_TEXTURE_2D, id)
+            self.bound_textures[unit] = id
         self.uniformi(uniform, unit)
 
     def unset_material(self, material):
@@ -0,0 +1,494 @@
+"""Skeletal animation, skinned in the vertex shader.
+
+Rather than storing a copy of a mesh for every frame, a
+:py:class:`SkinnedModel` stores the mesh once, with each vertex attached to up
+to four joints of a :py:class:`Skeleton` with weights. An animation
+:py:class:`Clip` is a set of keyframed rotations and translations for each
+joint, which costs a few kilobytes per clip.
+
+Each frame, the pose of every skinned model in the scene is sampled from its
+clip, and the joint transformations are accumulated down the skeleton into a
+palette of matrices. This is done for all instances of a skeleton at once
+with NumPy, by :py:func:`pose_instances`. The vertices are then transformed
+by the palette in the vertex shader. The palette needs many uniforms, so
+the lighting shaders of the built-in renderers each have a separate
+skinned_variant, which is bound just while a skinned mesh is drawn. With
+shaders that have no such variant, or where it fails to link, the vertices
+are skinned with NumPy instead::
+
+    robot = SkinnedModel(skeleton, meshes, clips={'walk': walk})
+    node = ModelNode(robot)
+    node.model_instance.play('walk')
+    scene.add(node)
+
+Quaternions are given as (x, y, z, w), and matrices are row-major 4x4 NumPy
+arrays that transform column vectors.
+
+"""
+from ctypes import c_void_p
+
+import numpy as np
+from OpenGL.GL import *
+
+from . import shader as shadermod
+from .shader import MaterialGroup
+from .model import ArrayMesh
+from .meshbuffer import MeshBuffer
+from .bounds import union_bounds
+
+
+#: The maximum number of joints in a skeleton that can be skinned on the GPU.
+#: Each joint takes three vec4 uniforms in the skinning shaders.
+MAX_JOINTS = 48
+
+#: The maximum number of joints that may influence a vertex
+JOINTS_PER_VERTEX = 4
+
+SKIN_DTYPE = np.dtype([
+    ('joints', np.uint8, JOINTS_PER_VERTEX),
+    ('weights', np.float32, JOINTS_PER_VERTEX),
+])
+
+
+def quaternion_matrices(q):
+    """Convert an array of unit quaternions (..., 4) to matrices (..., 4, 4)."""
+    q = np.asarray(q, dtype=np.float64)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    m = np.zeros(q.shape[:-1] + (4, 4))
+    m[..., 0, 0] = 1 - 2 * (y * y + z * z)
+    m[..., 0, 1] = 2 * (x * y - z * w)
+    m[..., 0, 2] = 2 * (x * z + y * w)
+    m[..., 1, 0] = 2 * (x * y + z * w)
+    m[..., 1, 1] = 1 - 2 * (x * x + z * z)
+    m[..., 1, 2] = 2 * (y * z - x * w)
+    m[..., 2, 0] = 2 * (x * z - y * w)
+    m[..., 2, 1] = 2 * (y * z + x * w)
+    m[..., 2, 2] = 1 - 2 * (x * x + y * y)
+    m[..., 3, 3] = 1
+    return m
+
+
+def nlerp(a, b, f):
+    """Interpolate between arrays of quaternions by normalised lerp.
+
+    f must broadcast against the quaternions without their last axis.
+
+    """
+    # Take the shorter way round
+    sign = np.where((a * b).sum(axis=-1) < 0, -1.0, 1.0)[..., np.newaxis]
+    f = np.asarray(f)[..., np.newaxis]
+    q = a + (b * sign - a) * f
+    return q / np.sqrt((q * q).sum(axis=-1))[..., np.newaxis]
+
+
+def joint_rows(palette):
+    """Pack a palette of joint matrices for the skinning shader.
+
+    The bottom row of each matrix is always (0, 0, 0, 1), so only the top
+    three rows are passed. Return a float32 array (3 * J, 4).
+
+    """
+    palette = np.asarray(palette)
+    return np.ascontiguousarray(
+        palette[:, :3, :], dtype=np.float32
+    ).reshape(-1, 4)
+
+
+class Skeleton(object):
+    """A hierarchy of joints.
+
+    :param parents: The index of the parent of each joint, or -1 for root
+                    joints. Each joint must come after its parent.
+    :param inverse_bind: An array (J, 4, 4) of matrices transforming from
+                         model space into the space of each joint in the
+                         pose the mesh was modelled in. By default these
+                         are identity matrices.
+    :param names: Optional names for the joints.
+
+    """
+    def __init__(self, parents, inverse_bind=None, names=None):
+        self.parents = np.asarray(parents, dtype=np.int32)
+        for i, p in enumerate(self.parents):
+            if p >= i:
+                raise ValueError("Joint %d comes before its parent" % i)
+        n = len(self.parents)
+        if inverse_bind is None:
+            inverse_bind = np.tile(np.identity(4), (n, 1, 1))
+        self.inverse_bind = np.asarray(inverse_bind, dtype=np.float64)
+        self.names = names
+
+        # Group the joints by depth, so that each level of the hierarchy
+        # can be posed at once
+        depth = np.zeros(n, dtype=np.int32)
+        for i, p in enumerate(self.parents):
+            if p >= 0:
+                depth[i] = depth[p] + 1
+        self.levels = [
+            np.nonzero(depth == d)[0] for d in xrange(depth.max() + 1)
+        ] if n else []
+
+    def __len__(self):
+        return len(self.parents)
+
+    def pose(self, local):
+        """Accumulate local joint transforms (N, J, 4, 4) down the skeleton.
+
+        Return the model space transform of each joint, for N poses at once.
+
+        """
+        world = np.empty_like(local)
+        roots = self.levels[0]
+        world[:, roots] = local[:, roots]
+        for level in self.levels[1:]:
+            world[:, level] = np.einsum(
+                'njab,njbc->njac',
+                world[:, self.parents[level]], local[:, level]
+            )
+        return world
+
+    def palettes(self, local):
+        """Get the skinning matrices for N poses of local joint transforms."""
+        return np.einsum('njab,jbc->njac', self.pose(local), self.inverse_bind)
+
+
+class Clip(object):
+    """A keyframed animation of the joints of a skeleton.
+
+    :param times: The times in seconds of the K keyframes, ascending.
+    :param rotations: An array (K, J, 4) of joint rotations as quaternions.
+    :param translations: An array (K, J, 3) of joint translations.
+    :param loop: If True, the clip repeats when it reaches the end.
+
+    """
+    def __init__(self, name, times, rotations, translations, loop=True):
+        self.name = name
+        self.times = np.asarray(times, dtype=np.float64)
+        self.rotations = np.asarray(rotations, dtype=np.float32)
+        self.translations = np.asarray(translations, dtype=np.float32)
+        self.loop = loop
+        if not len(self.times):
+            raise ValueError("A clip needs at least one keyframe")
+
+    @property
+    def duration(self):
+        return float(self.times[-1])
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the keyframes."""
+        return (
+            self.times.nbytes + self.rotations.nbytes +
+            self.translations.nbytes
+        )
+
+    def sample(self, t):
+        """Get the local joint transforms at an array of N times.
+
+        Return an array (N, J, 4, 4).
+
+        """
+        t = np.asarray(t, dtype=np.float64)
+        times = self.times
+        if len(times) == 1:
+            i = np.zeros(len(t), dtype=np.int32)
+            j = i
+            f = np.zeros(len(t))
+        else:
+            i = np.clip(
+                np.searchsorted(times, t, side='right') - 1,
+                0, len(times) - 2
+            )
+            j = i + 1
+            f = np.clip((t - times[i]) / (times[j] - times[i]), 0, 1)
+        rot = nlerp(
+            self.rotations[i], self.rotations[j], f[:, np.newaxis]
+        )
+        ta = self.translations[i]
+        trans = ta + (self.translations[j] - ta) * f[:, np.newaxis, np.newaxis]
+        local = quaternion_matrices(rot)
+        local[..., :3, 3] = trans
+        return local
+
+
+class SkinnedMesh(object):
+    """A mesh whose vertices are attached to the joints of a skeleton.
+
+    :param mesh: The mesh in its bind pose.
+    :param joints: An array (n, 4) of the indices of the joints influencing
+                   each vertex.
+    :param weights: An array (n, 4) of the weight of each joint. The weights
+                    of each vertex are normalised to sum to 1.
+
+    """
+    def __init__(self, mesh, joints, weights):
+        if not isinstance(mesh, ArrayMesh):
+            mesh = ArrayMesh.from_mesh(mesh)
+        self.mesh = mesh
+        self.skin = np.zeros(len(mesh.data), dtype=SKIN_DTYPE)
+        self.skin['joints'] = joints
+        weights = np.asarray(weights, dtype=np.float32)
+        totals = weights.sum(axis=1)
+        totals[totals == 0] = 1
+        self.skin['weights'] = weights / totals[:, np.newaxis]
+        self.buffer = None
+
+    @property
+    def material(self):
+        return self.mesh.material
+
+    def get_bounds(self):
+        return self.mesh.get_bounds()
+
+    def skin_vertices(self, palette):
+        """Skin the vertices on the CPU.
+
+        Return a copy of the mesh data with the vertices posed by the
+        palette of joint matrices.
+
+        """
+        m = np.einsum(
+            'nk,nkij->nij',
+            self.skin['weights'], palette[self.skin['joints']]
+        )
+        data = self.mesh.data.copy()
+        linear = m[:, :3, :3]
+        p = self.mesh.data['position']
+        n = self.mesh.data['normal']
+        data['position'] = np.einsum('nij,nj->ni', linear, p) + m[:, :3, 3]
+        n = np.einsum('nij,nj->ni', linear, n)
+        lengths = np.sqrt((n * n).sum(axis=1))
+        lengths[lengths == 0] = 1
+        data['normal'] = n / lengths[:, np.newaxis]
+        return data
+
+    def upload(self):
+        """Upload the mesh and its joint weights to buffers."""
+        self.material.load_textures()
+        self.group = MaterialGroup(self.material)
+        self.buffer = MeshBuffer(self.mesh.data, self.mesh.indices)
+        self.skin_vbo, self.stream_vbo = (int(b) for b in glGenBuffers(2))
+        glBindBuffer(GL_ARRAY_BUFFER, self.skin_vbo)
+        raw = self.skin.view(np.uint8)
+        glBufferData(GL_ARRAY_BUFFER, raw.nbytes, raw, GL_STATIC_DRAW)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    @staticmethod
+    def skinning_shader(shader):
+        """Get the variant of shader that skins vertices.
+
+        Return the variant and its attribute locations for joints and
+        weights, or None if shader has no usable skinned variant.
+
+        """
+        variant = getattr(shader, 'skinned_variant', None)
+        if variant is None or not variant.linked:
+            return None
+        locs = (
+            variant.getAttribLocation('joint_indices'),
+            variant.getAttribLocation('joint_weights'),
+        )
+        if min(locs) < 0 or variant.getUniformLocation('joints') < 0:
+            return None
+        return variant, locs
+
+    def draw(self, palette):
+        """Draw the mesh posed by a palette of joint matrices."""
+        if self.buffer is None:
+            self.upload()
+        buf = self.buffer
+        shader = shadermod.activeshader
+        skinning = None
+        if len(palette) <= MAX_JOINTS:
+            skinning = self.skinning_shader(shader)
+        if skinning:
+            # Draw with the skinned variant, in the state set up for shader
+            variant, (indices_loc, weights_loc) = skinning
+            variant.bind()
+            variant.copy_uniforms(shader)
+
+        self.group.set_state_recursive()
+        if skinning:
+            buf.bind()
+            glBindBuffer(GL_ARRAY_BUFFER, self.skin_vbo)
+            stride = SKIN_DTYPE.itemsize
+            glEnableVertexAttribArray(indices_loc)
+            glVertexAttribPointer(
+                indices_loc, JOINTS_PER_VERTEX, GL_UNSIGNED_BYTE, GL_FALSE,
+                stride, c_void_p(SKIN_DTYPE.fields['joints'][1])
+            )
+            glEnableVertexAttribArray(weights_loc)
+            glVertexAttribPointer(
+                weights_loc, JOINTS_PER_VERTEX, GL_FLOAT, GL_FALSE,
+                stride, c_void_p(SKIN_DTYPE.fields['weights'][1])
+            )
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            rows = joint_rows(palette)
+            glUniform4fv(variant.getUniformLocation('joints'), len(rows), rows)
+            glDrawElements(
+                self.mesh.mode, buf.count, buf.index_type, c_void_p(0)
+            )
+            glDisableVertexAttribArray(indices_loc)
+            glDisableVertexAttribArray(weights_loc)
+            buf.unbind()
+        else:
+            # Skin on the CPU, into a separate buffer so that the bind pose
+            # is still available to shaders that support skinning
+            data = self.skin_vertices(palette)
+            stride = buf.stride
+            offsets = buf.offsets
+            glPushClientAttrib(GL_CLIENT_VERTEX_ARRAY_BIT)
+            glBindBuffer(GL_ARRAY_BUFFER, self.stream_vbo)
+            raw = data.view(np.uint8)
+            glBufferData(GL_ARRAY_BUFFER, raw.nbytes, raw, GL_STREAM_DRAW)
+            glEnableClientState(GL_VERTEX_ARRAY)
+            glVertexPointer(
+                3, GL_FLOAT, stride, c_void_p(offsets['position'])
+            )
+            glEnableClientState(GL_NORMAL_ARRAY)
+            glNormalPointer(GL_FLOAT, stride, c_void_p(offsets['normal']))
+            glEnableClientState(GL_TEXTURE_COORD_ARRAY)
+            glTexCoordPointer(
+                2, GL_FLOAT, stride, c_void_p(offsets['texcoord'])
+            )
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, buf.ibo)
+            glDrawElements(
+                self.mesh.mode, buf.count, buf.index_type, c_void_p(0)
+            )
+            glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, 0)
+            glBindBuffer(GL_ARRAY_BUFFER, 0)
+            glPopClientAttrib()
+        self.group.unset_state_recursive()
+        if skinning:
+            shader.bind()
+
+    def delete(self):
+        """Free the buffers."""
+        if self.buffer is not None:
+            self.buffer.delete()
+            glDeleteBuffers(2, [self.skin_vbo, self.stream_vbo])
+            self.buffer = None
+
+
+class SkinnedModel(object):
+    """A set of skinned meshes sharing a skeleton, and its animation clips.
+
+    :param clips: A dict mapping names to Clips.
+    :param default: The name of the clip to play initially, if any.
+    :param next: A dict mapping the names of clips that do not loop to the
+                 names of clips to play after them.
+    :param bounds_margin: Poses may move the mesh outside its bounds in the
+                          bind pose; the bounds are expanded by this much
+                          so that models are not culled while visible.
+
+    """
+    def __init__(self, skeleton, meshes, clips={}, default=None, next={},
+                 bounds_margin=0.0):
+        self.skeleton = skeleton
+        self.meshes = meshes
+        self.clips = clips
+        self.default = default
+        self.next = next
+        self.bounds_margin = bounds_margin
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the animation clips."""
+        return sum(c.nbytes for c in self.clips.values())
+
+    def get_bounds(self):
+        try:
+            return self._bounds
+        except AttributeError:
+            bounds = union_bounds(m.get_bounds() for m in self.meshes)
+            if bounds is not None and self.bounds_margin:
+                bounds = bounds.expanded(self.bounds_margin)
+            self._bounds = bounds
+            return bounds
+
+    def get_instance(self):
+        return SkinnedModelInstance(self)
+
+
+class SkinnedModelInstance(object):
+    """Track the current time in a SkinnedModel's animation.
+
+    The palette of joint matrices is computed when it is needed, unless it
+    has already been computed for many instances at once by
+    :py:func:`pose_instances`.
+
+    """
+    def __init__(self, model):
+        self.model = model
+        self.clip = None
+        self.playing = None
+        self.t = 0.0
+        self._palette = None
+        if model.default:
+            self.play(model.default)
+
+    def play(self, name):
+        """Start playing the named clip."""
+        self.clip = self.model.clips[name]
+        self.playing = name
+        self.t = 0.0
+        self._palette = None
+
+    def update(self, dt):
+        clip = self.clip
+        if clip is None:
+            return
+        self.t += dt
+        self._palette = None
+        if self.t < clip.duration:
+            return
+        next = self.model.next.get(self.playing)
+        if next is not None:
+            over = self.t - clip.duration
+            self.play(next)
+            self.t = over
+        elif clip.loop and clip.duration > 0:
+            self.t %= clip.duration
+        else:
+            self.t = clip.duration
+
+    def palette(self):
+        """Get the skinning matrices for the current pose."""
+        if self._palette is None:
+            self._palette = pose_palette(self.model, self.clip, [self.t])[0]
+        return self._palette
+
+    def get_bounds(self):
+        return self.model.get_bounds()
+
+    def draw(self):
+        palette = self.palette()
+        for mesh in self.model.meshes:
+            mesh.draw(palette)
+
+
+def pose_palette(model, clip, times):
+    """Get the palettes of a model posed at an array of times in a clip."""
+    skeleton = model.skeleton
+    if clip is None:
+        # With no clip the mesh is drawn in its bind pose
+        return np.tile(np.identity(4), (len(times), len(skeleton), 1, 1))
+    return skeleton.palettes(clip.sample(times))
+
+
+def pose_instances(instances):
+    """Compute the palettes of many SkinnedModelInstances at once.
+
+    Instances playing the same clip of the same model are posed together.
+
+    """
+    groups = {}
+    for inst in instances:
+        if inst._palette is None:
+            key = (inst.model, inst.playing)
+            groups.setdefault(key, []).append(inst)
+    for (model, playing), insts in groups.iteritems():
+        palettes = pose_palette(
+            model, insts[0].clip, [i.t for i in insts]
+        )
+        for inst, palette in zip(insts, palettes):
+            inst._palette = palette
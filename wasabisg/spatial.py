@@ -0,0 +1,285 @@
+"""A spatial index over scene nodes.
+
+A Scene can optionally maintain a :py:class:`LooseOctree` of its nodes so
+that visibility and proximity queries do not need to test every node.
+
+Nodes are stored in the index by their bounding boxes. Nodes that move notify
+the index (see :py:meth:`LooseOctree.node_moved`), and the index is refitted
+lazily, before the next query.
+
+"""
+
+
+def _ray_box(origin, inv_dir, bmin, bmax):
+    """Return the distance along a ray at which it enters a box, or None.
+
+    inv_dir is the reciprocal of the ray's direction vector, with None for
+    components that are zero.
+
+    """
+    tmin = 0.0
+    tmax = float('inf')
+    for o, inv, lo, hi in zip(origin, inv_dir, bmin, bmax):
+        if inv is None:
+            if o < lo or o > hi:
+                return None
+            continue
+        t1 = (lo - o) * inv
+        t2 = (hi - o) * inv
+        if t1 > t2:
+            t1, t2 = t2, t1
+        if t1 > tmin:
+            tmin = t1
+        if t2 < tmax:
+            tmax = t2
+        if tmin > tmax:
+            return None
+    return tmin
+
+
+def _sphere_box(center, r2, bmin, bmax):
+    """Return True if a sphere (with radius squared r2) intersects a box."""
+    d = 0.0
+    for c, lo, hi in zip(center, bmin, bmax):
+        if c < lo:
+            d += (lo - c) ** 2
+        elif c > hi:
+            d += (c - hi) ** 2
+    return d <= r2
+
+
+class _Cell(object):
+    """A cell of the octree.
+
+    The loose bounds of a cell are twice the size of the cell itself, so that
+    a node can be stored in the smallest cell that contains its center, as
+    long as the node is no bigger than the cell.
+
+    """
+    __slots__ = (
+        'parent', 'center', 'half', 'children', 'nodes', 'count',
+        'loose_min', 'loose_max'
+    )
+
+    def __init__(self, parent, center, half):
+        self.parent = parent
+        self.center = center
+        self.half = half
+        self.children = None
+        self.nodes = {}
+        self.count = 0
+        loose = 2.0 * half
+        self.loose_min = tuple(c - loose for c in center)
+        self.loose_max = tuple(c + loose for c in center)
+
+    def contains(self, p):
+        """Return True if p is within the (tight) bounds of this cell."""
+        h = self.half
+        for a, c in zip(p, self.center):
+            if a < c - h or a > c + h:
+                return False
+        return True
+
+    def child(self, p):
+        """Get the child cell whose bounds contain p, creating it if needed."""
+        cx, cy, cz = self.center
+        x, y, z = p
+        i = (x >= cx) | (y >= cy) << 1 | (z >= cz) << 2
+        if self.children is None:
+            self.children = [None] * 8
+        c = self.children[i]
+        if c is None:
+            q = 0.5 * self.half
+            c = self.children[i] = _Cell(self, (
+                cx + (q if x >= cx else -q),
+                cy + (q if y >= cy else -q),
+                cz + (q if z >= cz else -q),
+            ), q)
+        return c
+
+
+class LooseOctree(object):
+    """A loose octree of scene nodes.
+
+    Nodes must have a get_bounds() method returning a
+    :py:class:`~wasabisg.bounds.BoundingBox` in world space.
+
+    Adding, removing and moving a node costs O(log n); queries visit only the
+    cells that overlap the query volume.
+
+    :param size: The width of the region that is subdivided. Nodes outside
+                 this region can still be indexed, but are always tested
+                 individually by queries.
+    :param center: The center of the subdivided region.
+    :param max_depth: The maximum number of times the region is subdivided.
+
+    """
+    def __init__(self, size=1024.0, center=(0, 0, 0), max_depth=8):
+        self.root = _Cell(None, tuple(float(c) for c in center), 0.5 * size)
+        self.max_depth = max_depth
+        self.entries = {}
+        self.dirty = set()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, node):
+        return node in self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def add(self, node):
+        """Add node to the index.
+
+        If the node cannot report its bounds it is not added, and False is
+        returned.
+
+        """
+        if node in self.entries:
+            return True
+        bounds = node.get_bounds()
+        if bounds is None:
+            return False
+        self._insert(node, bounds)
+        watch = getattr(node, 'watch', None)
+        if watch:
+            watch(self)
+        return True
+
+    def remove(self, node):
+        """Remove node from the index, if present."""
+        if node not in self.entries:
+            return
+        self._remove(node)
+        self.dirty.discard(node)
+        unwatch = getattr(node, 'unwatch', None)
+        if unwatch:
+            unwatch(self)
+
+    def clear(self):
+        """Remove all nodes from the index."""
+        for node in list(self.entries):
+            self.remove(node)
+
+    def node_moved(self, node):
+        """Notify the index that node's bounds may have changed."""
+        if node in self.entries:
+            self.dirty.add(node)
+
+    def refit(self):
+        """Move any nodes whose bounds have changed to the correct cells."""
+        while self.dirty:
+            node = self.dirty.pop()
+            self._remove(node)
+            bounds = node.get_bounds()
+            if bounds is not None:
+                self._insert(node, bounds)
+
+    def _insert(self, node, bounds):
+        center = bounds.center
+        size = max(bounds.extents)
+        cell = self.root
+        if cell.contains(center):
+            depth = 0
+            while depth < self.max_depth and size <= 0.5 * cell.half:
+                cell = cell.child(center)
+                depth += 1
+        cell.nodes[node] = bounds
+        self.entries[node] = cell
+        while cell:
+            cell.count += 1
+            cell = cell.parent
+
+    def _remove(self, node):
+        cell = self.entries.pop(node)
+        del cell.nodes[node]
+        while cell:
+            cell.count -= 1
+            if not cell.count:
+                # Discard empty subtrees
+                cell.children = None
+            cell = cell.parent
+
+    def _cells(self, overlaps):
+        """Iterate over non-empty cells for which overlaps(cell) is True.
+
+        The root cell is always included, because it also holds any nodes
+        that lie outside the subdivided region.
+
+        """
+        stack = [self.root]
+        while stack:
+            cell = stack.pop()
+            if not cell.count:
+                continue
+            if cell is not self.root and not overlaps(cell):
+                continue
+            yield cell
+            if cell.children:
+                stack.extend(c for c in cell.children if c)
+
+    def query_frustum(self, frustum):
+        """Get a list of the nodes that intersect a Frustum."""
+        self.refit()
+        intersects = frustum.intersects_box
+        planes = frustum.planes
+
+        def overlaps(cell):
+            (x1, y1, z1), (x2, y2, z2) = cell.loose_min, cell.loose_max
+            for nx, ny, nz, d in planes:
+                px = x2 if nx >= 0 else x1
+                py = y2 if ny >= 0 else y1
+                pz = z2 if nz >= 0 else z1
+                if nx * px + ny * py + nz * pz + d < 0:
+                    return False
+            return True
+
+        found = []
+        for cell in self._cells(overlaps):
+            for node, bounds in cell.nodes.iteritems():
+                if intersects(bounds):
+                    found.append(node)
+        return found
+
+    def query_sphere(self, center, radius):
+        """Get a list of the nodes whose bounds intersect a sphere."""
+        self.refit()
+        center = tuple(center)[:3]
+        r2 = radius * radius
+
+        def overlaps(cell):
+            return _sphere_box(center, r2, cell.loose_min, cell.loose_max)
+
+        found = []
+        for cell in self._cells(overlaps):
+            for node, bounds in cell.nodes.iteritems():
+                if _sphere_box(center, r2, bounds.min, bounds.max):
+                    found.append(node)
+        return found
+
+    def query_ray(self, origin, direction, max_distance=None):
+        """Get the nodes whose bounds are hit by a ray.
+
+        Returns a list of (distance, node) tuples sorted by distance along the
+        ray, where distance is measured in units of the length of direction.
+
+        """
+        self.refit()
+        origin = tuple(origin)[:3]
+        inv_dir = tuple(1.0 / d if d else None for d in tuple(direction)[:3])
+        if max_distance is None:
+            max_distance = float('inf')
+
+        def overlaps(cell):
+            t = _ray_box(origin, inv_dir, cell.loose_min, cell.loose_max)
+            return t is not None and t <= max_distance
+
+        found = []
+        for cell in self._cells(overlaps):
+            for node, bounds in cell.nodes.iteritems():
+                t = _ray_box(origin, inv_dir, bounds.min, bounds.max)
+                if t is not None and t <= max_distance:
+                    found.append((t, node))
+        found.sort(key=lambda hit: hit[0])
+        return found
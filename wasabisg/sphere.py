@@ -1,15 +1,61 @@
 import math
-from .model import Mesh, Material
+import numpy as np
+from .model import ArrayMesh, Material, GeometryCache, VERTEX_DTYPE, index_dtype
 from OpenGL.GL import GL_TRIANGLES
 
 
-class Sphere(Mesh):
+# Spheres with the same parameters share their vertex and index arrays
+geometry_cache = GeometryCache()
+
+
+def sphere_geometry(radius, inside, latitude_divisions, longitude_divisions):
+    """Build the vertex and index arrays of a UV sphere."""
+    # angle of latitude, where 0 is the north pole and pi is south
+    lat = np.arange(latitude_divisions + 1)
+    theta = lat * math.pi / latitude_divisions
+    lng = np.arange(longitude_divisions + 1)
+    phi = lng * 2 * math.pi / longitude_divisions
+    sintheta = np.sin(theta)[:, np.newaxis]
+    costheta = np.cos(theta)[:, np.newaxis]
+
+    normals = np.empty((lat.size, lng.size, 3))
+    normals[..., 0] = np.cos(phi) * sintheta
+    normals[..., 1] = costheta
+    normals[..., 2] = np.sin(phi) * sintheta
+
+    uv = np.empty((lat.size, lng.size, 2))
+    uv[..., 0] = 1 - lng / float(longitude_divisions)
+    uv[..., 1] = (1 - lat / float(latitude_divisions))[:, np.newaxis]
+
+    data = np.zeros(lat.size * lng.size, dtype=VERTEX_DTYPE)
+    data['normal'] = normals.reshape(-1, 3)
+    data['position'] = normals.reshape(-1, 3) * radius
+    data['texcoord'] = uv.reshape(-1, 2)
+
+    i = (
+        lat[:-1, np.newaxis] * (longitude_divisions + 1) + lng[:-1]
+    ).ravel()
+    j = i + longitude_divisions + 1
+    tris = np.column_stack([i + 1, j, i, i + 1, j + 1, j]).reshape(-1, 3)
+
+    if inside:
+        data['normal'] *= -1
+        tris = tris[:, ::-1]
+    indices = np.ascontiguousarray(tris, dtype=index_dtype(len(data)))
+    return data, indices.ravel()
+
+
+class Sphere(ArrayMesh):
     """Construct a Mesh that is a 3D UV sphere.
 
     If `inside` is given then the normals and vertex winding will be reversed
     such that the camera will render the inside of the sphere rather than the
     outside. This is useful for skydomes etc.
 
+    Spheres with the same radius, divisions and inside flag share their
+    vertex and index arrays, and their vertex buffers once prepared; only
+    their materials differ.
+
     """
 
     def __init__(
@@ -25,64 +71,18 @@ class Sphere(Mesh):
         self.latitude_divisions = latitude_divisions
         self.longitude_divisions = longitude_divisions
 
-        vs = []
-        ns = []
-        uvs = []
-        tangents = []
-
-        for lat in xrange(latitude_divisions + 1):
-            # angle of latitude, where 0 is the north pole and pi is south
-            theta = lat * math.pi / latitude_divisions
-            sintheta = math.sin(theta)
-            costheta = math.cos(theta)
-
-            for lng in xrange(longitude_divisions + 1):
-                phi = lng * 2 * math.pi / longitude_divisions
-                sinphi = math.sin(phi)
-                cosphi = math.cos(phi)
-
-                x = cosphi * sintheta
-                y = costheta
-                z = sinphi * sintheta
-
-                u = 1 - (float(lng) / longitude_divisions)
-                v = 1 - (float(lat) / latitude_divisions)
-
-                ns.extend([x, y, z])
-                uvs.extend([u, v])
-                vs.extend([x * radius, y * radius, z * radius])
-                tangents.extend([-sinphi, 0, cosphi])
-
-        indexes = []
-        for lat in xrange(latitude_divisions):
-            for lng in xrange(longitude_divisions):
-                i = lat * (longitude_divisions + 1) + lng
-                j = i + longitude_divisions + 1
-
-                indexes.extend([
-                    i + 1,
-                    j,
-                    i,
-                    i + 1,
-                    j + 1,
-                    j,
-                ])
-
+        params = (radius, bool(inside), latitude_divisions, longitude_divisions)
+        self.geometry = geometry_cache.get(
+            params, lambda: sphere_geometry(*params)
+        )
         super(Sphere, self).__init__(
             GL_TRIANGLES,
-            vertices=vs,
-            normals=ns,
-            texcoords=uvs,
-            indices=indexes,
+            data=self.geometry.data,
+            indices=self.geometry.indices,
             material=material,
             name=repr(self)
         )
 
-        if inside:
-            flipped = self.inside_out()
-            self.normals = flipped.normals
-            self.indices = flipped.indices
-
     def __repr__(self):
         return (
             'Sphere('
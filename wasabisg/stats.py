@@ -0,0 +1,48 @@
+"""Counters for measuring how much work goes into rendering a frame."""
+
+
+class RenderStats(object):
+    """Counters describing the work done to render the most recent frame.
+
+    A Scene resets its stats at the start of each call to render(), so after
+    rendering these give the figures for that frame.
+
+    :ivar drawn: The number of scene nodes that were passed to the renderer.
+    :ivar culled: The number of scene nodes that were skipped because they
+                  were outside the camera's view.
+    :ivar draw_calls: The number of mesh draw calls issued.
+    :ivar instanced_nodes: The number of nodes that were drawn with
+                           instancing rather than individually.
+    :ivar shader_binds: The number of times a shader program was bound.
+    :ivar texture_binds: The number of times the material texture changed
+                         between consecutive draws.
+    :ivar material_uploads: The number of times material properties were
+                            uploaded to a shader.
+
+    """
+    counters = (
+        'drawn',
+        'culled',
+        'draw_calls',
+        'instanced_nodes',
+        'shader_binds',
+        'texture_binds',
+        'material_uploads',
+    )
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Set all counters back to zero."""
+        for c in self.counters:
+            setattr(self, c, 0)
+
+    def as_dict(self):
+        """Get the counters as a dictionary."""
+        return dict((c, getattr(self, c)) for c in self.counters)
+
+    def __repr__(self):
+        return '<RenderStats %s>' % ' '.join(
+            '%s=%d' % (c, getattr(self, c)) for c in self.counters
+        )
@@ -0,0 +1,216 @@
+"""Load models in the background while the scene continues to render.
+
+Loading a model synchronously stalls the frame in which it is loaded. A
+:py:class:`StreamingLoader` instead parses models, and decodes their
+textures, in background threads; it returns a :py:class:`PendingModel`
+immediately, which can be added to a scene straight away and draws a
+placeholder (or nothing) until the model is ready.
+
+Uploading the model to the GPU must happen on the thread that owns the GL
+context, so it is done when :py:meth:`StreamingLoader.update` is called,
+typically once per frame. Only as many models are uploaded in each call as
+fit in a time budget, so that streaming in new content does not cause frames
+to be dropped::
+
+    streamer = StreamingLoader(scene)
+    scene.add(streamer.load_obj('chunk12.obj', placeholder=cube))
+    pyglet.clock.schedule(streamer.update)
+
+If a model fails to load, the error is logged when
+:py:meth:`StreamingLoader.update` is next called, and the PendingModel keeps
+drawing its placeholder.
+
+"""
+import sys
+import time
+import logging
+import threading
+from Queue import Queue
+from collections import deque
+
+from .loaders.objloader import ObjFileLoader
+
+
+log = logging.getLogger(__name__)
+
+
+class PendingModel(object):
+    """A model that is being loaded in the background.
+
+    Until the model has been loaded, this stands in for it, drawing the
+    placeholder model if one was given. Once loaded it delegates to the
+    loaded model.
+
+    Objects can watch a PendingModel to be notified when it is loaded;
+    watchers must have a model_loaded(model) method. Watchers are also
+    notified if loading fails, in which case the error attribute holds the
+    exception.
+
+    """
+    watchers = ()
+
+    def __init__(self, name, placeholder=None):
+        self.name = name
+        self.placeholder = placeholder
+        self.current = placeholder
+        self.model = None
+        self.error = None
+
+    @property
+    def loaded(self):
+        """True once the model has been loaded and prepared."""
+        return self.model is not None
+
+    @property
+    def meshes(self):
+        return getattr(self.current, 'meshes', None)
+
+    def watch(self, watcher):
+        """Call watcher.model_loaded(self) when the model is loaded."""
+        if not self.watchers:
+            self.watchers = []
+        self.watchers.append(watcher)
+
+    def unwatch(self, watcher):
+        """Stop notifying watcher when the model is loaded."""
+        if watcher in self.watchers:
+            self.watchers.remove(watcher)
+
+    def complete(self, model):
+        """Replace the placeholder with the loaded, prepared model."""
+        self.model = model
+        self.current = model.get_instance()
+        for w in self.watchers:
+            w.model_loaded(self)
+
+    def fail(self, error):
+        """Record that the model could not be loaded."""
+        self.error = error
+        for w in self.watchers:
+            w.model_loaded(self)
+
+    def get_instance(self):
+        return self
+
+    def get_bounds(self):
+        get_bounds = getattr(self.current, 'get_bounds', None)
+        return get_bounds and get_bounds()
+
+    def update(self, dt):
+        if self.current is not None:
+            self.current.update(dt)
+
+    def draw(self):
+        if self.current is not None:
+            self.current.draw()
+
+    def __repr__(self):
+        return '<PendingModel %s%s>' % (
+            self.name, '' if self.loaded else ' (loading)'
+        )
+
+
+class StreamingLoader(object):
+    """Load models in background threads and prepare them incrementally.
+
+    :param scene: The Scene whose renderer will prepare the models.
+    :param loader: The ObjFileLoader to load models with. By default a
+                   compact loader is used.
+    :param budget: The time in seconds that each call to update() may spend
+                   preparing models. At least one model is prepared per call
+                   if any are ready, however long it takes.
+    :param threads: The number of background threads to start.
+
+    """
+    def __init__(self, scene, loader=None, budget=0.004, threads=1):
+        self.scene = scene
+        self.loader = loader or ObjFileLoader(compact=True)
+        self.budget = budget
+        self.requests = Queue()
+        self.ready = deque()
+        self.failed = deque()
+        # ObjFileLoader is not thread-safe
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in xrange(threads):
+            t = threading.Thread(target=self._work, name='StreamingLoader')
+            t.daemon = True
+            t.start()
+            self.threads.append(t)
+
+    def load_obj(self, filename, placeholder=None, swapyz=False):
+        """Start loading a Wavefront OBJ file.
+
+        :param placeholder: A Model to draw until the file has loaded.
+
+        Return a PendingModel, which can be added to the scene immediately.
+
+        """
+        if placeholder is not None:
+            placeholder = self.scene.prepare_model(placeholder)
+        pending = PendingModel(filename, placeholder)
+        self.requests.put((pending, filename, swapyz))
+        return pending
+
+    def _work(self):
+        while True:
+            pending, filename, swapyz = self.requests.get()
+            try:
+                with self.lock:
+                    model = self.loader.load_obj(filename, swapyz)
+                images = self.decode_textures(model)
+            except Exception as e:
+                self.failed.append((pending, e, sys.exc_info()))
+            else:
+                self.ready.append((pending, model, images))
+            self.requests.task_done()
+
+    def decode_textures(self, model):
+        """Decode the images for a model's textures, without uploading them.
+
+        The images must be kept alive until the model is prepared, so that
+        they are still in the texture loader's cache.
+
+        """
+        images = []
+        for mesh in model.meshes:
+            mtl = mesh.material
+            for k in mtl.keys():
+                if k.startswith('map_'):
+                    images.append(mtl.loader.load_image(mtl[k]))
+        return images
+
+    def report_failures(self):
+        """Log the errors of models that failed to load, and notify them."""
+        while self.failed:
+            pending, error, exc_info = self.failed.popleft()
+            log.error('Failed to load %s', pending.name, exc_info=exc_info)
+            pending.fail(error)
+
+    def update(self, dt=None):
+        """Prepare the models that have been loaded, within the budget.
+
+        This must be called on the thread that owns the OpenGL context.
+        The signature allows it to be scheduled with pyglet.clock.
+
+        Return the number of models prepared.
+
+        """
+        self.report_failures()
+        deadline = time.time() + self.budget
+        count = 0
+        while self.ready:
+            if count and time.time() >= deadline:
+                break
+            pending, model, images = self.ready.popleft()
+            pending.complete(self.scene.prepare_model(model))
+            count += 1
+        return count
+
+    def finish(self):
+        """Block until all requested models are loaded and prepared."""
+        self.requests.join()
+        self.report_failures()
+        while self.ready:
+            pending, model, images = self.ready.popleft()
+            pending.complete(self.scene.prepare_model(model))
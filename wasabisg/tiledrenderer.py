@@ -0,0 +1,337 @@
+"""A forward renderer that draws each object once, whatever the number of lights.
+
+Before drawing, lights are binned on the CPU into square tiles of the screen
+(see :py:mod:`wasabisg.lightbinning`). The light data and the per-tile light
+lists are uploaded as float textures, and the fragment shader loops over just
+the lights that overlap the tile containing each fragment.
+
+"""
+import numpy as np
+from OpenGL.GL import *
+from OpenGL.GL.ARB.texture_rg import GL_R32F, GL_RG32F, GL_RG
+
+from .shader import Shader
+from .lighting import BaseLight
+from .renderqueue import RenderQueue
+from .renderer import (
+    LightingPass, LightingAccumulationRenderer, RenderPass, Instancer,
+    LIGHTING_VERT, INSTANCED_LIGHTING_VERT, SKINNED_LIGHTING_VERT,
+    bind_lighting_material
+)
+from .lightbinning import light_screen_rects, bin_lights
+
+
+#: The width in texels of the textures used to pass light data to shaders.
+#: Longer arrays are wrapped onto several rows.
+TEXTURE_ROW = 1024
+
+TILED_LIGHTING_FRAG = """#version 130
+
+varying vec3 normal;
+varying vec3 pos;
+varying vec2 uv;
+
+// Each light is 2 texels: (view space position, w) and (colour, falloff)
+uniform sampler2D light_data;
+// Each tile is (offset, count) into light_indices
+uniform sampler2D light_tiles;
+uniform sampler2D light_indices;
+uniform int tile_size;
+uniform int tiles_x;
+uniform vec2 viewport_origin;
+
+uniform sampler2D diffuse_tex;
+uniform vec3 diffuse_colour;
+uniform vec4 specular;
+uniform vec4 ambient;
+uniform float dissolve;
+uniform float specular_exponent;
+uniform float transmit;
+uniform int illum;
+
+const int ROW = %(row)d;
+
+vec4 fetch(in sampler2D tex, in int i) {
+    return texelFetch(tex, ivec2(i %% ROW, i / ROW), 0);
+}
+
+vec3 calc_light(in vec3 frag_normal, in int lnum, in vec3 diffuse) {
+    vec4 light = fetch(light_data, 2 * lnum);
+    vec4 props = fetch(light_data, 2 * lnum + 1);
+    float intensity = 1.0;
+
+    vec3 lightvec;
+
+    if (light.w > 0.0) {
+        lightvec = light.xyz - pos;
+
+        // Use quadratic attenuation
+        float lengthsq = dot(lightvec, lightvec);
+        intensity /= 1.0 + lengthsq * props.a;
+
+        lightvec = normalize(lightvec);
+    } else {
+        lightvec = light.xyz;
+    }
+
+    float diffuse_component = dot(
+        frag_normal, lightvec
+    );
+    diffuse_component = max(0.0, diffuse_component) - transmit * min(0.0, diffuse_component);
+
+    float specular_component = 0.0;
+    if (diffuse_component > 0.0) {
+        vec3 rlight = reflect(lightvec, frag_normal);
+        vec3 eye = normalize(pos);
+        specular_component = pow(max(0.0, dot(eye, rlight)), specular_exponent);
+    }
+
+    return intensity * props.rgb * (
+        diffuse_component * diffuse +
+        specular_component * specular.rgb
+    );
+}
+
+void main (void) {
+    vec3 n = normalize(normal);
+    vec3 colour = vec3(0, 0, 0);
+    vec4 mapcolour = texture2D(diffuse_tex, uv);
+    vec3 basecolour = mapcolour.rgb * diffuse_colour;
+
+    if (illum == 0) {
+        colour = basecolour;
+    } else {
+        colour += basecolour * ambient.rgb;
+
+        ivec2 tile = ivec2(gl_FragCoord.xy - viewport_origin) / tile_size;
+        vec4 t = fetch(light_tiles, tile.y * tiles_x + tile.x);
+        int offset = int(t.r);
+        int count = int(t.g);
+        for (int i = 0; i < count; i++) {
+            int lnum = int(fetch(light_indices, offset + i).r);
+            colour += calc_light(n, lnum, basecolour);
+        }
+    }
+    gl_FragColor = vec4(colour.xyz, mapcolour.a * dissolve);
+}
+""" % {'row': TEXTURE_ROW}
+
+
+tiled_lighting_shader = Shader(
+    vert='#version 130\n' + LIGHTING_VERT,
+    frag=TILED_LIGHTING_FRAG,
+    reserved_textures=3,
+    name='tiled lighting'
+)
+bind_lighting_material(tiled_lighting_shader)
+
+tiled_lighting_shader.skinned_variant = Shader(
+    vert='#version 130\n' + SKINNED_LIGHTING_VERT,
+    frag=TILED_LIGHTING_FRAG,
+    reserved_textures=3,
+    name='skinned tiled lighting'
+)
+bind_lighting_material(tiled_lighting_shader.skinned_variant)
+
+instanced_tiled_lighting_shader = Shader(
+    vert='#version 130\n' + INSTANCED_LIGHTING_VERT,
+    frag=TILED_LIGHTING_FRAG,
+    reserved_textures=3,
+    name='instanced tiled lighting'
+)
+bind_lighting_material(instanced_tiled_lighting_shader)
+
+
+class DataTexture(object):
+    """A float texture used to pass an array of values to a shader.
+
+    Element i of the array is stored in texel (i % TEXTURE_ROW,
+    i / TEXTURE_ROW).
+
+    """
+    FORMATS = {
+        1: (GL_R32F, GL_RED),
+        2: (GL_RG32F, GL_RG),
+        4: (GL_RGBA32F, GL_RGBA),
+    }
+
+    def __init__(self, channels):
+        self.channels = channels
+        self.id = None
+
+    def upload(self, data):
+        """Upload an array of shape (n, channels) to the texture."""
+        channels = self.channels
+        data = np.asarray(data, dtype=np.float32).reshape(-1, channels)
+        rows = max(1, -(-len(data) // TEXTURE_ROW))
+        buf = np.zeros((rows * TEXTURE_ROW, channels), dtype=np.float32)
+        buf[:len(data)] = data
+
+        if self.id is None:
+            self.id = glGenTextures(1)
+        internal, fmt = self.FORMATS[channels]
+        glBindTexture(GL_TEXTURE_2D, self.id)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(
+            GL_TEXTURE_2D, 0, internal,
+            TEXTURE_ROW, rows,
+            0,
+            fmt, GL_FLOAT,
+            buf.tostring()
+        )
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+    def __del__(self):
+        if self.id is not None:
+            glDeleteTextures([self.id])
+            self.id = None
+
+
+class TiledLightingPass(LightingPass):
+    """Draw opaque objects in a single pass, lit by any number of lights.
+
+    Objects with a custom shader expect the 8-lights-per-pass uniforms of the
+    accumulation renderer, so they are still drawn that way.
+
+    :param tile_size: The width and height of the screen tiles in pixels.
+
+    """
+    def __init__(self, ambient=(0, 0, 0, 1), instancing=True, tile_size=16):
+        super(TiledLightingPass, self).__init__(ambient, instancing)
+        self.tile_size = tile_size
+        self.light_texture = DataTexture(4)
+        self.light_tiles = DataTexture(2)
+        self.light_indices = DataTexture(1)
+        if self.instancer:
+            self.instancer = Instancer(shader=instanced_tiled_lighting_shader)
+
+    def render(self, camera, objects):
+        lights = [o for o in objects if isinstance(o, BaseLight)]
+        self.prepare_lights(camera, lights)
+        glPushAttrib(GL_ALL_ATTRIB_BITS)
+        glClear(GL_DEPTH_BUFFER_BIT)
+
+        standard_objects = []
+        shader_objects = []
+        for o in objects:
+            if o.is_transparent():
+                continue
+            if hasattr(o, 'shader'):
+                shader_objects.append(o)
+            else:
+                standard_objects.append(o)
+
+        if standard_objects:
+            x, y, width, height = glGetIntegerv(GL_VIEWPORT)
+            grid = self.upload_lights(camera, lights, (width, height))
+            if self.instancer:
+                self.instancer.stats = self.stats
+                standard_objects, batches = self.instancer.batch(
+                    standard_objects
+                )
+            else:
+                batches = []
+            self.draw_tiled(
+                camera, standard_objects, tiled_lighting_shader,
+                grid, (x, y)
+            )
+            if batches:
+                self.draw_tiled(
+                    camera, batches, self.instancer.shader, grid, (x, y)
+                )
+
+        for ls, objs in self.assign_lights(lights, shader_objects):
+            for o in objs:
+                self.render_objects(camera, ls, [o], shader=o.shader)
+
+        glPopAttrib()
+
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LEQUAL)
+
+    def upload_lights(self, camera, lights, viewport):
+        """Bin lights into screen tiles and upload the results.
+
+        Returns the number of tiles in the x and y directions.
+
+        """
+        positions, colours, intensities, falloffs, radii = \
+            self.light_data(lights)
+        data = np.empty((len(lights), 2, 4))
+        data[:, 0] = positions
+        data[:, 1, :3] = colours[:, :3] * intensities[:, np.newaxis]
+        data[:, 1, 3] = falloffs
+
+        projection = camera.get_projection_array()
+        rects, visible = light_screen_rects(
+            positions[:, :3], radii, projection, camera.near, camera.far
+        )
+        visible &= radii > 0
+        tiles, indices, grid = bin_lights(
+            rects, visible, viewport, self.tile_size
+        )
+
+        self.light_texture.upload(data.reshape(-1, 4))
+        self.light_tiles.upload(tiles)
+        self.light_indices.upload(indices)
+        return grid
+
+    def draw_tiled(self, camera, objects, shader, grid, origin):
+        """Draw objects with a tiled lighting shader."""
+        glEnable(GL_DEPTH_TEST)
+        glDepthFunc(GL_LEQUAL)
+        glBlendFunc(GL_SRC_ALPHA, GL_ZERO)
+
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+
+        # Write depth with the same offset as the accumulation renderer, so
+        # that transparent objects are depth tested in the same way
+        glEnable(GL_POLYGON_OFFSET_FILL)
+        glPolygonOffset(0.01, 1)
+        glDepthMask(GL_TRUE)
+
+        queue = RenderQueue(objects, stats=self.stats)
+        shader.bind()
+        self.stats.shader_binds += 1
+        shader.uniformf('ambient', *self.ambient)
+        shader.bind_texture('light_data', 0, self.light_texture.id)
+        shader.bind_texture('light_tiles', 1, self.light_tiles.id)
+        shader.bind_texture('light_indices', 2, self.light_indices.id)
+        shader.uniformi('tile_size', self.tile_size)
+        shader.uniformi('tiles_x', grid[0])
+        shader.uniformf('viewport_origin', *origin)
+        queue.submit(camera)
+        shader.unbind()
+        glActiveTexture(GL_TEXTURE0)
+        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+
+class TiledForwardRenderer(LightingAccumulationRenderer):
+    """Render with per-pixel lighting, drawing each opaque object once.
+
+    Lights are binned into screen tiles on the CPU, so the cost of each
+    fragment depends on the number of lights that overlap its tile rather
+    than the number of lights in the scene. Requires OpenGL 3.0.
+
+    Use it by passing it to the Scene::
+
+        scene = Scene(renderer=TiledForwardRenderer())
+
+    :param tile_size: The width and height of the screen tiles in pixels.
+
+    """
+    def __init__(self, instancing=True, tile_size=16):
+        super(TiledForwardRenderer, self).__init__(instancing=instancing)
+        self.lighting = TiledLightingPass(
+            instancing=instancing, tile_size=tile_size
+        )
+        self.passes = [
+            self.lighting,
+            RenderPass(
+                transparency=True
+            )
+        ]
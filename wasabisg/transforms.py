@@ -0,0 +1,112 @@
+"""Store the world matrices of many scene nodes in one NumPy array.
+
+Each :py:class:`~wasabisg.scenegraph.TransformNode` caches its local and
+world matrices, and discards them only when it or one of its ancestors moves.
+A :py:class:`TransformArray` additionally keeps the world matrix of each node
+added to it in a row of a single array, in the column-major order OpenGL
+expects, so that the matrices of many nodes can be uploaded at once, eg. for
+instancing. Only the rows of nodes that have moved are recomputed.
+
+A :py:class:`~wasabisg.scenegraph.Scene` keeps the nodes added to it in its
+own TransformArray.
+
+"""
+import numpy as np
+
+
+class TransformArray(object):
+    """The world matrices of a set of nodes, stored as a NumPy array.
+
+    Nodes must have a get_world_matrix() method returning a euclid.Matrix4,
+    and transforms and slot attributes, which are set while the node is in
+    the array. A node marks itself dirty when it moves, by calling
+    node_moved() on its transforms.
+
+    :ivar matrices: An (n, 16) float32 array; each row holds the world matrix
+                    of one node in column-major order.
+    :param capacity: The number of nodes to allocate space for initially;
+                     the array grows as needed.
+
+    """
+    def __init__(self, nodes=(), capacity=64):
+        self.matrices = np.zeros((capacity, 16), dtype=np.float32)
+        self.nodes = []
+        self.free = []
+        self.dirty = set()
+        for n in nodes:
+            self.add(n)
+
+    def __len__(self):
+        return len(self.nodes) - len(self.free)
+
+    def __contains__(self, node):
+        return node.transforms is self
+
+    def _grow(self):
+        """Double the size of the matrix array."""
+        grown = np.zeros((2 * len(self.matrices), 16), dtype=np.float32)
+        grown[:len(self.matrices)] = self.matrices
+        self.matrices = grown
+
+    def add(self, node):
+        """Add a node to the array."""
+        if node.transforms is self:
+            return
+        if node.transforms is not None:
+            node.transforms.remove(node)
+        if self.free:
+            slot = self.free.pop()
+            self.nodes[slot] = node
+        else:
+            slot = len(self.nodes)
+            if slot == len(self.matrices):
+                self._grow()
+            self.nodes.append(node)
+        node.transforms = self
+        node.slot = slot
+        self.dirty.add(node)
+
+    def remove(self, node):
+        """Remove a node from the array."""
+        if node.transforms is not self:
+            return
+        self.dirty.discard(node)
+        self.nodes[node.slot] = None
+        self.free.append(node.slot)
+        node.transforms = node.slot = None
+
+    def clear(self):
+        """Remove all nodes."""
+        for node in self.nodes:
+            if node is not None:
+                node.transforms = node.slot = None
+        del self.nodes[:]
+        del self.free[:]
+        self.dirty.clear()
+
+    def node_moved(self, node):
+        """The world matrix of node has changed."""
+        self.dirty.add(node)
+
+    def update(self):
+        """Recompute the rows of any nodes that have moved."""
+        matrices = self.matrices
+        while self.dirty:
+            node = self.dirty.pop()
+            matrices[node.slot] = node.get_world_matrix()[:]
+
+    def index(self, nodes):
+        """Get an array of the row numbers of nodes, with their rows current.
+
+        Nodes that are not in this array are added.
+
+        """
+        for n in nodes:
+            if n.transforms is not self:
+                self.add(n)
+        self.update()
+        return np.array([n.slot for n in nodes], dtype=np.intp)
+
+    def get(self, nodes):
+        """Get the world matrices of nodes as a contiguous (n, 16) array."""
+        return self.matrices[self.index(nodes)]